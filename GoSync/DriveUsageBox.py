@@ -136,6 +136,10 @@ class DriveUsageBox(wx.Panel):
         p = math.floor(math.log(size, 2)/10)
         return "%.3f%s" % (size/math.pow(1024,p),units[long(p)])
 
+    def SetDriveSize(self, drive_size_bytes):
+        # The usages have to be set again to be drawn at the new scale
+        self.drive_size_bytes = drive_size_bytes
+
     def SetStatusMessage(self, msg):
         self.t1.SetLabel(msg)
 
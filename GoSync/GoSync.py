@@ -35,7 +35,8 @@ def main():
     os.chdir(APP_PATH)
 #    app = wx.PySimpleApp() : Deprecated
     app = wx.App(False)
-    controller = GoSyncController()
+    # --startup-timing prints how long each startup phase took
+    controller = GoSyncController(startup_timing='--startup-timing' in sys.argv[1:])
     controller.Center()
     controller.Show()
     app.MainLoop()
@@ -0,0 +1,162 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time, errno, socket, threading
+import httplib2
+
+PROBE_HOST = ('www.googleapis.com', 443)
+PROBE_TIMEOUT = 5
+
+# How long the answer of a probe or a request is believed
+REACHABILITY_TTL = 30
+
+# While offline, probes are spaced out like this
+PROBE_BACKOFF_BASE = 1.0
+PROBE_BACKOFF_CAP = 60.0
+
+NETWORK_ERRNOS = (errno.ENETDOWN, errno.ENETUNREACH, errno.EHOSTUNREACH,
+                  errno.ECONNREFUSED, errno.ECONNRESET, errno.ETIMEDOUT)
+
+def IsNetworkError(error):
+    """True for errors which say the network is gone rather than the request was bad."""
+    if isinstance(error, (httplib2.ServerNotFoundError, socket.gaierror, socket.timeout,
+                          ConnectionError)):
+        return True
+    return isinstance(error, (OSError, IOError)) and getattr(error, 'errno', None) in NETWORK_ERRNOS
+
+
+def ProbeHost(host=PROBE_HOST, timeout=PROBE_TIMEOUT):
+    """Opens a TCP connection to host. Cheaper than fetching a page."""
+    try:
+        socket.create_connection(host, timeout).close()
+        return True
+    except (socket.error, socket.timeout, OSError):
+        return False
+
+
+class ConnectivityMonitor(object):
+    """
+    Whether the drive can be reached. Requests report how they went
+    (ReportSuccess, ReportFailure), so most of the time nobody has to
+    ask the network. Only when that answer is older than ttl, or after a
+    request failed on the network, is the drive probed. While offline,
+    probes back off exponentially. WaitOnline() blocks until the
+    network is back, without each caller polling on its own.
+
+    on_change(online) is called whenever the state flips.
+    """
+    def __init__(self, probe=ProbeHost, on_change=None, ttl=REACHABILITY_TTL):
+        self.probe = probe
+        self.on_change = on_change
+        self.ttl = ttl
+        self.cond = threading.Condition()
+        self.online = True
+        self.checked_at = 0
+        self.next_probe = 0
+        self.failures = 0
+        self.probing = False
+        self.stats = {'probes': 0, 'went_offline': 0}
+
+    def GetStats(self):
+        with self.cond:
+            return dict(self.stats)
+
+    def __SetState(self, online):
+        # Called with self.cond held
+        changed = online != self.online
+        self.online = online
+        self.checked_at = time.time()
+        if online:
+            self.failures = 0
+            self.next_probe = 0
+            self.cond.notify_all()
+        elif changed:
+            self.stats['went_offline'] += 1
+        return changed
+
+    def __Changed(self, online):
+        if self.on_change:
+            self.on_change(online)
+
+    def ReportSuccess(self):
+        with self.cond:
+            if self.online and time.time() - self.checked_at < 1:
+                return
+            changed = self.__SetState(True)
+        if changed:
+            self.__Changed(True)
+
+    def ReportFailure(self, error=None):
+        """A request failed. Only network errors make us look again."""
+        if error is not None and not IsNetworkError(error):
+            return
+        with self.cond:
+            # Make the next IsOnline() probe right away
+            self.checked_at = 0
+            self.next_probe = 0
+
+    def __Probe(self):
+        with self.cond:
+            if self.probing:
+                return self.online
+            self.probing = True
+            self.stats['probes'] += 1
+
+        try:
+            online = bool(self.probe())
+        finally:
+            with self.cond:
+                self.probing = False
+
+        with self.cond:
+            changed = self.__SetState(online)
+            if not online:
+                self.failures += 1
+                self.next_probe = time.time() + min(PROBE_BACKOFF_CAP,
+                                                    PROBE_BACKOFF_BASE * (2 ** (self.failures - 1)))
+        if changed:
+            self.__Changed(online)
+        return online
+
+    def IsOnline(self):
+        with self.cond:
+            now = time.time()
+            if self.online and now - self.checked_at < self.ttl:
+                return True
+            if not self.online and now < self.next_probe:
+                return False
+        return self.__Probe()
+
+    def WaitOnline(self, should_stop=None):
+        """
+        Blocks until the drive is reachable. Returns False if
+        should_stop() says to give up first. Wake() makes waiters look
+        at should_stop() again.
+        """
+        while True:
+            if should_stop and should_stop():
+                return False
+            if self.IsOnline():
+                return True
+            with self.cond:
+                delay = max(0.1, self.next_probe - time.time())
+                self.cond.wait(delay)
+
+    def Wake(self):
+        with self.cond:
+            self.cond.notify_all()
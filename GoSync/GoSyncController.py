@@ -28,14 +28,14 @@ except (ImportError, ValueError):
 import sys, os, wx, ntpath, threading, math, webbrowser
 from threading import Timer
 try :
-	from .GoSyncModel import GoSyncModel, ClientSecretsNotFound
+	from .GoSyncModel import GoSyncModel, ClientSecretsNotFound, AuthenticationFailed
 	from .defines import *
 	from .DriveUsageBox import DriveUsageBox
 	from .GoSyncEvents import *
 	from .GoSyncSelectionPage import SelectionPage
 	from .GoSyncSettingPage import SettingsPage
 except (ImportError, ValueError):
-	from GoSyncModel import GoSyncModel, ClientSecretsNotFound
+	from GoSyncModel import GoSyncModel, ClientSecretsNotFound, AuthenticationFailed
 	from defines import *
 	from DriveUsageBox import DriveUsageBox
 	from GoSyncEvents import *
@@ -49,6 +49,23 @@ ID_RECALC_USAGE = wx.NewId()
 mainWindowStyle = wx.DEFAULT_FRAME_STYLE & (~wx.CLOSE_BOX) & (~wx.MAXIMIZE_BOX) ^ (wx.RESIZE_BORDER)
 HERE=os.path.abspath(os.path.dirname(__file__))
 
+class DialogPrompts(object):
+    """Answers the questions GoSyncModel asks while starting up."""
+    def AskChooseCredentialsFile(self):
+        dial = wx.MessageDialog(None, 'No Credentials file was found!\n\nDo you want to load one?\n',
+                                'Error', wx.YES_NO | wx.ICON_EXCLAMATION)
+        return dial.ShowModal() == wx.ID_YES
+
+    def AskCredentialFile(self):
+        dlg = wx.FileDialog(None,
+               'Load Credential File',
+                 '~', 'Credentials.json',
+                 'json files (*.json)|*.json',
+                 wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
+        if dlg.ShowModal() == wx.ID_CANCEL:
+            return None
+        return dlg.GetPath()
+
 class PageAccount(wx.Panel):
     def __init__(self, parent, sync_model):
         wx.Panel.__init__(self, parent, size=parent.GetSize(), style=wx.RAISED_BORDER)
@@ -59,13 +76,18 @@ class PageAccount(wx.Panel):
 
         aboutdrive = sync_model.DriveInfo()
         self.driveUsageBar = DriveUsageBox(self, long(aboutdrive['storageQuota']['limit']), -1)
-        self.driveUsageBar.SetStatusMessage("Calculating your categorical Google Drive usage. Please wait.")
-        self.driveUsageBar.SetMoviesUsage(0)
-        self.driveUsageBar.SetDocumentUsage(0)
-        self.driveUsageBar.SetOthersUsage(0)
-        self.driveUsageBar.SetAudioUsage(0)
-        self.driveUsageBar.SetPhotoUsage(0)
-        self.driveUsageBar.RePaint()
+        if sync_model.HasSavedDriveUsage():
+            # What the last run calculated, until the usage thread is done
+            self.driveUsageBar.SetStatusMessage("Your Google Drive usage is shown below:")
+            self.ShowUsage()
+        else:
+            self.driveUsageBar.SetStatusMessage("Calculating your categorical Google Drive usage. Please wait.")
+            self.driveUsageBar.SetMoviesUsage(0)
+            self.driveUsageBar.SetDocumentUsage(0)
+            self.driveUsageBar.SetOthersUsage(0)
+            self.driveUsageBar.SetAudioUsage(0)
+            self.driveUsageBar.SetPhotoUsage(0)
+            self.driveUsageBar.RePaint()
 
 
         mainsizer = wx.BoxSizer(wx.VERTICAL)
@@ -78,6 +100,20 @@ class PageAccount(wx.Panel):
                                           self.OnUsageCalculationDone)
         GoSyncEventController().BindEvent(self, GOSYNC_EVENT_CALCULATE_USAGE_UPDATE,
                                           self.OnUsageCalculationUpdate)
+        GoSyncEventController().BindEvent(self, GOSYNC_EVENT_ACCOUNT_UPDATE,
+                                          self.OnAccountUpdate)
+
+    def ShowUsage(self):
+        self.driveUsageBar.SetMoviesUsage(self.sync_model.GetMovieUsage())
+        self.driveUsageBar.SetDocumentUsage(self.sync_model.GetDocumentUsage())
+        self.driveUsageBar.SetOthersUsage(self.sync_model.GetOthersUsage())
+        self.driveUsageBar.SetAudioUsage(self.sync_model.GetAudioUsage())
+        self.driveUsageBar.SetPhotoUsage(self.sync_model.GetPhotoUsage())
+        self.driveUsageBar.RePaint()
+
+    def OnAccountUpdate(self, event):
+        self.driveUsageBar.SetDriveSize(long(event.data['storageQuota']['limit']))
+        self.ShowUsage()
 
     def OnUsageCalculationDone(self, event):
         if not event.data:
@@ -106,11 +142,12 @@ class PageAccount(wx.Panel):
         self.driveUsageBar.SetStatusMessage("Calculating your categorical Google Drive usage. Please wait.")
 
 class GoSyncController(wx.Frame):
-    def __init__(self):
+    def __init__(self, startup_timing=False):
+        self.startup_timing = startup_timing
         wx.Frame.__init__(self, None, title="GoSync", size=(490,500), style=mainWindowStyle)
 
         try:
-            self.sync_model = GoSyncModel()
+            self.sync_model = GoSyncModel(DialogPrompts())
         except ClientSecretsNotFound:
             dial = wx.MessageDialog(None, 'Credentials file was not found!\n\nDo you want to know how to create one?\n',
                                     'Error', wx.YES_NO | wx.ICON_EXCLAMATION)
@@ -119,6 +156,11 @@ class GoSyncController(wx.Frame):
             if res == wx.ID_YES:
                 webbrowser.open(CLIENT_SECRET_HELP_SITE, new=1, autoraise=True)
 
+            sys.exit(1)
+        except AuthenticationFailed:
+            dial = wx.MessageDialog(None, "Authentication Rejected!\n",
+                                    'Information', wx.OK | wx.ICON_EXCLAMATION)
+            dial.ShowModal()
             sys.exit(1)
         except:
             dial = wx.MessageDialog(None, 'GoSync failed to initialize\n',
@@ -126,16 +168,10 @@ class GoSyncController(wx.Frame):
             res = dial.ShowModal()
             sys.exit(1)
 
+        # Cached by the last run, refreshed once GoSync has logged in
         self.aboutdrive = self.sync_model.DriveInfo()
         self.Bind(wx.EVT_CLOSE, self.OnExit)
-
-        title_string = "GoSync - %s (%s used of %s)" % (self.aboutdrive['user']['displayName'],
-
-
-	    self.FileSizeHumanize(long(self.aboutdrive['storageQuota']['usageInDrive'])),
-
-	    self.FileSizeHumanize(long(self.aboutdrive['storageQuota']['limit'])))
-        self.SetTitle(title_string)
+        self.SetAccountTitle()
         appIcon = wx.Icon(APP_ICON, wx.BITMAP_TYPE_PNG)
         self.SetIcon(appIcon)
         menuBar = wx.MenuBar()
@@ -201,6 +237,12 @@ class GoSyncController(wx.Frame):
                                           self.OnInternetDown)
         GoSyncEventController().BindEvent(self, GOSYNC_EVENT_SYNC_INV_FOLDER,
                                           self.OnSyncInvalidFolder)
+        GoSyncEventController().BindEvent(self, GOSYNC_EVENT_SYNC_ERROR,
+                                          self.OnSyncError)
+        GoSyncEventController().BindEvent(self, GOSYNC_EVENT_ACCOUNT_UPDATE,
+                                          self.OnAccountUpdate)
+        GoSyncEventController().BindEvent(self, GOSYNC_EVENT_READY,
+                                          self.OnReady)
         GoSyncEventController().BindEvent(self, GOSYNC_EVENT_SCAN_UPDATE,
                                           self.OnScanUpdate)
         GoSyncEventController().BindEvent(self, GOSYNC_EVENT_CALCULATE_USAGE_DONE,
@@ -208,8 +250,37 @@ class GoSyncController(wx.Frame):
         GoSyncEventController().BindEvent(self, GOSYNC_EVENT_CALCULATE_USAGE_STARTED,
                                           self.OnUsageCalculationStarted)
 
+        self.sb.SetStatusText("Starting...")
+        self.sync_model.MarkStartupPhase('window')
         self.sync_model.SetTheBallRolling()
 
+    def SetAccountTitle(self):
+        title_string = "GoSync - %s (%s used of %s)" % (self.aboutdrive['user']['displayName'],
+
+
+	    self.FileSizeHumanize(long(self.aboutdrive['storageQuota']['usageInDrive'])),
+
+	    self.FileSizeHumanize(long(self.aboutdrive['storageQuota']['limit'])))
+        self.SetTitle(title_string)
+
+    def OnAccountUpdate(self, event):
+        self.aboutdrive = event.data
+        self.SetAccountTitle()
+
+    def OnReady(self, event):
+        if event.data:
+            # What went wrong is shown by OnSyncError
+            self.sb.SetStatusText("GoSync failed to start")
+            return
+
+        self.sb.SetStatusText("")
+        if self.sync_model.IsSyncEnabled():
+            self.sb.SetStatusText("Running", 1)
+            self.pr_item.SetItemLabel("Pause Sync")
+
+        if self.startup_timing:
+            sys.stderr.write(self.sync_model.FormatStartupTimes())
+
     def OnUsageCalculationStarted(self, event):
         self.pr_item.Enable(False)
         self.sync_now_mitem.Enable(False)
@@ -260,6 +331,11 @@ class GoSyncController(wx.Frame):
                 nmsg.SetFlags(wx.ICON_ERROR)
                 nmsg.Show(timeout=wx.NotificationMessage.Timeout_Auto)
 
+    def OnSyncError(self, event):
+        dial = wx.MessageDialog(None, event.data['message'], event.data['title'],
+                                wx.OK | wx.ICON_EXCLAMATION)
+        dial.ShowModal()
+
     def OnRecalculateDriveUsage(self, event):
         if self.sync_model.IsCalculatingDriveUsage() == True:
             dial = wx.MessageDialog(None, 'GoSync is already scaningfiles on drive.',
@@ -312,7 +388,12 @@ class GoSyncController(wx.Frame):
                     nmsg = wx.NotificationMessage("GoSync", "Sync Completed!")
                     nmsg.SetFlags(wx.ICON_INFORMATION)
                     nmsg.Show(timeout=wx.NotificationMessage.Timeout_Auto)
-            self.sb.SetStatusText("Sync completed.")
+            stats = self.sync_model.GetRequestStats()
+            if stats['retried'] or stats['throttled']:
+                self.sb.SetStatusText("Sync completed. (%d requests, %d retried, %d throttled)"
+                                      % (stats['requests'], stats['retried'], stats['throttled']))
+            else:
+                self.sb.SetStatusText("Sync completed.")
         else:
             if self.sync_model.GetUseSystemNotifSetting():
                 if wxgtk4:
@@ -0,0 +1,148 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# GoSync without a window: runs the sync loop of GoSyncModel until
+# killed, or for a single sync with --once. wx is never imported.
+#
+# The account, the mirror and what to sync come from ~/.gosync as set
+# up by the GUI. On a machine without one, copy credentials.json into
+# ~/.gosync; the first start prints the URL to authorize GoSync at.
+
+import os, sys, signal, logging, argparse, threading
+try :
+    from .GoSyncModel import *
+    from .GoSyncEvents import *
+    from .defines import *
+except (ImportError, ValueError):
+    from GoSyncModel import *
+    from GoSyncEvents import *
+    from defines import *
+
+
+class GoSyncDaemon(object):
+    def __init__(self, model, once=False, startup_timing=False):
+        self.model = model
+        self.once = once
+        self.startup_timing = startup_timing
+        self.status = 0
+        self.stopped = threading.Event()
+
+        events = GoSyncEventController()
+        events.AddListener(GOSYNC_EVENT_READY, self.OnReady)
+        events.AddListener(GOSYNC_EVENT_SYNC_STARTED, self.OnSyncStarted)
+        events.AddListener(GOSYNC_EVENT_SYNC_DONE, self.OnSyncDone)
+        events.AddListener(GOSYNC_EVENT_SYNC_INV_FOLDER, self.OnSyncInvalidFolder)
+        events.AddListener(GOSYNC_EVENT_SYNC_ERROR, self.OnSyncError)
+        events.AddListener(GOSYNC_EVENT_INTERNET_UNREACHABLE, self.OnInternetDown)
+
+    def Log(self, msg):
+        sys.stderr.write("gosync-daemon: %s\n" % msg)
+        sys.stderr.flush()
+
+    def OnReady(self, data):
+        if data:
+            self.Log("Failed to start")
+            self.status = 1
+            self.Stop()
+            return
+
+        if self.startup_timing:
+            sys.stderr.write(self.model.FormatStartupTimes())
+            self.Stop()
+
+    def OnSyncStarted(self, data):
+        self.Log("Sync started")
+
+    def OnSyncDone(self, data):
+        if data == 0:
+            self.Log("Sync done")
+        else:
+            self.Log("Sync failed, see %s" % os.path.join(os.environ['HOME'], 'GoSync.log'))
+            self.status = 1
+        if self.once:
+            self.Stop()
+
+    def OnSyncInvalidFolder(self, data):
+        # The sync thread pauses itself, nothing else will happen
+        self.Log("Folder %s selected for sync was not found on the drive" % data)
+        self.status = 1
+        self.Stop()
+
+    def OnSyncError(self, data):
+        self.Log("%s: %s" % (data['title'], data['message'].strip()))
+
+    def OnInternetDown(self, data):
+        self.Log("Network is down" if data == 1 else "Network is up")
+
+    def Run(self):
+        self.model.SetTheBallRolling()
+        if not self.startup_timing:
+            self.model.StartSync()
+        # A plain wait() can't be interrupted by signals on Python 2
+        while not self.stopped.wait(1):
+            pass
+        self.Log("Stopping")
+        self.model.StopTheShow()
+        return self.status
+
+    def Stop(self, *args):
+        self.stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='gosync-daemon',
+                                     description="Sync the Google Drive mirror without the GUI")
+    parser.add_argument('--once', action='store_true',
+                        help="exit after one sync instead of syncing every interval")
+    parser.add_argument('--interval', type=int,
+                        help="seconds between two syncs, overrides the configured one")
+    parser.add_argument('--metrics-port', type=int,
+                        help="serve metrics on this port, overrides the configured one")
+    parser.add_argument('--startup-timing', action='store_true',
+                        help="print how long each startup phase took and exit")
+    parser.add_argument('--verbose', action='store_true',
+                        help="copy the GoSync log to stderr")
+    args = parser.parse_args()
+
+    if args.verbose:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        logging.getLogger(APP_NAME + APP_VERSION).addHandler(handler)
+
+    try:
+        model = GoSyncModel()
+    except ClientSecretsNotFound:
+        sys.stderr.write("gosync-daemon: No credentials file found. Copy it to %s\n"
+                         % os.path.join(os.environ['HOME'], '.gosync', 'credentials.json'))
+        return 1
+    except AuthenticationFailed:
+        sys.stderr.write("gosync-daemon: Authentication rejected\n")
+        return 1
+
+    if args.interval is not None:
+        model.sync_interval = max(1, args.interval)
+    if args.metrics_port is not None:
+        model.metrics_port = args.metrics_port
+
+    daemon = GoSyncDaemon(model, args.once, args.startup_timing)
+    signal.signal(signal.SIGTERM, daemon.Stop)
+    signal.signal(signal.SIGINT, daemon.Stop)
+    return daemon.Run()
+
+if __name__ == "__main__":
+    sys.exit(main())
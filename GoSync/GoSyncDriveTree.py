@@ -16,7 +16,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import os, threading
+import os, copy, threading
 
 class DriveFolder(object):
     def __init__(self, parent, id, name, data=None):
@@ -25,6 +25,12 @@ class DriveFolder(object):
         self.parent = parent
         self.data = data
         self.name = name
+        self.path = None
+
+    def __setstate__(self, state):
+        #Trees pickled by older versions don't carry the cached path
+        self.__dict__.update(state)
+        self.path = None
 
     def SetData(self, data):
         self.data = data
@@ -50,84 +56,300 @@ class DriveFolder(object):
     def GetChildren(self):
         return self.children
 
+    def InvalidatePath(self):
+        #Path of all the children depends on this one. Walk the subtree
+        #with an explicit stack, deep trees blow the recursion limit.
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node.path = None
+            stack.extend(node.children)
+
     def GetPath(self):
-        cpath =''
-        if self.parent is not None:
-            cpath = self.parent.GetPath()
+        if self.path is not None:
+            return self.path
 
         if self.parent is None:
-            path = os.path.join(cpath, '')
+            self.path = os.path.join('', '')
         else:
-            path = os.path.join(cpath, self.GetName())
+            self.path = os.path.join(self.parent.GetPath(), self.GetName())
 
-        return path
+        return self.path
 
 
 class GoogleDriveTree(object):
-    def __init__(self):
+    """
+    Folder hierarchy of the drive. If a DriveTreeStore is given, the
+    tree is read from it on first use and every change is written
+    through to it.
+
+    The tree is changed from the sync thread, the usage scan and the
+    callbacks of the batcher thread; lock guards the nodes and the
+    indexes.
+    """
+    def __init__(self, store=None):
         self.root_node = DriveFolder(None, 'root', 'Google Drive Root', None)
+        self.id_index = {}
+        self.path_index = {}
+        self.IndexFolder(self.root_node)
+        self.store = store
+        self.loaded = store is None
+        self.lock = threading.RLock()
+
+    def __getstate__(self):
+        #Copies (see GoSyncModel.GetDriveDirectoryTree) are detached
+        #from the store, changes to them must not be persisted.
+        self.EnsureLoaded()
+        state = self.__dict__.copy()
+        state['store'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        #Trees pickled by older versions don't have the indexes
+        self.__dict__.update(state)
+        self.store = None
+        self.loaded = True
+        self.lock = threading.RLock()
+        self.RebuildIndexes()
+
+    def EnsureLoaded(self):
+        if self.loaded:
+            return
+
+        with self.lock:
+            if self.loaded:
+                return
+
+            rows = self.store.GetFolders()
+            nodes = {}
+            for parent_id, folder_id, name, data in rows:
+                nodes[folder_id] = DriveFolder(None, folder_id, name, data)
+
+            for parent_id, folder_id, name, data in rows:
+                pnode = self.root_node if parent_id == 'root' else nodes.get(parent_id)
+                if pnode is None:
+                    continue
+                nodes[folder_id].parent = pnode
+                pnode.AddChild(nodes[folder_id])
+
+            self.RebuildIndexes()
+
+            #Folders whose parent went missing can't be reached anymore
+            orphans = [i for i in nodes if i not in self.id_index]
+            if orphans:
+                self.store.DeleteFolders(orphans)
+            self.loaded = True
+
+    def SaveToStore(self, store):
+        """Write the whole tree to store and keep it attached."""
+        with self.lock:
+            self.EnsureLoaded()
+            store.Clear()
+            folders = []
+            stack = list(reversed(self.root_node.GetChildren()))
+            while stack:
+                node = stack.pop()
+                folders.append((node.GetParent().GetId(), node.GetId(), node.GetName(), node.GetData()))
+                stack.extend(reversed(node.GetChildren()))
+            store.AddFolders(folders)
+            self.store = store
+
+    def Clear(self):
+        """Drop every folder, here and in the store."""
+        with self.lock:
+            self.root_node = DriveFolder(None, 'root', 'Google Drive Root', None)
+            self.RebuildIndexes()
+            self.loaded = True
+            if self.store:
+                self.store.Clear()
+
+    def Copy(self):
+        """A deep copy detached from the store, see __getstate__."""
+        with self.lock:
+            return copy.deepcopy(self)
 
     def GetRoot(self):
+        self.EnsureLoaded()
         return self.root_node
 
-    def FindFolderInParent(self, parent, id):
-        for f in parent.GetChildren():
-            if f.GetId() == id:
-                return f
-            
-            ret = self.FindFolderInParent(f, id)
-            if ret:
-                return ret
+    def IndexFolder(self, node):
+        self.id_index[node.GetId()] = node
+        # Drive allows two folders with the same name under one parent.
+        # The first one seen owns the path.
+        self.path_index.setdefault(node.GetPath(), node)
+
+    def UnindexFolder(self, node):
+        if self.id_index.get(node.GetId()) is node:
+            del self.id_index[node.GetId()]
+        if self.path_index.get(node.GetPath()) is node:
+            del self.path_index[node.GetPath()]
+
+    def RebuildIndexes(self):
+        self.id_index = {}
+        self.path_index = {}
+        stack = [self.root_node]
+        while stack:
+            node = stack.pop()
+            self.IndexFolder(node)
+            stack.extend(node.GetChildren())
 
-        return None
-
-    def FindFolder(self, id):
-        if id == 'root':
-            return self.root_node
-        else:
-            return self.FindFolderInParent(self.root_node, id)
+    def FindFolderInParent(self, parent, id):
+        with self.lock:
+            self.EnsureLoaded()
+            node = self.id_index.get(id)
+            if node is None:
+                return None
+
+            #Only report the node if it sits under the given parent
+            pnode = node.GetParent()
+            while pnode is not None:
+                if pnode is parent:
+                    return node
+                pnode = pnode.GetParent()
 
-    def AddFolder(self, parent, folder_id, folder_name, data):
-        if not parent:
             return None
 
-        pnode = self.FindFolder(parent)
+    def FindFolder(self, id):
+        with self.lock:
+            self.EnsureLoaded()
+            return self.id_index.get(id)
 
-        if self.FindFolder(folder_id):
-            return
+    def FindFolderByPath(self, path):
+        with self.lock:
+            self.EnsureLoaded()
+            return self.path_index.get(path)
 
-        cnode = DriveFolder(pnode, folder_id, folder_name, data)
-        pnode.AddChild(cnode)
+    def AddFolder(self, parent, folder_id, folder_name, data):
+        with self.lock:
+            if not parent:
+                return None
+
+            pnode = self.FindFolder(parent)
+            if not pnode:
+                return None
+
+            if folder_id in self.id_index:
+                return
+
+            cnode = DriveFolder(pnode, folder_id, folder_name, data)
+            pnode.AddChild(cnode)
+            self.IndexFolder(cnode)
+            if self.store:
+                self.store.AddFolder(parent, folder_id, folder_name, data)
+            return cnode
+
+    def AddFolders(self, folders):
+        """
+        Add (parent_id, folder_id, name, data) tuples, parents listed
+        before their children. The store is written in one go.
+        """
+        with self.lock:
+            self.EnsureLoaded()
+            added = []
+            for parent, folder_id, folder_name, data in folders:
+                pnode = self.id_index.get(parent)
+                if not pnode or folder_id in self.id_index:
+                    continue
+                cnode = DriveFolder(pnode, folder_id, folder_name, data)
+                pnode.AddChild(cnode)
+                self.IndexFolder(cnode)
+                added.append((parent, folder_id, folder_name, data))
+
+            if self.store and added:
+                self.store.AddFolders(added)
+
+    def GetSubtreeIds(self, folder_id):
+        """Ids of the folder and of all folders below it."""
+        with self.lock:
+            node = self.FindFolder(folder_id)
+            ids = []
+            stack = [node] if node else []
+            while stack:
+                cnode = stack.pop()
+                ids.append(cnode.GetId())
+                stack.extend(cnode.GetChildren())
+            return ids
+
+    def __UnindexSubtree(self, node):
+        stack = [node]
+        while stack:
+            cnode = stack.pop()
+            self.UnindexFolder(cnode)
+            stack.extend(cnode.GetChildren())
+
+    def __ReindexSubtree(self, node):
+        node.InvalidatePath()
+        stack = [node]
+        while stack:
+            cnode = stack.pop()
+            self.IndexFolder(cnode)
+            stack.extend(cnode.GetChildren())
+
+    def RenameFolder(self, folder_id, new_name):
+        with self.lock:
+            node = self.FindFolder(folder_id)
+            if not node or node is self.root_node:
+                return None
+
+            self.__UnindexSubtree(node)
+            node.name = new_name
+            self.__ReindexSubtree(node)
+            if self.store:
+                self.store.UpdateFolder(folder_id, node.GetParent().GetId(), new_name)
+            return node
+
+    def MoveFolder(self, folder_id, new_parent_id, new_name=None):
+        with self.lock:
+            node = self.FindFolder(folder_id)
+            pnode = self.FindFolder(new_parent_id)
+            if not node or not pnode or node is self.root_node:
+                return None
+
+            #Refuse to move a folder below itself
+            anode = pnode
+            while anode is not None:
+                if anode is node:
+                    return None
+                anode = anode.GetParent()
+
+            self.__UnindexSubtree(node)
+            node.GetParent().DeleteChild(node)
+            node.parent = pnode
+            if new_name is not None:
+                node.name = new_name
+            pnode.AddChild(node)
+            self.__ReindexSubtree(node)
+            if self.store:
+                self.store.UpdateFolder(folder_id, new_parent_id, node.GetName())
+            return node
 
-    def __DeleteFolder(self, folder_id, FolderDeleteCallback):
-        pnode = self.FindFolder(folder_id)
+    def DeleteFolder(self, folder_id, FolderDeleteCallback=None):
+        with self.lock:
+            pnode = self.FindFolder(folder_id)
+            if not pnode or pnode is self.root_node:
+                return
+
+            #Post-order walk so the callback sees children before their parent
+            #and every node still has its full path when it is reported.
+            deleted = []
+            stack = [(pnode, False)]
+            while stack:
+                node, visited = stack.pop()
+                if not visited:
+                    stack.append((node, True))
+                    for child in node.GetChildren():
+                        stack.append((child, False))
+                    continue
+
+                if FolderDeleteCallback:
+                    FolderDeleteCallback(node)
+                self.UnindexFolder(node)
+                deleted.append(node.GetId())
 
-        if not pnode.GetChildren():
-            if FolderDeleteCallback:
-                FolderDeleteCallback(pnode)
             pnode.GetParent().DeleteChild(pnode)
-            return
-
-        #This try is important. After Deleting child, the pnode's
-        #for loop goes for a toss. So a call of pnode.GetChildren()
-        #is required to start afresh.
-        #
-        #I have sweat enough on it, can I can't get this working in
-        #a pure recursive way.
-        while True:
-            if not pnode.GetChildren():
-                break
-            for child in pnode.GetChildren():
-                self.__DeleteFolder(child.GetId())
-                break
-
-    #This is really ugly. But while deleting child, the child list
-    #keeps modifying and for loop goes for a toss. The "recursive"
-    #function doesn't delete the root. So second call to get rid of
-    #root node as well.
-    def DeleteFolder(self, folder_id, FolderDeleteCallback=None):
-        self.__DeleteFolder(folder_id, FolderDeleteCallback)
-        self.__DeleteFolder(folder_id, FolderDeleteCallback)
+            if self.store:
+                self.store.DeleteFolders(deleted)
 
     def PrintTree(self, folder_id):
         pnode = self.FindFolder(folder_id)
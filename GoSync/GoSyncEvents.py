@@ -16,7 +16,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 
-import os, wx
+import os
 
 GOSYNC_EVENT_CALCULATE_USAGE_STARTED = '_gosync_calculate_usage_started'
 GOSYNC_EVENT_CALCULATE_USAGE_UPDATE = '_gosync_calculate_usage_update'
@@ -26,55 +26,59 @@ GOSYNC_EVENT_SYNC_UPDATE = '_gosync_sync_update'
 GOSYNC_EVENT_SYNC_DONE = '_gosync_sync_done'
 GOSYNC_EVENT_SYNC_TIMER = '_gosync_sync_timer'
 GOSYNC_EVENT_SYNC_INV_FOLDER = '_gosync_sync_invalid_folder'
+GOSYNC_EVENT_SYNC_ERROR = '_gosync_sync_error'
 GOSYNC_EVENT_SCAN_UPDATE = '_gosync_scan_update'
 GOSYNC_EVENT_INTERNET_UNREACHABLE = '_gosync_internet_unreachable'
 GOSYNC_EVENT_MIRROR_DIRECTORY_MOVE = '_gosync_mirror_directory_move'
+GOSYNC_EVENT_ACCOUNT_UPDATE = '_gosync_account_update'
+GOSYNC_EVENT_READY = '_gosync_ready'
 
-GOSYNC_EVENT_ID_SYNC_STARTED = wx.NewId()
-GOSYNC_EVENT_ID_SYNC_UPDATE = wx.NewId()
-GOSYNC_EVENT_ID_SYNC_DONE = wx.NewId()
-GOSYNC_EVENT_ID_CALCULATE_USAGE_STARTED = wx.NewId()
-GOSYNC_EVENT_ID_CALCULATE_USAGE_UPDATE = wx.NewId()
-GOSYNC_EVENT_ID_CALCULATE_USAGE_DONE = wx.NewId()
-GOSYNC_EVENT_ID_SYNC_TIMER = wx.NewId()
-GOSYNC_EVENT_ID_SYNC_INV_FOLDER = wx.NewId()
-GOSYNC_EVENT_ID_SCAN_UPDATE = wx.NewId()
-GOSYNC_EVENT_ID_INTERNET_UNREACHABLE = wx.NewId()
-GOSYNC_EVENT_ID_MIRROR_DIRECTORY_MOVE = wx.NewId()
-
-class GoSyncEvent(wx.PyEvent):
-    def __init__(self, event, data):
-        wx.PyEvent.__init__(self)
-
-        self.SetEventType(event)
-        self.data = data
+GOSYNC_EVENTS = (GOSYNC_EVENT_SYNC_STARTED,
+                 GOSYNC_EVENT_SYNC_UPDATE,
+                 GOSYNC_EVENT_SYNC_DONE,
+                 GOSYNC_EVENT_CALCULATE_USAGE_STARTED,
+                 GOSYNC_EVENT_CALCULATE_USAGE_UPDATE,
+                 GOSYNC_EVENT_CALCULATE_USAGE_DONE,
+                 GOSYNC_EVENT_SYNC_TIMER,
+                 GOSYNC_EVENT_SYNC_INV_FOLDER,
+                 GOSYNC_EVENT_SYNC_ERROR,
+                 GOSYNC_EVENT_SCAN_UPDATE,
+                 GOSYNC_EVENT_INTERNET_UNREACHABLE,
+                 GOSYNC_EVENT_MIRROR_DIRECTORY_MOVE,
+                 GOSYNC_EVENT_ACCOUNT_UPDATE,
+                 GOSYNC_EVENT_READY)
+
+_event_class = None
+
+def GoSyncEvent(event_id, data):
+    """
+    A wx event carrying data. wx is only imported once a window binds
+    an event, so the sync engine runs without it.
+    """
+    global _event_class
+    import wx
+
+    if _event_class is None:
+        class _GoSyncEvent(wx.PyEvent):
+            def __init__(self, event_id, data):
+                wx.PyEvent.__init__(self)
+
+                self.SetEventType(event_id)
+                self.data = data
+        _event_class = _GoSyncEvent
+
+    return _event_class(event_id, data)
 
 # A singleton class for event passing between
-# different modules of GoSync
+# different modules of GoSync. Windows get the events through
+# wx.PostEvent (BindEvent), everybody else has its callback called
+# from the thread posting the event (AddListener).
 class GoSyncEventController(object):
     _event_controller_instance = None
-    _sync_events = {GOSYNC_EVENT_SYNC_STARTED: GOSYNC_EVENT_ID_SYNC_STARTED,
-                    GOSYNC_EVENT_SYNC_UPDATE: GOSYNC_EVENT_ID_SYNC_UPDATE,
-                    GOSYNC_EVENT_SYNC_DONE: GOSYNC_EVENT_ID_SYNC_DONE,
-                    GOSYNC_EVENT_CALCULATE_USAGE_STARTED: GOSYNC_EVENT_ID_CALCULATE_USAGE_STARTED,
-                    GOSYNC_EVENT_CALCULATE_USAGE_UPDATE: GOSYNC_EVENT_ID_CALCULATE_USAGE_UPDATE,
-                    GOSYNC_EVENT_CALCULATE_USAGE_DONE: GOSYNC_EVENT_ID_CALCULATE_USAGE_DONE,
-                    GOSYNC_EVENT_SYNC_TIMER: GOSYNC_EVENT_ID_SYNC_TIMER,
-                    GOSYNC_EVENT_SCAN_UPDATE: GOSYNC_EVENT_ID_SCAN_UPDATE,
-                    GOSYNC_EVENT_INTERNET_UNREACHABLE: GOSYNC_EVENT_ID_INTERNET_UNREACHABLE,
-                    GOSYNC_EVENT_MIRROR_DIRECTORY_MOVE: GOSYNC_EVENT_ID_MIRROR_DIRECTORY_MOVE,
-                    GOSYNC_EVENT_SYNC_INV_FOLDER: GOSYNC_EVENT_ID_SYNC_INV_FOLDER}
-    _sync_listeners = {GOSYNC_EVENT_SYNC_STARTED:[],
-                       GOSYNC_EVENT_SYNC_UPDATE: [],
-                       GOSYNC_EVENT_SYNC_DONE: [],
-                       GOSYNC_EVENT_CALCULATE_USAGE_STARTED: [],
-                       GOSYNC_EVENT_CALCULATE_USAGE_UPDATE: [],
-                       GOSYNC_EVENT_CALCULATE_USAGE_DONE: [],
-                       GOSYNC_EVENT_SYNC_TIMER: [],
-                       GOSYNC_EVENT_SCAN_UPDATE: [],
-                       GOSYNC_EVENT_INTERNET_UNREACHABLE: [],
-                       GOSYNC_EVENT_MIRROR_DIRECTORY_MOVE: [],
-                       GOSYNC_EVENT_SYNC_INV_FOLDER: []}
+    # wx event ids, allocated when an event is first bound
+    _sync_events = dict((event, None) for event in GOSYNC_EVENTS)
+    _sync_listeners = dict((event, []) for event in GOSYNC_EVENTS)
+    _sync_callbacks = dict((event, []) for event in GOSYNC_EVENTS)
 
     def __new__(cls, *args, **kwargs):
         if not cls._event_controller_instance:
@@ -84,8 +88,11 @@ class GoSyncEventController(object):
         return cls._event_controller_instance
 
     def PostEvent(self, event, data):
-        if self._sync_listeners[event] and \
-                self._sync_listeners[event]:
+        for callback in list(self._sync_callbacks[event]):
+            callback(data)
+
+        if self._sync_listeners[event]:
+            import wx
             for listener in self._sync_listeners[event]:
                 wx.PostEvent(listener, GoSyncEvent(self._sync_events[event], data))
 
@@ -93,8 +100,22 @@ class GoSyncEventController(object):
         if not notify_object:
             raise ValueError("Invalid notify object")
     
-        if not self._sync_events[event]:
+        if event not in self._sync_events:
             raise ValueError("Invalid event")
 
+        import wx
+        if self._sync_events[event] is None:
+            self._sync_events[event] = wx.NewId()
+
         notify_object.Connect(-1, -1, self._sync_events[event], func)
         self._sync_listeners[event].append(notify_object)
+
+    def AddListener(self, event, callback):
+        """callback(data) is called each time event is posted."""
+        if event not in self._sync_callbacks:
+            raise ValueError("Invalid event")
+
+        self._sync_callbacks[event].append(callback)
+
+    def RemoveListener(self, event, callback):
+        self._sync_callbacks[event].remove(callback)
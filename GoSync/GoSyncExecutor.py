@@ -0,0 +1,214 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time, random, socket, threading, json
+from googleapiclient.errors import HttpError
+try :
+    from .GoSyncConnectivity import IsNetworkError
+    from .GoSyncMetrics import RequestEndpoint
+except (ImportError, ValueError):
+    from GoSyncConnectivity import IsNetworkError
+    from GoSyncMetrics import RequestEndpoint
+
+MIN_REQUESTS_PER_SECOND = 1
+MAX_REQUESTS_PER_SECOND = 100
+DEFAULT_REQUESTS_PER_SECOND = 10
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 64.0
+
+# Every retry takes one token out of the budget and every successful
+# request puts a tenth of one back. When the drive keeps failing, the
+# budget runs dry and requests fail right away instead of piling up
+# retries.
+RETRY_BUDGET = 50
+RETRY_BUDGET_REFILL = 0.1
+
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'backendError')
+RETRIABLE_STATUS = (429, 500, 502, 503, 504)
+
+class TokenBucket(object):
+    """Allows rate requests per second on average and bursts of up to burst."""
+    def __init__(self, rate, burst=None):
+        self.lock = threading.Lock()
+        self.SetRate(rate, burst)
+        self.tokens = self.burst
+        self.last = time.time()
+        self.paused_until = 0
+
+    def SetRate(self, rate, burst=None):
+        with self.lock:
+            self.rate = float(rate)
+            self.burst = float(burst or max(1, rate))
+
+    def Pause(self, seconds):
+        """Hand out no tokens for the given time, e.g. after a rate limit error."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def Acquire(self, tokens=1):
+        """Takes tokens out of the bucket. Returns the time spent waiting."""
+        waited = 0
+        tokens = min(tokens, self.burst)
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                elif self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                else:
+                    delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class RequestExecutor(object):
+    """
+    Every call to the drive goes through Execute() or Call(). Calls are
+    rate limited with a token bucket and failed calls are retried with
+    exponential backoff and full jitter, honouring Retry-After.
+    How calls go is reported to connectivity (a ConnectivityMonitor),
+    and network errors aren't retried once it says we are offline.
+    Every attempt is timed and counted in metrics (a DriveMetrics)
+    under its endpoint.
+    """
+    def __init__(self, sync_model, rate=DEFAULT_REQUESTS_PER_SECOND, connectivity=None,
+                 metrics=None):
+        self.sync_model = sync_model
+        self.connectivity = connectivity
+        self.metrics = metrics
+        self.bucket = TokenBucket(rate)
+        self.lock = threading.Lock()
+        self.budget = RETRY_BUDGET
+        self.stats = {'requests': 0, 'retried': 0, 'throttled': 0,
+                      'failed': 0, 'budget_exhausted': 0, 'wait_time': 0.0}
+
+    def SetRate(self, rate):
+        self.bucket.SetRate(rate)
+
+    def GetStats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def __Count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def __RateLimitReason(self, error):
+        try:
+            content = json.loads(error.content.decode('utf-8'))
+            for e in content['error'].get('errors', []):
+                if e.get('reason') in RATE_LIMIT_REASONS:
+                    return e['reason']
+        except:
+            pass
+        return None
+
+    def __RetryAfter(self, error):
+        try:
+            return float(error.resp.get('retry-after'))
+        except (TypeError, ValueError, AttributeError):
+            return None
+
+    def ClassifyError(self, error):
+        """Returns (retriable, throttled) for an exception raised by a call."""
+        if isinstance(error, HttpError):
+            status = error.resp.status
+            if status == 429:
+                return True, True
+            if status == 403:
+                reason = self.__RateLimitReason(error)
+                return reason is not None, reason is not None
+            return status in RETRIABLE_STATUS, False
+        if isinstance(error, (socket.error, socket.timeout, ConnectionError)):
+            return True, False
+        return False, False
+
+    def TakeRetry(self):
+        """Takes a retry out of the budget. False if the budget is spent."""
+        with self.lock:
+            if self.budget < 1:
+                self.stats['budget_exhausted'] += 1
+                return False
+            self.budget -= 1
+            self.stats['retried'] += 1
+            return True
+
+    def Backoff(self, attempt, error=None):
+        """Seconds to wait before retry number attempt (counted from 1)."""
+        delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+        retry_after = self.__RetryAfter(error) if isinstance(error, HttpError) else None
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def Call(self, func, description='', tokens=1, endpoint='other'):
+        """Calls func() within the rate limit and retries it when it fails."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.__Count('wait_time', self.bucket.Acquire(tokens))
+            self.__Count('requests')
+            start = time.time()
+            try:
+                result = func()
+                if self.metrics:
+                    self.metrics.Observe(endpoint, time.time() - start)
+                with self.lock:
+                    self.budget = min(RETRY_BUDGET, self.budget + RETRY_BUDGET_REFILL)
+                if self.connectivity:
+                    self.connectivity.ReportSuccess()
+                return result
+            except Exception as error:
+                if self.metrics:
+                    self.metrics.Observe(endpoint, time.time() - start, error)
+                retriable, throttled = self.ClassifyError(error)
+                if throttled:
+                    self.__Count('throttled')
+
+                offline = False
+                if self.connectivity and IsNetworkError(error):
+                    self.connectivity.ReportFailure(error)
+                    offline = not self.connectivity.IsOnline()
+
+                if offline or not retriable or attempt >= MAX_ATTEMPTS or not self.TakeRetry():
+                    self.__Count('failed')
+                    raise
+
+                if self.metrics:
+                    self.metrics.CountRetry(endpoint)
+                delay = self.Backoff(attempt, error)
+                if throttled:
+                    # Everybody slows down, not just this call
+                    self.bucket.Pause(delay)
+                self.sync_model.SendlToLog(2, "RequestExecutor: %s failed (%s). Retry %d in %.1f seconds"
+                                           % (description or 'Request', error, attempt, delay))
+                time.sleep(delay)
+
+    def Execute(self, request, description='', http=None):
+        """Executes a googleapiclient request on the calling thread's connection."""
+        if http is None:
+            http = self.sync_model.GetThreadHttp()
+        return self.Call(lambda: request.execute(http=http),
+                         description or getattr(request, 'methodId', ''),
+                         endpoint=RequestEndpoint(request))
@@ -0,0 +1,111 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os, time, threading, sqlite3
+
+DEFAULT_HASH_CACHE_ENTRIES = 200000
+
+# A file modified this recently may be modified again within the
+# resolution of its mtime without the mtime changing. Don't trust
+# (and don't cache) hashes of such files.
+RACY_MTIME_WINDOW = 2
+
+class LocalHashCache(object):
+    """
+    Persistent cache of the MD5 of local files. An entry is only used
+    if device, inode, size and mtime of the file are still the same as
+    when it was hashed. The least recently used entries are dropped
+    once the cache holds more than max_entries files.
+    """
+    def __init__(self, db_file, max_entries=DEFAULT_HASH_CACHE_ENTRIES):
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                            "path TEXT PRIMARY KEY, dev INTEGER, ino INTEGER, "
+                            "size INTEGER, mtime_ns INTEGER, md5 TEXT, last_used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS hashes_last_used ON hashes(last_used)")
+            self.db.commit()
+            self.entries = self.db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def __Key(self, st):
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def Lookup(self, path, st):
+        with self.lock:
+            row = self.db.execute("SELECT dev, ino, size, mtime_ns, md5 FROM hashes WHERE path=?",
+                                  (path,)).fetchone()
+            if not row or tuple(row[:4]) != self.__Key(st):
+                return None
+
+            self.db.execute("UPDATE hashes SET last_used=? WHERE path=?", (time.time(), path))
+            self.db.commit()
+            return row[4]
+
+    def Store(self, path, st, md5):
+        if time.time() - st.st_mtime < RACY_MTIME_WINDOW:
+            return
+
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  (path,) + self.__Key(st) + (md5, time.time()))
+            self.entries += 1
+            if self.entries > self.max_entries:
+                self.__Evict()
+            self.db.commit()
+
+    def __Evict(self):
+        #Drop a tenth more than needed so this doesn't run on every insert
+        self.entries = self.db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+        excess = self.entries - self.max_entries
+        if excess <= 0:
+            return
+
+        excess += self.max_entries // 10
+        self.db.execute("DELETE FROM hashes WHERE path IN "
+                        "(SELECT path FROM hashes ORDER BY last_used LIMIT ?)", (excess,))
+        self.entries = self.db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+    def Invalidate(self, path):
+        """Forget the hash of path and, if it is a directory, of everything below it."""
+        with self.lock:
+            # '0' comes right after '/', unlike LIKE this is case sensitive
+            cur = self.db.execute("DELETE FROM hashes WHERE path=? OR (path >= ? AND path < ?)",
+                                  (path, path + '/', path + '0'))
+            self.entries -= cur.rowcount
+            self.db.commit()
+
+    def GetHash(self, path, hash_func):
+        st = os.stat(path)
+        md5 = self.Lookup(path, st)
+        if md5 is not None:
+            return md5
+
+        md5 = hash_func(path)
+        # Only remember it if the file didn't change while being read
+        if self.__Key(os.stat(path)) == self.__Key(st):
+            self.Store(path, st, md5)
+        return md5
+
+    def Close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,166 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os, threading, sqlite3
+
+class SnapshotDiff(object):
+    def __init__(self):
+        # (path, is_dir, (ino, size, mtime_ns)), parents before children
+        self.added = []
+        # (path, is_dir, (ino, size, mtime_ns)) of files which changed
+        self.changed = []
+        # (path, is_dir) of entries gone since the snapshot
+        self.removed = []
+        self.scanned = 0
+        # True when there was no snapshot of this directory to compare with
+        self.initial = False
+
+    def IsEmpty(self):
+        return not (self.added or self.changed or self.removed)
+
+
+class LocalSnapshot(object):
+    """
+    What the local mirror looked like at the end of the last local
+    sync: inode, size and mtime of every file and folder, by path
+    relative to the mirror directory. Diff() walks the mirror with
+    os.scandir, which gets the file type from the directory listing,
+    and compares it one folder at a time against the snapshot, so only
+    the largest folder is held in memory. Commit() writes back only
+    the entries which changed. Names for which ignore(name) is True
+    are left out (our partial downloads).
+    """
+    def __init__(self, db_file, ignore=None):
+        self.db_file = db_file
+        self.ignore = ignore
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                            "path TEXT PRIMARY KEY, parent TEXT, is_dir INTEGER, "
+                            "ino INTEGER, size INTEGER, mtime_ns INTEGER)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent)")
+            self.db.commit()
+
+    def __GetRoot(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key='root'").fetchone()
+        return row[0] if row else None
+
+    def __Listing(self, parent):
+        with self.lock:
+            return dict((os.path.basename(path), (is_dir, (ino, size, mtime_ns)))
+                        for path, is_dir, ino, size, mtime_ns in
+                        self.db.execute("SELECT path, is_dir, ino, size, mtime_ns "
+                                        "FROM entries WHERE parent=?", (parent,)))
+
+    def Diff(self, root, prune=None, should_stop=None):
+        """
+        Compare root with the snapshot. prune(abs_dir) can drop a folder
+        from the scan by returning True; whatever the snapshot had
+        below it shows up as removed. Folders only ever show up as added
+        or removed, a change inside them is reported for the files.
+        """
+        diff = SnapshotDiff()
+        with self.lock:
+            if self.__GetRoot() != root:
+                # Another mirror directory, the old snapshot is useless
+                self.db.execute("DELETE FROM entries")
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (root,))
+                self.db.commit()
+                diff.initial = True
+
+        stack = ['']
+        while stack:
+            if should_stop and should_stop():
+                return None
+
+            rel_dir = stack.pop()
+            old = self.__Listing(rel_dir)
+            try:
+                it = os.scandir(os.path.join(root, rel_dir))
+            except OSError:
+                # Gone while we were looking. Leave its entries alone,
+                # the next diff will tell.
+                continue
+
+            with it:
+                for entry in it:
+                    if self.ignore and self.ignore(entry.name):
+                        continue
+                    rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                        if is_dir and prune and prune(entry.path):
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+
+                    diff.scanned += 1
+                    if is_dir:
+                        key = (st.st_ino, 0, 0)
+                        # Like os.walk, don't follow links to folders
+                        if not entry.is_symlink():
+                            stack.append(rel)
+                    else:
+                        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+
+                    prev = old.pop(entry.name, None)
+                    if prev is None:
+                        diff.added.append((rel, is_dir, key))
+                    elif bool(prev[0]) != is_dir:
+                        diff.removed.append((rel, bool(prev[0])))
+                        diff.added.append((rel, is_dir, key))
+                    elif not is_dir and tuple(prev[1]) != key:
+                        diff.changed.append((rel, is_dir, key))
+
+            for name, (was_dir, _) in old.items():
+                diff.removed.append((os.path.join(rel_dir, name) if rel_dir else name, bool(was_dir)))
+
+        return diff
+
+    def Commit(self, diff):
+        """Make what diff found the snapshot."""
+        with self.lock:
+            for path, is_dir in diff.removed:
+                self.db.execute("DELETE FROM entries WHERE path=?", (path,))
+                if is_dir:
+                    # '0' comes right after '/', this is everything below path
+                    self.db.execute("DELETE FROM entries WHERE path >= ? AND path < ?",
+                                    (path + '/', path + '0'))
+            self.db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                ((path, os.path.dirname(path), int(is_dir)) + key
+                                 for path, is_dir, key in diff.added + diff.changed))
+            self.db.commit()
+
+    def GetCount(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def Clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("DELETE FROM meta")
+            self.db.commit()
+
+    def Close(self):
+        with self.lock:
+            self.db.close()
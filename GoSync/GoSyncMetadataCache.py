@@ -0,0 +1,150 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os, threading, sqlite3
+
+# Metadata kept for each remote object. These are the same names the
+# Drive v3 API uses, so a cached entry looks like a files().list() entry.
+CACHED_FIELDS = ['id', 'name', 'mimeType', 'md5Checksum', 'size', 'modifiedTime']
+
+class DriveMetadataCache(object):
+    """
+    Persistent cache of remote file metadata, keyed by file id and by
+    path relative to the mirror directory. It is filled from the
+    results of folder listings and must be invalidated by any code
+    that changes things on the remote.
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        with self.lock:
+            self.db.execute("CREATE TABLE IF NOT EXISTS files ("
+                            "id TEXT PRIMARY KEY, path TEXT NOT NULL, parent TEXT, "
+                            "name TEXT, mimeType TEXT, md5Checksum TEXT, "
+                            "size TEXT, modifiedTime TEXT)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS files_path ON files(path)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS files_parent ON files(parent)")
+            self.db.commit()
+
+    def __RowToFile(self, row):
+        if not row:
+            return None
+
+        f = {'parents': [row[2]]}
+        for name, value in zip(CACHED_FIELDS, (row[0],) + tuple(row[3:])):
+            # Folders and google documents don't have checksum or size.
+            # Leave them out like the API does.
+            if value is not None:
+                f[name] = value
+        return f
+
+    def __Insert(self, path, parent, f):
+        self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (f['id'], path, parent, f.get('name'), f.get('mimeType'),
+                         f.get('md5Checksum'), f.get('size'), f.get('modifiedTime')))
+
+    def __SubtreeRange(self, path):
+        # Everything below path sorts in [path/, path0), '0' comes right
+        # after '/'. Unlike LIKE this is case sensitive.
+        return path + '/', path + '0'
+
+    def GetByPath(self, path):
+        with self.lock:
+            cur = self.db.execute("SELECT id, path, parent, name, mimeType, md5Checksum, "
+                                  "size, modifiedTime FROM files WHERE path=? LIMIT 1", (path,))
+            return self.__RowToFile(cur.fetchone())
+
+    def GetById(self, file_id):
+        with self.lock:
+            cur = self.db.execute("SELECT id, path, parent, name, mimeType, md5Checksum, "
+                                  "size, modifiedTime FROM files WHERE id=?", (file_id,))
+            return self.__RowToFile(cur.fetchone())
+
+    def GetPathById(self, file_id):
+        with self.lock:
+            row = self.db.execute("SELECT path FROM files WHERE id=?", (file_id,)).fetchone()
+            if row:
+                return row[0]
+            return None
+
+    def Store(self, path, f, parent=None):
+        if parent is None:
+            parents = f.get('parents')
+            parent = parents[0] if parents else 'root'
+
+        with self.lock:
+            self.__Insert(path, parent, f)
+            self.db.commit()
+
+    def StoreListing(self, parent, parent_path, file_list):
+        """
+        Record the complete content of a folder. Whatever was cached
+        for the folder before and isn't in the listing anymore is gone
+        on the remote too.
+        """
+        with self.lock:
+            self.db.execute("DELETE FROM files WHERE parent=?", (parent,))
+            for f in file_list or []:
+                self.__Insert(os.path.join(parent_path, f['name']), parent, f)
+            self.db.commit()
+
+    def StoreListings(self, listings):
+        """StoreListing for many (parent, parent_path, file_list) in one transaction."""
+        with self.lock:
+            for parent, parent_path, file_list in listings:
+                self.db.execute("DELETE FROM files WHERE parent=?", (parent,))
+                for f in file_list or []:
+                    self.__Insert(os.path.join(parent_path, f['name']), parent, f)
+            self.db.commit()
+
+    def MovePath(self, old_path, new_path):
+        """Rewrite the cached path of an object and of everything below it."""
+        first, end = self.__SubtreeRange(old_path)
+        with self.lock:
+            self.db.execute("UPDATE files SET path=? || substr(path, ?) "
+                            "WHERE path=? OR (path >= ? AND path < ?)",
+                            (new_path, len(old_path) + 1, old_path, first, end))
+            self.db.commit()
+
+    def InvalidatePath(self, path):
+        """Forget the object at path and, if it is a folder, all below it."""
+        if path == '':
+            self.Clear()
+            return
+
+        first, end = self.__SubtreeRange(path)
+        with self.lock:
+            self.db.execute("DELETE FROM files WHERE path=? OR (path >= ? AND path < ?)",
+                            (path, first, end))
+            self.db.commit()
+
+    def InvalidateId(self, file_id):
+        """Forget the object with file_id, wherever it is cached."""
+        path = self.GetPathById(file_id)
+        if path is not None:
+            self.InvalidatePath(path)
+
+    def Clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM files")
+            self.db.commit()
+
+    def Close(self):
+        with self.lock:
+            self.db.close()
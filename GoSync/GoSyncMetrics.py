@@ -0,0 +1,300 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time, bisect, threading
+from collections import OrderedDict
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+# Seconds, the upper bounds of the latency histogram buckets
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# The metrics endpoint is off unless a port is configured
+DEFAULT_METRICS_PORT = 0
+MIN_METRICS_PORT = 0
+MAX_METRICS_PORT = 65535
+METRICS_HOST = '127.0.0.1'
+
+# Seconds between two summary lines in the log, 0 turns them off
+DEFAULT_METRICS_LOG_INTERVAL = 300
+MIN_METRICS_LOG_INTERVAL = 0
+MAX_METRICS_LOG_INTERVAL = 24 * 60 * 60
+
+def RequestEndpoint(request):
+    """Name under which a googleapiclient request is counted, e.g. drive.files.list"""
+    endpoint = getattr(request, 'methodId', None) or 'other'
+    if 'alt=media' in (getattr(request, 'uri', None) or ''):
+        # Downloads share drive.files.get with metadata lookups
+        endpoint += '_media'
+    return endpoint
+
+
+class Histogram(object):
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The last one is for whatever is above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def Observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def Copy(self):
+        h = Histogram(self.buckets)
+        h.counts = list(self.counts)
+        h.sum = self.sum
+        h.count = self.count
+        return h
+
+    def Subtract(self, other):
+        """What was observed since other, an earlier copy of this histogram."""
+        h = self.Copy()
+        if other is not None:
+            h.counts = [a - b for a, b in zip(self.counts, other.counts)]
+            h.sum -= other.sum
+            h.count -= other.count
+        return h
+
+    def Quantile(self, q):
+        """Upper bound of the bucket holding the q quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency = Histogram()
+
+    def Copy(self):
+        s = EndpointStats()
+        s.__dict__.update(self.__dict__)
+        s.latency = self.latency.Copy()
+        return s
+
+
+class DriveMetrics(object):
+    """
+    Counters of the calls made to the drive, by endpoint (the method
+    id of the request, like drive.files.list): calls, errors, retries,
+    bytes moved and a latency histogram. Gauges are functions
+    returning the current value of something, like a queue depth,
+    registered under a name.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.gauges = OrderedDict()
+        self.last_summary = (time.time(), {})
+
+    def __Get(self, endpoint):
+        # Called with self.lock held
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = EndpointStats()
+        return stats
+
+    def Observe(self, endpoint, seconds, error=None):
+        with self.lock:
+            stats = self.__Get(endpoint)
+            stats.calls += 1
+            if error is not None:
+                stats.errors += 1
+            stats.latency.Observe(seconds)
+
+    def CountRetry(self, endpoint):
+        with self.lock:
+            self.__Get(endpoint).retries += 1
+
+    def CountBytes(self, endpoint, sent=0, received=0):
+        with self.lock:
+            stats = self.__Get(endpoint)
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+
+    def RegisterGauge(self, name, description, func):
+        with self.lock:
+            self.gauges[name] = (description, func)
+
+    def GetGauges(self):
+        with self.lock:
+            gauges = list(self.gauges.items())
+        values = OrderedDict()
+        for name, (description, func) in gauges:
+            try:
+                values[name] = func()
+            except Exception:
+                values[name] = 0
+        return values
+
+    def GetSnapshot(self):
+        with self.lock:
+            return dict((endpoint, stats.Copy()) for endpoint, stats in self.endpoints.items())
+
+    def FormatPrometheus(self):
+        """All metrics in the Prometheus text format."""
+        snapshot = self.GetSnapshot()
+        endpoints = sorted(snapshot)
+        lines = []
+
+        def Counter(name, description, attr):
+            lines.append('# HELP gosync_drive_%s %s' % (name, description))
+            lines.append('# TYPE gosync_drive_%s counter' % name)
+            for endpoint in endpoints:
+                lines.append('gosync_drive_%s{endpoint="%s"} %d'
+                             % (name, endpoint, getattr(snapshot[endpoint], attr)))
+
+        Counter('requests_total', 'Drive API calls, retries included.', 'calls')
+        Counter('errors_total', 'Drive API calls which failed.', 'errors')
+        Counter('retries_total', 'Drive API calls which were retried.', 'retries')
+        Counter('sent_bytes_total', 'File content uploaded.', 'bytes_sent')
+        Counter('received_bytes_total', 'File content downloaded.', 'bytes_received')
+
+        lines.append('# HELP gosync_drive_request_seconds Latency of Drive API calls.')
+        lines.append('# TYPE gosync_drive_request_seconds histogram')
+        for endpoint in endpoints:
+            h = snapshot[endpoint].latency
+            cumulative = 0
+            for bound, n in zip(h.buckets, h.counts):
+                cumulative += n
+                lines.append('gosync_drive_request_seconds_bucket{endpoint="%s",le="%g"} %d'
+                             % (endpoint, bound, cumulative))
+            lines.append('gosync_drive_request_seconds_bucket{endpoint="%s",le="+Inf"} %d'
+                         % (endpoint, h.count))
+            lines.append('gosync_drive_request_seconds_sum{endpoint="%s"} %f' % (endpoint, h.sum))
+            lines.append('gosync_drive_request_seconds_count{endpoint="%s"} %d' % (endpoint, h.count))
+
+        with self.lock:
+            descriptions = dict((name, d) for name, (d, f) in self.gauges.items())
+        for name, value in self.GetGauges().items():
+            lines.append('# HELP gosync_%s %s' % (name, descriptions[name]))
+            lines.append('# TYPE gosync_%s gauge' % name)
+            lines.append('gosync_%s %g' % (name, value))
+        return '\n'.join(lines) + '\n'
+
+    def FormatSummary(self):
+        """
+        One line about what happened since the last summary, None if
+        no call was made in between.
+        """
+        now = time.time()
+        snapshot = self.GetSnapshot()
+        with self.lock:
+            since, previous = self.last_summary
+            self.last_summary = (now, snapshot)
+
+        elapsed = max(now - since, 0.001)
+        parts = []
+        total_sent = total_received = 0
+        for endpoint in sorted(snapshot):
+            stats = snapshot[endpoint]
+            before = previous.get(endpoint) or EndpointStats()
+            calls = stats.calls - before.calls
+            if not calls:
+                continue
+            latency = stats.latency.Subtract(before.latency)
+            total_sent += stats.bytes_sent - before.bytes_sent
+            total_received += stats.bytes_received - before.bytes_received
+            parts.append("%s %d (%.2f/s, %d errors, %d retries, p50 %gs, p95 %gs)"
+                         % (endpoint, calls, calls / elapsed, stats.errors - before.errors,
+                            stats.retries - before.retries, latency.Quantile(0.5),
+                            latency.Quantile(0.95)))
+        if not parts:
+            return None
+
+        gauges = ", ".join("%s %g" % kv for kv in self.GetGauges().items())
+        return ("Drive calls in the last %ds: %s; up %.1f KB/s, down %.1f KB/s%s"
+                % (elapsed, "; ".join(parts), total_sent / elapsed / 1024.0,
+                   total_received / elapsed / 1024.0, "; " + gauges if gauges else ""))
+
+
+class MetricsLogger(object):
+    """Hands FormatSummary() to log(line) every interval seconds."""
+    def __init__(self, metrics, interval, log):
+        self.metrics = metrics
+        self.interval = interval
+        self.log = log
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.__Run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def __Run(self):
+        while not self.stopped.wait(self.interval):
+            line = self.metrics.FormatSummary()
+            if line:
+                self.log(line)
+
+    def Stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    """Serves FormatPrometheus() on http://127.0.0.1:<port>/metrics"""
+    def __init__(self, metrics, port, host=METRICS_HOST):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] not in ('/', '/metrics'):
+                    handler.send_error(404)
+                    return
+                body = metrics.FormatPrometheus().encode('utf-8')
+                handler.send_response(200)
+                handler.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def Stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
@@ -0,0 +1,126 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+GOOGLE_APPS_PREFIX = 'application/vnd.google-apps.'
+OTHERS_CATEGORY = 'Others'
+
+# Checked in this order, the first category a file matches wins.
+# The config can extend these or add new categories under
+# 'UsageCategories', using the same keys.
+DEFAULT_USAGE_CATEGORIES = [
+    ('Audio', {'mime_types': ['audio/mpeg', 'audio/x-mpeg-3', 'audio/mpeg3', 'audio/aiff',
+                              'audio/x-aiff', 'audio/m4a', 'audio/mp4', 'audio/flac', 'audio/mp3'],
+               'prefixes': ['audio/'],
+               'extensions': ['.mp3', '.m4a', '.flac', '.aiff', '.aif', '.wav', '.ogg',
+                              '.oga', '.opus', '.wma', '.aac']}),
+    ('Photo', {'mime_types': ['image/png', 'image/jpeg', 'image/jpg', 'image/tiff'],
+               'prefixes': ['image/'],
+               'extensions': ['.png', '.jpg', '.jpeg', '.tif', '.tiff', '.gif', '.bmp',
+                              '.webp', '.heic', '.raw', '.cr2', '.nef']}),
+    ('Movies', {'mime_types': ['video/mp4', 'video/x-msvideo', 'video/mpeg', 'video/flv',
+                               'video/quicktime'],
+                'prefixes': ['video/'],
+                'extensions': ['.mp4', '.avi', '.mpg', '.mpeg', '.flv', '.mov', '.mkv',
+                               '.webm', '.wmv', '.m4v']}),
+    ('Document', {'mime_types': ['application/powerpoint', 'application/mspowerpoint',
+                                 'application/x-mspowerpoint', 'application/pdf',
+                                 'application/x-dvi', 'application/msword',
+                                 'application/vnd.ms-powerpoint', 'application/vnd.ms-excel',
+                                 'application/rtf', 'application/vnd.oasis.opendocument.text',
+                                 'application/vnd.oasis.opendocument.spreadsheet',
+                                 'application/vnd.oasis.opendocument.presentation'],
+                  'prefixes': ['application/vnd.openxmlformats-officedocument.'],
+                  'extensions': ['.pdf', '.dvi', '.ppt', '.pptx', '.doc', '.docx', '.xls',
+                                 '.xlsx', '.odt', '.ods', '.odp', '.rtf']}),
+]
+
+class MimeClassifier(object):
+    """
+    Puts files into usage categories. Exact mime types are looked up
+    in a dict, then prefix rules (audio/, image/, ...) are tried. For
+    mime types matching neither (application/octet-stream and the
+    like) the file extension decides. Whatever matches nothing is
+    OTHERS_CATEGORY.
+    """
+    def __init__(self, extra_categories=None):
+        self.categories = []
+        rules = {}
+        for name, rule in DEFAULT_USAGE_CATEGORIES:
+            self.categories.append(name)
+            rules[name] = dict((k, list(v)) for k, v in rule.items())
+
+        for name, rule in (extra_categories or {}).items():
+            if name not in rules:
+                self.categories.append(name)
+                rules[name] = {'mime_types': [], 'prefixes': [], 'extensions': []}
+            for key in ('mime_types', 'prefixes', 'extensions'):
+                rules[name].setdefault(key, []).extend(rule.get(key, []))
+
+        self.by_mime_type = {}
+        self.by_extension = {}
+        self.prefixes = []
+        for name in self.categories:
+            rule = rules[name]
+            for mime_type in rule.get('mime_types', []):
+                self.by_mime_type.setdefault(mime_type.lower(), name)
+            for ext in rule.get('extensions', []):
+                ext = ext.lower()
+                if not ext.startswith('.'):
+                    ext = '.' + ext
+                self.by_extension.setdefault(ext, name)
+            for prefix in rule.get('prefixes', []):
+                self.prefixes.append((prefix.lower(), name))
+
+        # Longest prefix first, so specific rules beat broad ones
+        self.prefixes.sort(key=lambda p: -len(p[0]))
+        self.prefix_tuple = tuple(p for p, n in self.prefixes)
+        self.categories.append(OTHERS_CATEGORY)
+
+    def GetCategories(self):
+        return list(self.categories)
+
+    def IsGoogleDocument(self, mime_type):
+        """Google documents, sheets, ... have no content to download or count."""
+        return mime_type.startswith(GOOGLE_APPS_PREFIX) and mime_type != FOLDER_MIME_TYPE
+
+    def __ClassifyExtension(self, name):
+        dot = name.rfind('.')
+        if dot <= 0:
+            return None
+        return self.by_extension.get(name[dot:].lower())
+
+    def ClassifyMimeType(self, mime_type, name=''):
+        mime_type = mime_type.lower()
+        category = self.by_mime_type.get(mime_type)
+        if category is not None:
+            return category
+
+        if mime_type.startswith(self.prefix_tuple):
+            for prefix, category in self.prefixes:
+                if mime_type.startswith(prefix):
+                    return category
+
+        return self.__ClassifyExtension(name) or OTHERS_CATEGORY
+
+    def Classify(self, f):
+        """Usage category of a files().list() entry, None for google documents."""
+        mime_type = f.get('mimeType', '')
+        if self.IsGoogleDocument(mime_type):
+            return None
+        return self.ClassifyMimeType(mime_type, f.get('name', ''))
@@ -16,34 +16,49 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 #
 
-import sys, os, wx, ntpath, threading, hashlib, time, copy, io
+import sys, os, ntpath, threading, time, copy, glob
 import shutil
 if sys.version_info > (3,):
     long = int
-    import urllib.request
-else:
-    import urllib2
 
-from os.path import expanduser
 from watchdog.observers import Observer
 from watchdog.events import PatternMatchingEventHandler
-from threading import Thread
-from apiclient.errors import HttpError
-from apiclient import errors
-from apiclient.http import MediaFileUpload
-from apiclient.http import MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
 import logging
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 import json, pickle
+from collections import OrderedDict
 try :
 	from .GoSyncDriveTree import GoogleDriveTree
+	from .GoSyncTreeStore import DriveTreeStore
+	from .GoSyncMetadataCache import DriveMetadataCache
+	from .GoSyncHashCache import LocalHashCache
+	from .GoSyncWorkers import *
+	from .GoSyncExecutor import *
+	from .GoSyncConnectivity import ConnectivityMonitor
+	from .GoSyncMetrics import *
+	from .GoSyncUsageScan import DriveUsageScanner
+	from .GoSyncMimeClassifier import MimeClassifier
+	from .GoSyncUploadSessions import *
+	from .GoSyncLocalSnapshot import LocalSnapshot
+	from .GoSyncService import DriveServiceFactory
 	from .defines import *
 	from .GoSyncEvents import *
 	from .GoSyncUtils import *
 except (ImportError, ValueError):
 	from GoSyncDriveTree import GoogleDriveTree
+	from GoSyncTreeStore import DriveTreeStore
+	from GoSyncMetadataCache import DriveMetadataCache
+	from GoSyncHashCache import LocalHashCache
+	from GoSyncWorkers import *
+	from GoSyncExecutor import *
+	from GoSyncConnectivity import ConnectivityMonitor
+	from GoSyncMetrics import *
+	from GoSyncUsageScan import DriveUsageScanner
+	from GoSyncMimeClassifier import MimeClassifier
+	from GoSyncUploadSessions import *
+	from GoSyncLocalSnapshot import LocalSnapshot
+	from GoSyncService import DriveServiceFactory
 	from defines import *
 	from GoSyncEvents import *
 	from GoSyncUtils import *
@@ -77,27 +92,35 @@ class AuthenticationFailed(RuntimeError):
     """Failed to authenticate with google"""
 class InternetNotReachable(RuntimeError):
     """Failed to connect to the internet"""
-
-audio_file_mimelist = ['audio/mpeg', 'audio/x-mpeg-3', 'audio/mpeg3', 'audio/aiff', 'audio/x-aiff', 'audio/m4a', 'audio/mp4', 'audio/flac', 'audio/mp3']
-movie_file_mimelist = ['video/mp4', 'video/x-msvideo', 'video/mpeg', 'video/flv', 'video/quicktime']
-image_file_mimelist = ['image/png', 'image/jpeg', 'image/jpg', 'image/tiff']
-document_file_mimelist = ['application/powerpoint', 'applciation/mspowerpoint', \
-                              'application/x-mspowerpoint', 'application/pdf', \
-                              'application/x-dvi']
-google_docs_mimelist = ['application/vnd.google-apps.spreadsheet', \
-                            'application/vnd.google-apps.sites', \
-                            'application/vnd.google-apps.script', \
-                            'application/vnd.google-apps.presentation', \
-                            'application/vnd.google-apps.fusiontable', \
-                            'application/vnd.google-apps.form', \
-                            'application/vnd.google-apps.drawing', \
-                            'application/vnd.google-apps.document', \
-                            'application/vnd.google-apps.map']
+class ChangesTokenLost(RuntimeError):
+    """The saved start page token of the changes feed is not valid anymore"""
+class UploadInterrupted(RuntimeError):
+    """GoSync is shutting down. The upload resumes on the next start"""
+class AccountChanged(RuntimeError):
+    """Logged in to another account than the one of the last run"""
+
+# Attribute holding the total of each usage category. Categories
+# added in the config are shown as part of Others.
+usage_category_attrs = {'Audio': 'driveAudioUsage',
+                        'Photo': 'drivePhotoUsage',
+                        'Movies': 'driveMoviesUsage',
+                        'Document': 'driveDocumentUsage',
+                        'Others': 'driveOthersUsage'}
 
 Default_Log_Level = 3
 
 class GoSyncModel(object):
-    def __init__(self):
+    """
+    The sync engine. It doesn't talk to the user: whatever goes wrong
+    while syncing is posted as GOSYNC_EVENT_SYNC_ERROR, and questions
+    asked while starting up go to prompts, an object with
+    AskChooseCredentialsFile() and AskCredentialFile(). Without prompts
+    nothing is asked, the way the daemon runs.
+    """
+    def __init__(self, prompts=None):
+        self.prompts = prompts
+        self.startup_times = OrderedDict()
+        self.startup_mark = time.time()
         self.calculatingDriveUsage = False
         self.driveAudioUsage = 0
         self.driveMoviesUsage = 0
@@ -117,6 +140,32 @@ class GoSyncModel(object):
         self.sync_interval = 1800
         self.shutting_down = False
         self.use_system_notif = True
+        self.change_feed_sync = True
+        self.changes_token = None
+        self.root_folder_id = None
+        self.download_workers = DEFAULT_DOWNLOAD_WORKERS
+        self.download_pool = None
+        self.batcher = None
+        self.executor = None
+        self.connectivity = ConnectivityMonitor(on_change=self.OnConnectivityChange)
+        self.metrics = DriveMetrics()
+        self.metrics_port = DEFAULT_METRICS_PORT
+        self.metrics_log_interval = DEFAULT_METRICS_LOG_INTERVAL
+        self.metrics_server = None
+        self.metrics_logger = None
+        self.requests_per_second = DEFAULT_REQUESTS_PER_SECOND
+        self.bulk_usage_scan = True
+        self.usage_categories = {}
+        self.mime_classifier = MimeClassifier()
+        self.usage_lock = threading.Lock()
+        self.usage_changed = False
+        self.upload_workers = DEFAULT_UPLOAD_WORKERS
+        self.upload_queue = None
+        self.event_aggregator = None
+        self.observer_quiet_window = DEFAULT_QUIET_WINDOW
+        self.upload_chunk_size = DEFAULT_UPLOAD_CHUNK_SIZE
+        self.download_chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE
+        self.download_connections = DEFAULT_DOWNLOAD_CONNECTIONS
 
         self.config_path = os.path.join(os.environ['HOME'], ".gosync")
         self.credential_file = os.path.join(self.config_path, "credentials.json")
@@ -144,6 +193,7 @@ class GoSyncModel(object):
 
         if not os.path.exists(self.config_path):
             os.mkdir(self.config_path, 0o0755)
+        self.service_factory = DriveServiceFactory(self.config_path, self.SendlToLog)
 
         if not os.path.exists(self.credential_file):
         #check if Credentials.json file exists
@@ -171,18 +221,50 @@ class GoSyncModel(object):
 
         self.SendlToLog(2, "Initialize - starting oberserver")
         self.observer = Observer()
-        self.SendlToLog(2, "Initialize - Going for authentication")
-        self.DoAuthenticate()
-        self.about_drive = self.drive.about().get(fields='user, storageQuota').execute()
+        self.is_logged_in = False
+        self.executor = RequestExecutor(self, self.requests_per_second, self.connectivity,
+                                        self.metrics)
+        self.MarkStartupPhase('local setup')
+
+        # The account of the last run is good enough to show the window
+        # and open the local stores. Logging in and asking the drive
+        # happen in the background, see SetTheBallRolling.
+        about = self.LoadCachedAccountInfo()
+        if about is None:
+            self.SendlToLog(2, "Initialize - No cached account. Going for authentication")
+            self.DoAuthenticate()
+            self.MarkStartupPhase('authenticate')
+            about = self.FetchAccountInfo()
+            self.MarkStartupPhase('account info')
+        self.about_drive = about
         self.SendlToLog(2,"Initialize - Completed Drive Quota Execution")
 
         self.user_email = self.about_drive['user']['emailAddress']
         self.SendlToLog(3,"Initialize - Completed Account Information Load")
 
         self.tree_pickle_file = os.path.join(self.config_path, 'gtree-' + self.user_email + '.pick')
+        self.tree_store_file = os.path.join(self.config_path, 'gtree-' + self.user_email + '.db')
+        self.changes_token_file = os.path.join(self.config_path, 'changes-' + self.user_email + '.token')
+        self.changes_token = self.LoadChangesToken()
 
         self.SendlToLog(3, "Initialize - Loaded tree pickle")
 
+        self.metadata_cache = DriveMetadataCache(os.path.join(self.config_path,
+                                                              'meta-' + self.user_email + '.db'))
+        self.SendlToLog(3, "Initialize - Opened remote metadata cache")
+
+        self.hash_cache = LocalHashCache(os.path.join(self.config_path, 'hashcache.db'))
+        self.SendlToLog(3, "Initialize - Opened local hash cache")
+
+        self.upload_sessions = UploadSessionStore(os.path.join(self.config_path,
+                                                               'uploads-' + self.user_email + '.db'))
+        self.SendlToLog(3, "Initialize - Opened upload sessions")
+
+        self.local_snapshot = LocalSnapshot(os.path.join(self.config_path,
+                                                         'local-' + self.user_email + '.db'),
+                                            IsTempFile)
+        self.SendlToLog(3, "Initialize - Opened local snapshot")
+
         if not os.path.exists(self.config_file):
             self.SendlToLog(3, "Initialize - Creating default config file")
             self.CreateDefaultConfigFile()
@@ -208,11 +290,15 @@ class GoSyncModel(object):
             self.SendlToLog(2, "Initialize - Exception during configuration load")
             raise
 
+        if self.is_logged_in:
+            # First run, the account isn't cached yet
+            self.SaveAccountInfo()
         self.SendlToLog(3,"Initialize - Completed Config File Load")
 
-
-#todo : confirm this is to monitor file changes
-        self.iobserv_handle = self.observer.schedule(FileModificationNotifyHandler(self), self.mirror_directory, recursive=True)
+        self.iobserv_handle = None
+        self.startup_thread = None
+        self.startup_lock = threading.Lock()
+        self.threads_started = False
         self.sync_lock = threading.Lock()
         self.sync_thread = threading.Thread(target=self.run)
         self.usage_calc_thread = threading.Thread(target=self.calculateUsage)
@@ -223,19 +309,68 @@ class GoSyncModel(object):
         self.usageCalculateEvent = threading.Event()
         self.usageCalculateEvent.set()
 
-        if not os.path.exists(self.tree_pickle_file):
-            self.driveTree = GoogleDriveTree()
-            #Until driveTree is present, GoSync cannot autostart.
-            self.can_autostart = False
-        else:
-            try:
-                self.driveTree = pickle.load(open(self.tree_pickle_file, "rb"))
-            except:
-                self.driveTree = GoogleDriveTree()
-                self.can_autostart = False
+        self.tree_store = DriveTreeStore(self.tree_store_file)
+        # The tree is read from the store the first time it is used
+        self.driveTree = GoogleDriveTree(self.tree_store)
         self.SendlToLog(3,"Initialize - Completed GoogleDriveTree File")
+        self.MarkStartupPhase('open stores')
         self.SendlToLog(3,"Initialize - Completed Initialize")
 
+    def MarkStartupPhase(self, phase):
+        """Records how long phase of the startup took, i.e. the time since the last mark."""
+        now = time.time()
+        self.startup_times[phase] = now - self.startup_mark
+        self.startup_mark = now
+        self.SendlToLog(2, "Startup - %s took %.3fs" % (phase, self.startup_times[phase]))
+
+    def GetStartupTimes(self):
+        """The startup phases so far and how long each took, in seconds."""
+        return OrderedDict(self.startup_times)
+
+    def FormatStartupTimes(self):
+        times = self.GetStartupTimes()
+        lines = ["Startup phases:"]
+        lines.extend("    %-16s %8.3fs" % (phase, seconds) for phase, seconds in times.items())
+        lines.append("    %-16s %8.3fs" % ('total', sum(times.values())))
+        return '\n'.join(lines) + '\n'
+
+    def LoadCachedAccountInfo(self):
+        """The user and quota saved by the last run, None if there is none."""
+        try:
+            with open(self.config_file, 'r') as f:
+                config = json.load(f)
+            for account in config.values():
+                about = account.get('About')
+                if about and about['user']['emailAddress']:
+                    return about
+        except Exception:
+            pass
+        return None
+
+    def FetchAccountInfo(self):
+        return self.executor.Execute(self.drive.about().get(fields='user, storageQuota'))
+
+    def SaveAccountInfo(self):
+        self.config_dict['About'] = self.about_drive
+        self.SaveConfig()
+
+    def MigrateTreePickle(self):
+        # Older versions pickled the whole tree after every scan. Move it
+        # into the store once and get rid of the pickle.
+        try:
+            tree = pickle.load(open(self.tree_pickle_file, "rb"))
+            tree.SaveToStore(self.tree_store)
+            self.tree_store.SetComplete(True)
+            self.SendlToLog(2, "Initialize - Migrated %s to %s" % (self.tree_pickle_file, self.tree_store_file))
+        except:
+            self.tree_store.Clear()
+            self.SendlToLog(1, "Initialize - Failed to migrate %s. Drive will be rescanned." % self.tree_pickle_file)
+
+        try:
+            os.remove(self.tree_pickle_file)
+        except OSError:
+            pass
+
 # Sends Log Level Message to Log File
 # Depends on Log_Level constant
     def SendlToLog(self, LogType, LogMsg):
@@ -248,33 +383,163 @@ class GoSyncModel(object):
                 self.logger.error(LogMsg)
 
     def SetTheBallRolling(self):
-        #if we can autostart and user has selected autostart
-        #then auto start the sync
-        if self.can_autostart and self.auto_start_sync:
-            self.SendlToLog(2, "SetTheBallRolling: Starting sync")
-            self.StartSync()
-        else:
-            self.StopSync()
+        """
+        Returns right away. Whatever needs the drive or walks the mirror
+        is done by the startup thread, GOSYNC_EVENT_READY is posted
+        once sync can run.
+        """
+        self.upload_queue = UploadQueue(self, self.upload_workers)
+        self.batcher = DriveBatcher(self)
+        self.event_aggregator = LocalEventAggregator(self, self.observer_quiet_window)
+        self.StartMetrics()
+        self.startup_thread = threading.Thread(target=self.StartInBackground)
+        self.startup_thread.daemon = True
+        self.startup_thread.start()
+
+    def StartInBackground(self):
+        try:
+            if not self.is_logged_in:
+                self.SendlToLog(2, "StartInBackground: Going for authentication")
+                self.DoAuthenticate()
+                self.MarkStartupPhase('authenticate')
+                self.RefreshAccountInfo()
+                self.MarkStartupPhase('account info')
+
+            if os.path.exists(self.tree_pickle_file):
+                self.MigrateTreePickle()
+            if not self.tree_store.IsComplete():
+                #Until driveTree is present, GoSync cannot autostart.
+                self.can_autostart = False
+            self.MarkStartupPhase('tree')
+
+            self.ResumePendingUploads()
+            self.MarkStartupPhase('resume uploads')
+
+            #todo : confirm this is to monitor file changes
+            self.iobserv_handle = self.observer.schedule(FileModificationNotifyHandler(self),
+                                                         self.mirror_directory, recursive=True)
+            self.MarkStartupPhase('observer')
+        except AuthenticationFailed:
+            self.ReportError('Information', "Authentication Rejected!\n")
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_READY, -1)
+            return
+        except AccountChanged:
+            self.ReportError('Information', "Logged in to %s.\nRestart GoSync to sync this account.\n"
+                             % self.user_email)
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_READY, -1)
+            return
+        except Exception as e:
+            self.SendlToLog(1, "StartInBackground: Startup failed: %s" % e)
+            self.ReportError('Error', "GoSync failed to initialize\n")
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_READY, -1)
+            return
+
+        with self.startup_lock:
+            if self.shutting_down:
+                return
+            #if we can autostart and user has selected autostart
+            #then auto start the sync
+            if self.can_autostart and self.auto_start_sync:
+                self.SendlToLog(2, "SetTheBallRolling: Starting sync")
+                self.StartSync()
+            self.sync_thread.start()
+            self.usage_calc_thread.start()
+            self.observer.start()
+            self.threads_started = True
+
+        self.SendlToLog(2, "Startup - Ready after %.3fs" % sum(self.startup_times.values()))
+        GoSyncEventController().PostEvent(GOSYNC_EVENT_READY, 0)
+
+    def RefreshAccountInfo(self):
+        """Replaces the cached user and quota with what the drive says now."""
+        about = self.FetchAccountInfo()
+        if about['user']['emailAddress'] != self.user_email:
+            # The token is for another account than the cached one.
+            # Everything opened so far belongs to the cached one.
+            self.SendlToLog(1, "RefreshAccountInfo: Logged in as %s instead of %s"
+                            % (about['user']['emailAddress'], self.user_email))
+            self.config_dict = {'About': about}
+            self.user_email = about['user']['emailAddress']
+            self.SaveConfig()
+            raise AccountChanged()
 
-        self.sync_thread.start()
-        self.usage_calc_thread.start()
-        self.observer.start()
+        self.about_drive = about
+        self.SaveAccountInfo()
+        GoSyncEventController().PostEvent(GOSYNC_EVENT_ACCOUNT_UPDATE, about)
 
     def StopTheShow(self):
-        self.shutting_down = True
+        with self.startup_lock:
+            self.shutting_down = True
+            threads_started = self.threads_started
         self.observer.unschedule_all()
+        if self.event_aggregator:
+            self.event_aggregator.Close()
+        if self.upload_queue:
+            self.upload_queue.Close()
+        if self.batcher:
+            self.batcher.Close()
+        self.StopMetrics()
         # Wakeup the threads if they are sleeping
         # so that they can exit
         self.usageCalculateEvent.set()
-        self.sync_thread.join()
-        self.usage_calc_thread.join()
+        self.syncRunning.set()
+        self.connectivity.Wake()
+        if threads_started:
+            self.sync_thread.join()
+            self.usage_calc_thread.join()
+        self.SaveDriveUsage()
+
+    def RegisterGauges(self):
+        def Count(obj, method):
+            return lambda: getattr(obj(), method)() if obj() else 0
+
+        self.metrics.RegisterGauge('upload_queue_depth', "Files waiting to be uploaded or being uploaded.",
+                                   Count(lambda: self.upload_queue, 'GetPendingCount'))
+        self.metrics.RegisterGauge('uploads_active', "Files being uploaded.",
+                                   Count(lambda: self.upload_queue, 'GetActiveCount'))
+        self.metrics.RegisterGauge('download_queue_depth', "Files waiting to be downloaded.",
+                                   Count(lambda: self.download_pool, 'GetPendingCount'))
+        self.metrics.RegisterGauge('downloads_active', "Files being downloaded.",
+                                   Count(lambda: self.download_pool, 'GetActiveCount'))
+        self.metrics.RegisterGauge('batch_queue_depth', "Renames, moves and trashes not sent yet.",
+                                   Count(lambda: self.batcher, 'GetPendingCount'))
+        self.metrics.RegisterGauge('observer_pending', "Local changes waiting to settle.",
+                                   Count(lambda: self.event_aggregator, 'GetPendingCount'))
+        self.metrics.RegisterGauge('connectivity_probes', "Probes sent to check the drive is reachable.",
+                                   lambda: self.connectivity.GetStats()['probes'])
+        self.metrics.RegisterGauge('connectivity_went_offline', "Times the network was found down.",
+                                   lambda: self.connectivity.GetStats()['went_offline'])
+
+    def StartMetrics(self):
+        self.RegisterGauges()
+        if self.metrics_log_interval:
+            self.metrics_logger = MetricsLogger(self.metrics, self.metrics_log_interval,
+                                                lambda line: self.SendlToLog(2, line))
+        if self.metrics_port:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, self.metrics_port)
+                self.SendlToLog(2, "StartMetrics: Serving metrics on http://%s:%d/metrics"
+                                % (METRICS_HOST, self.metrics_server.port))
+            except (IOError, OSError) as e:
+                self.SendlToLog(1, "StartMetrics: Can't serve metrics on port %d: %s"
+                                % (self.metrics_port, e))
+
+    def StopMetrics(self):
+        if self.metrics_logger:
+            self.metrics_logger.Stop()
+            self.metrics_logger = None
+        if self.metrics_server:
+            self.metrics_server.Stop()
+            self.metrics_server = None
 
     def IsUserLoggedIn(self):
         return self.is_logged_in
 
     def HashOfFile(self, abs_filepath):
-        data = open(abs_filepath, "rb").read()
-        return hashlib.md5(data).hexdigest()
+        return self.hash_cache.GetHash(abs_filepath, Md5OfFile)
+
+    def InvalidateLocalHash(self, abs_filepath):
+        self.hash_cache.Invalidate(abs_filepath)
 
     def CreateDefaultConfigFile(self):
         f = open(self.config_file, 'w')
@@ -284,6 +549,18 @@ class GoSyncModel(object):
         self.config_dict['UseSystemNotif'] = True
         self.config_dict['BaseMirrorDirectory'] = self.base_mirror_directory
         self.config_dict['LogLevel'] = Default_Log_Level
+        self.config_dict['ChangeFeedSync'] = True
+        self.config_dict['DownloadWorkers'] = DEFAULT_DOWNLOAD_WORKERS
+        self.config_dict['UploadWorkers'] = DEFAULT_UPLOAD_WORKERS
+        self.config_dict['RequestsPerSecond'] = DEFAULT_REQUESTS_PER_SECOND
+        self.config_dict['BulkUsageScan'] = True
+        self.config_dict['UsageCategories'] = {}
+        self.config_dict['ObserverQuietWindow'] = DEFAULT_QUIET_WINDOW
+        self.config_dict['UploadChunkSize'] = DEFAULT_UPLOAD_CHUNK_SIZE
+        self.config_dict['DownloadChunkSize'] = DEFAULT_DOWNLOAD_CHUNK_SIZE
+        self.config_dict['DownloadConnections'] = DEFAULT_DOWNLOAD_CONNECTIONS
+        self.config_dict['MetricsPort'] = DEFAULT_METRICS_PORT
+        self.config_dict['MetricsLogInterval'] = DEFAULT_METRICS_LOG_INTERVAL
         self.account_dict[self.user_email] = self.config_dict
         json.dump(self.account_dict, f)
         f.close()
@@ -332,6 +609,82 @@ class GoSyncModel(object):
                             self.SendlToLog(2, "LoadConfig: Autostart is enabled")
                         else:
                             self.SendlToLog(2, "LoadConfig: Autostart is disabled")
+
+                    self.change_feed_sync = self.config_dict.get('ChangeFeedSync', True)
+                    self.SendlToLog(2, "LoadConfig: Change feed sync is %s" %
+                                    ("enabled" if self.change_feed_sync else "disabled"))
+
+                    self.download_workers = self.config_dict.get('DownloadWorkers', DEFAULT_DOWNLOAD_WORKERS)
+                    if self.download_workers < MIN_DOWNLOAD_WORKERS or self.download_workers > MAX_DOWNLOAD_WORKERS:
+                        self.SendlToLog(3, "LoadConfig: Setting download workers to default value")
+                        self.download_workers = DEFAULT_DOWNLOAD_WORKERS
+                    self.SendlToLog(3, "Download Workers: %d" % self.download_workers)
+
+                    self.upload_workers = self.config_dict.get('UploadWorkers', DEFAULT_UPLOAD_WORKERS)
+                    if self.upload_workers < MIN_UPLOAD_WORKERS or self.upload_workers > MAX_UPLOAD_WORKERS:
+                        self.SendlToLog(3, "LoadConfig: Setting upload workers to default value")
+                        self.upload_workers = DEFAULT_UPLOAD_WORKERS
+                    self.SendlToLog(3, "Upload Workers: %d" % self.upload_workers)
+
+                    self.requests_per_second = self.config_dict.get('RequestsPerSecond', DEFAULT_REQUESTS_PER_SECOND)
+                    if self.requests_per_second < MIN_REQUESTS_PER_SECOND or \
+                       self.requests_per_second > MAX_REQUESTS_PER_SECOND:
+                        self.SendlToLog(3, "LoadConfig: Setting requests per second to default value")
+                        self.requests_per_second = DEFAULT_REQUESTS_PER_SECOND
+                    self.executor.SetRate(self.requests_per_second)
+                    self.SendlToLog(3, "Requests per second: %d" % self.requests_per_second)
+
+                    self.bulk_usage_scan = self.config_dict.get('BulkUsageScan', True)
+
+                    self.usage_categories = self.config_dict.get('UsageCategories', {})
+                    try:
+                        self.mime_classifier = MimeClassifier(self.usage_categories)
+                    except:
+                        self.SendlToLog(1, "LoadConfig: Invalid UsageCategories, using the default categories")
+                        self.usage_categories = {}
+                        self.mime_classifier = MimeClassifier()
+
+                    self.observer_quiet_window = self.config_dict.get('ObserverQuietWindow', DEFAULT_QUIET_WINDOW)
+                    if self.observer_quiet_window < MIN_QUIET_WINDOW or \
+                       self.observer_quiet_window > MAX_QUIET_WINDOW:
+                        self.SendlToLog(3, "LoadConfig: Setting observer quiet window to default value")
+                        self.observer_quiet_window = DEFAULT_QUIET_WINDOW
+                    self.SendlToLog(3, "Observer quiet window: %.1f seconds" % self.observer_quiet_window)
+
+                    self.upload_chunk_size = self.config_dict.get('UploadChunkSize', DEFAULT_UPLOAD_CHUNK_SIZE)
+                    if self.upload_chunk_size < MIN_UPLOAD_CHUNK_SIZE or \
+                       self.upload_chunk_size > MAX_UPLOAD_CHUNK_SIZE:
+                        self.SendlToLog(3, "LoadConfig: Setting upload chunk size to default value")
+                        self.upload_chunk_size = DEFAULT_UPLOAD_CHUNK_SIZE
+                    self.upload_chunk_size -= self.upload_chunk_size % UPLOAD_CHUNK_ALIGN
+                    self.SendlToLog(3, "Upload chunk size: %d bytes" % self.upload_chunk_size)
+
+                    self.download_chunk_size = self.config_dict.get('DownloadChunkSize', DEFAULT_DOWNLOAD_CHUNK_SIZE)
+                    if self.download_chunk_size < MIN_DOWNLOAD_CHUNK_SIZE or \
+                       self.download_chunk_size > MAX_DOWNLOAD_CHUNK_SIZE:
+                        self.SendlToLog(3, "LoadConfig: Setting download chunk size to default value")
+                        self.download_chunk_size = DEFAULT_DOWNLOAD_CHUNK_SIZE
+                    self.SendlToLog(3, "Download chunk size: %d bytes" % self.download_chunk_size)
+
+                    self.download_connections = self.config_dict.get('DownloadConnections', DEFAULT_DOWNLOAD_CONNECTIONS)
+                    if self.download_connections < MIN_DOWNLOAD_CONNECTIONS or \
+                       self.download_connections > MAX_DOWNLOAD_CONNECTIONS:
+                        self.SendlToLog(3, "LoadConfig: Setting download connections to default value")
+                        self.download_connections = DEFAULT_DOWNLOAD_CONNECTIONS
+                    self.SendlToLog(3, "Download connections per large file: %d" % self.download_connections)
+
+                    self.metrics_port = self.config_dict.get('MetricsPort', DEFAULT_METRICS_PORT)
+                    if self.metrics_port < MIN_METRICS_PORT or self.metrics_port > MAX_METRICS_PORT:
+                        self.SendlToLog(3, "LoadConfig: Setting metrics port to default value")
+                        self.metrics_port = DEFAULT_METRICS_PORT
+                    self.SendlToLog(3, "Metrics port: %d" % self.metrics_port)
+
+                    self.metrics_log_interval = self.config_dict.get('MetricsLogInterval', DEFAULT_METRICS_LOG_INTERVAL)
+                    if self.metrics_log_interval < MIN_METRICS_LOG_INTERVAL or \
+                       self.metrics_log_interval > MAX_METRICS_LOG_INTERVAL:
+                        self.SendlToLog(3, "LoadConfig: Setting metrics log interval to default value")
+                        self.metrics_log_interval = DEFAULT_METRICS_LOG_INTERVAL
+                    self.SendlToLog(3, "Metrics log interval: %d seconds" % self.metrics_log_interval)
                     try:
                         self.drive_usage_dict = self.config_dict['Drive Usage']
                         #self.totalFilesToCheck = self.drive_usage_dict['Total Files']
@@ -365,6 +718,18 @@ class GoSyncModel(object):
         self.config_dict['SyncInterval'] = self.sync_interval
         self.config_dict['UseSystemNotif'] = self.use_system_notif
         self.config_dict['LogLevel'] = self.Log_Level
+        self.config_dict['ChangeFeedSync'] = self.change_feed_sync
+        self.config_dict['DownloadWorkers'] = self.download_workers
+        self.config_dict['UploadWorkers'] = self.upload_workers
+        self.config_dict['RequestsPerSecond'] = self.requests_per_second
+        self.config_dict['BulkUsageScan'] = self.bulk_usage_scan
+        self.config_dict['UsageCategories'] = self.usage_categories
+        self.config_dict['ObserverQuietWindow'] = self.observer_quiet_window
+        self.config_dict['UploadChunkSize'] = self.upload_chunk_size
+        self.config_dict['DownloadChunkSize'] = self.download_chunk_size
+        self.config_dict['DownloadConnections'] = self.download_connections
+        self.config_dict['MetricsPort'] = self.metrics_port
+        self.config_dict['MetricsLogInterval'] = self.metrics_log_interval
         if not self.sync_selection:
             self.config_dict['Sync Selection'] = [['root', '']]
 
@@ -374,32 +739,33 @@ class GoSyncModel(object):
         f.close()
 
     def AskChooseCredentialsFile(self):
-        dial = wx.MessageDialog(None, 'No Credentials file was found!\n\nDo you want to load one?\n',
-                                'Error', wx.YES_NO | wx.ICON_EXCLAMATION)
-        res = dial.ShowModal()
-        if res == wx.ID_YES:
-            return True
-        else:
-            return false
+        if self.prompts is None:
+            self.SendlToLog(1, "Initialize - Copy your credentials file to %s" % self.credential_file)
+            return False
+        return bool(self.prompts.AskChooseCredentialsFile())
 
 
     def getCredentialFile(self):
         # ask for the Credential file and save it in Config directory then return True
-        defDir, defFile = '', ''
-        dlg = wx.FileDialog(None,
-               'Load Credential File',
-                 '~', 'Credentials.json',
-                 'json files (*.json)|*.json',
-                 wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
-        if dlg.ShowModal() == wx.ID_CANCEL:
+        path = self.prompts.AskCredentialFile() if self.prompts else None
+        if not path:
             return False
         try:
-            shutil.copy(dlg.GetPath(), self.credential_file)
+            shutil.copy(path, self.credential_file)
             return True
         except:
             return False
 
+    def ReportError(self, title, message):
+        """Tells whoever listens, the GUI or the daemon, that something went wrong."""
+        GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_ERROR,
+                                          {'title': title, 'message': message})
+
     def DoAuthenticate(self):
+        # Only needed here. Importing them takes a while and isn't
+        # done until the window is up.
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
         try:
             # If modifying these scopes, delete the file token.pickle.
             SCOPES = ['https://www.googleapis.com/auth/drive']
@@ -435,30 +801,30 @@ class GoSyncModel(object):
 
             self.SendlToLog(2, "Authenticate - Building service")
             try:
-                service = build('drive', 'v3', credentials=creds)
+                service = self.service_factory.Build(creds)
                 self.SendlToLog(2, "Authenticate - service built successfully!")
             except:
                 self.SendlToLog(2, "Authenticate - service built failed. Going for re-authentication")
                 try:
                     flow = InstalledAppFlow.from_client_secrets_file(self.credential_file, SCOPES)
                     creds = flow.run_local_server(port=0)
-                    service = build('drive', 'v3', credentials=creds)
+                    service = self.service_factory.Build(creds)
                 except:
                     raise AuthenticationFailed()
 
+            self.creds = creds
             self.drive = service
             self.is_logged_in = True
             return service
         except:
-            dial = wx.MessageDialog(None, "Authentication Rejected!\n",
-                                    'Information', wx.ID_OK | wx.ICON_EXCLAMATION)
-            dial.ShowModal()
+            self.SendlToLog(1, "Authenticate - Authentication rejected")
             self.is_logged_in = False
-            pass
+            raise AuthenticationFailed()
 
     def DoUnAuthenticate(self):
             self.do_sync = False
-            self.observer.unschedule(self.iobserv_handle)
+            if self.iobserv_handle:
+                self.observer.unschedule(self.iobserv_handle)
             self.iobserv_handle = None
             os.remove(self.credential_file)
             self.is_logged_in = False
@@ -466,6 +832,13 @@ class GoSyncModel(object):
     def DriveInfo(self):
         return self.about_drive
 
+    def GetThreadHttp(self):
+        """
+        httplib2 is not thread safe. Every thread talking to the drive
+        gets its own authorized connection.
+        """
+        return self.service_factory.GetThreadHttp()
+
     def PathLeaf(self, path):
         head, tail = ntpath.split(path)
         return tail or ntpath.basename(head)
@@ -475,7 +848,9 @@ class GoSyncModel(object):
         file_metadata = {'name': dirname,
                         'mimeType':'application/vnd.google-apps.folder'}
         file_metadata['parents'] = [parent_id]
-        upfile = self.drive.files().create(body=file_metadata, fields='id').execute()
+        upfile = self.executor.Execute(self.drive.files().create(body=file_metadata,
+                                                                 fields='id, name, mimeType, parents, modifiedTime'))
+        return upfile
 
     def CreateDirectoryByPath(self, dirpath):
         self.SendlToLog(3,"create directory: %s\n" % dirpath)
@@ -488,35 +863,195 @@ class GoSyncModel(object):
             return
         except FolderNotFound:
             if basepath == '':
-                self.CreateDirectoryInParent(dirname)
+                nf = self.CreateDirectoryInParent(dirname)
+                self.metadata_cache.Store(drivepath, nf, 'root')
             else:
                 try:
                     parent_folder = self.LocateFolderOnDrive(basepath)
-                    self.CreateDirectoryInParent(dirname, parent_folder['id'])
+                    nf = self.CreateDirectoryInParent(dirname, parent_folder['id'])
+                    self.metadata_cache.Store(drivepath, nf, parent_folder['id'])
                 except:
                     errorMsg = "Failed to locate directory path %s on drive.\n" % basepath
                     self.SendlToLog(1,errorMsg)
-                    dial = wx.MessageDialog(None, errorMsg, 'Directory Not Found',
-                                            wx.ID_OK | wx.ICON_EXCLAMATION)
-                    dial.ShowModal()
+                    self.ReportError('Directory Not Found', errorMsg)
                     return
         except FileListQueryFailed:
             errorMsg = "Server Query Failed!\n"
             self.SendlToLog(1,errorMsg)
-            dial = wx.MessageDialog(None, errorMsg, 'Directory Not Found',
-                                    wx.ID_OK | wx.ICON_EXCLAMATION)
-            dial.ShowModal()
+            self.ReportError('Directory Not Found', errorMsg)
             return
 
+    def WaitForInternet(self):
+        """Returns once the internet is reachable, False if GoSync is shutting down first."""
+        return self.connectivity.WaitOnline(lambda: self.shutting_down)
+
+    def OnConnectivityChange(self, online):
+        if online:
+            self.SendlToLog(2, "Connectivity - Network is up!")
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 0)
+        else:
+            self.SendlToLog(1, "Connectivity - Network is down!")
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 1)
+
+    def UploadMedia(self, file_path, target, make_request):
+        """
+        Uploads the content of file_path with the request returned by
+        make_request(media), one chunk of upload_chunk_size at a time.
+        The upload session is saved after every chunk. An upload cut
+        off by a network failure carries on once the internet is back,
+        one cut off by a restart carries on from the saved session.
+        target identifies what the upload is for, a session is only
+        reused for the same target and the same local content.
+        """
+        rel_path = self.GetRelativeFolder(file_path, True)
+        st = os.stat(file_path)
+        session = self.upload_sessions.Get(file_path)
+        if session and (session['target'] != target or session['size'] != st.st_size or
+                        session['mtime'] != st.st_mtime):
+            self.upload_sessions.Remove(file_path)
+            session = None
+
+        while True:
+            media = MediaFileUpload(file_path, chunksize=self.upload_chunk_size, resumable=True)
+            request = make_request(media)
+            saved = False
+            if session:
+                self.SendlToLog(2, "UploadMedia: Resuming upload of %s after %d bytes"
+                                % (rel_path, session['offset']))
+                request.resumable_uri = session['uri']
+                request.resumable_progress = session['offset']
+                saved = True
+
+            http = self.GetThreadHttp()
+            response = None
+            stalls = 0
+            # The saved offset may be behind what the drive got
+            query = session is not None
+            try:
+                while response is None:
+                    if self.shutting_down:
+                        raise UploadInterrupted()
+                    try:
+                        if query:
+                            offset, response = self.executor.Call(
+                                lambda: self.QueryUploadOffset(request, st.st_size, http),
+                                "Upload status %s" % rel_path, endpoint=request.methodId)
+                            request.resumable_progress = offset
+                            query = False
+                            continue
+                        sent = request.resumable_progress
+                        status, response = self.executor.Call(lambda: request.next_chunk(http=http),
+                                                              "Upload %s" % rel_path,
+                                                              endpoint=request.methodId)
+                        sent = (status.resumable_progress if status else st.st_size) - sent
+                        self.metrics.CountBytes(request.methodId, sent=max(0, sent))
+                    except Exception as e:
+                        retriable, throttled = self.executor.ClassifyError(e)
+                        stalls += 1
+                        if not retriable or stalls > MAX_UPLOAD_STALLS:
+                            raise
+                        self.SendlToLog(1, "UploadMedia: Upload of %s stalled (%s). Waiting for the network."
+                                        % (rel_path, e))
+                        GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 1)
+                        if not self.WaitForInternet():
+                            raise UploadInterrupted()
+                        GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 0)
+                        query = request.resumable_uri is not None
+                        continue
+                    finally:
+                        if not saved and request.resumable_uri:
+                            self.upload_sessions.Save(file_path, target, request.resumable_uri,
+                                                      st.st_size, st.st_mtime)
+                            saved = True
+
+                    stalls = 0
+                    if status:
+                        self.upload_sessions.SetOffset(file_path, status.resumable_progress)
+                        GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE,
+                                                          {'Uploading %s: %d%%'
+                                                           % (rel_path, int(status.progress() * 100))})
+            except HttpError as e:
+                if session and e.resp.status in (404, 410):
+                    self.SendlToLog(2, "UploadMedia: Upload session of %s expired. Starting over." % rel_path)
+                    self.upload_sessions.Remove(file_path)
+                    session = None
+                    continue
+                raise
+
+            self.upload_sessions.Remove(file_path)
+            return response
+
+    def QueryUploadOffset(self, request, size, http):
+        """
+        Asks the drive how much of the upload session of request it got,
+        with an empty PUT. Returns the offset to carry on from and the
+        response to the upload if it was already complete.
+        """
+        resp, content = http.request(request.resumable_uri, method='PUT', body=None,
+                                     headers={'Content-Length': '0',
+                                              'Content-Range': 'bytes */%d' % size})
+        if resp.status in (200, 201):
+            return size, request.postproc(resp, content)
+        if resp.status != 308:
+            raise HttpError(resp, content, uri=request.resumable_uri)
+        # Range is bytes=0-<last byte received>, missing if nothing was
+        if 'range' in resp:
+            return int(resp['range'].split('-')[-1]) + 1, None
+        return 0, None
+
+    def ResumePendingUploads(self):
+        """Queue the uploads the last run didn't finish. They resume from their session."""
+        expired = self.upload_sessions.Expire()
+        if expired:
+            self.SendlToLog(2, "ResumePendingUploads: Dropped %d expired upload sessions" % expired)
+
+        for file_path in self.upload_sessions.GetPaths():
+            if file_path.startswith(self.mirror_directory + '/') and os.path.isfile(file_path):
+                self.SendlToLog(2, "ResumePendingUploads: Resuming upload of %s" % file_path)
+                self.upload_queue.Submit(file_path)
+            else:
+                self.upload_sessions.Remove(file_path)
+
     def CreateRegularFile(self, file_path, parent='root', uploaded=False):
         self.SendlToLog(3,"Create file %s\n" % file_path)
         filename = self.PathLeaf(file_path)
         file_metadata = {'name': filename}
         file_metadata['parents'] = [parent]
-        media = MediaFileUpload(file_path, resumable=True)
-        upfile = self.drive.files().create(body=file_metadata,
+        upfile = self.UploadMedia(file_path, 'parent:%s' % parent,
+                                  lambda media: self.drive.files().create(body=file_metadata,
                                     media_body=media,
-                                    fields='id').execute()
+                                    fields='id, name, mimeType, parents, md5Checksum, size, modifiedTime'))
+        self.metadata_cache.Store(self.GetRelativeFolder(file_path, True), upfile, parent)
+        self.AccountFile(upfile, parent)
+        return upfile
+
+    def UpdateRegularFile(self, file_path, file_object):
+        """Upload a new revision of the content of a file already on the drive."""
+        self.SendlToLog(3,"Update file %s (%s)\n" % (file_path, file_object['id']))
+        upfile = self.UploadMedia(file_path, 'file:%s' % file_object['id'],
+                                  lambda media: self.drive.files().update(fileId=file_object['id'],
+                                    media_body=media,
+                                    fields='id, name, mimeType, parents, md5Checksum, size, modifiedTime'))
+        parents = upfile.get('parents')
+        parent = parents[0] if parents else 'root'
+        if parent == self.root_folder_id:
+            parent = 'root'
+        self.metadata_cache.Store(self.GetRelativeFolder(file_path, True), upfile, parent)
+        self.AccountFile(upfile, parent)
+        return upfile
+
+    def IsLocalFileChanged(self, file_path, f):
+        """
+        Whether the local file differs from the drive file f. A size
+        mismatch tells right away. Otherwise the hashes are compared;
+        the hash cache only rehashes the file if its size or mtime_ns
+        changed since it was last hashed. The drive's modifiedTime is
+        not to be trusted against the local clock.
+        """
+        st = os.stat(file_path)
+        if 'size' in f and long(f['size']) != st.st_size:
+            return True
+        return f.get('md5Checksum') != self.HashOfFile(file_path)
 
     def GetRelativeFolder(self, file_path, IsFolder=False):
         if IsFolder:
@@ -558,11 +1093,8 @@ class GoSyncModel(object):
                 break
             except InternetNotReachable:
                 self.SendlToLog(1, "UploadFolder: Internet down")
-                while True:
-                    time.sleep(5)
-                    if not self.IsInternetReachable():
-                        continue
-                    break
+                if not self.WaitForInternet():
+                    return
                 continue
             except FileListQueryFailed:
                 time.sleep(5)
@@ -579,13 +1111,26 @@ class GoSyncModel(object):
             try:
                 f = self.LocateFileOnDrive(drivepath)
                 self.SendlToLog(3,'Found file %s on remote (dpath: %s)\n' % (f['name'], drivepath))
-                newfile = False
+                if self.IsGoogleDocument(f) or f['mimeType'] == 'application/vnd.google-apps.folder':
+                    self.SendlToLog(2,'UploadFile: %s is a %s on the drive. Not uploading.\n'
+                                    % (drivepath, f['mimeType']))
+                    return
                 self.SendlToLog(3,'Checking if they are same... ')
-                if f['md5Checksum'] == self.HashOfFile(file_path):
+                if not self.IsLocalFileChanged(file_path, f):
                     self.SendlToLog(3,'yes\n')
+                    # In case the last run got it all up but didn't get to say so
+                    self.upload_sessions.Remove(file_path)
                     return
-                else:
-                    self.SendlToLog(3,'no\n')
+                self.SendlToLog(3,'no\n')
+                # Same file id, a new revision. Creating would leave a
+                # duplicate next to it.
+                GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {'Updating %s' % drivepath})
+                try:
+                    self.UpdateRegularFile(file_path, f)
+                except:
+                    self.SendlToLog(1, "UpdateRegularFile: Failed to upload %s" % file_path)
+                    raise RegularFileUploadFailed()
+                return
             except (FileNotFound, FolderNotFound):
                 self.SendlToLog(3,"A new file!\n")
                 newfile = True
@@ -623,7 +1168,15 @@ class GoSyncModel(object):
                             % file_path)
             return
 
-        self.sync_lock.acquire()
+        self.SendlToLog(3, "UploadObservedFile: Queueing %s for upload" % file_path)
+        self.upload_queue.Submit(file_path)
+
+    def UploadQueuedFile(self, file_path):
+        """Called by the upload queue workers for every queued path."""
+        if not os.path.exists(file_path):
+            self.SendlToLog(3, "UploadQueuedFile: %s is gone. Skipping." % file_path)
+            return
+
         try:
             if os.path.isdir(file_path):
                 GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE,
@@ -634,59 +1187,83 @@ class GoSyncModel(object):
                                                   {"Uploading File: %s" % self.GetRelativeFolder(file_path, False)})
                 self.UploadFile(file_path)
         except InternetNotReachable as ie:
-            self.SendlToLog(1, "UploadObservedFile - Internet is down")
+            self.SendlToLog(1, "UploadQueuedFile - Internet is down")
+            raise
         except:
-            self.SendlToLog(1, "UploadObservedFile - Failed to upload file %s\n" % file_path)
+            self.SendlToLog(1, "UploadQueuedFile - Failed to upload file %s\n" % file_path)
+            raise
 
-        self.SendlToLog(3, "UploadObservedFile - Releasing lock")
-        self.sync_lock.release()
-
-    def RenameFile(self, file_object, new_title):
-        try:
-            file = {'name': new_title}
-
-            updated_file = self.drive.files().update( body= file,
-                                                         fileId=file_object['id'],
-                                                         fields='id, appProperties').execute()
-            return updated_file
-        except errors.HttpError as error:
-            self.SendlToLog(1,'An error occurred while renaming file: %s' % error)
-            return None
-        except:
-            self.logger.exception('An unknown error occurred file renaming file\n')
-            return None
+    def RenameFile(self, file_object, new_title, on_success=None, on_failure=None):
+        """Queue a rename with the batcher. The callbacks are called once it is done."""
+        file = {'name': new_title}
+        request = self.drive.files().update(body=file,
+                                            fileId=file_object['id'],
+                                            fields='id, name, parents')
+        self.batcher.Submit(request, on_success, on_failure,
+                            "Rename %s to %s" % (file_object['name'], new_title),
+                            file_object['id'])
 
     def RenameObservedFile(self, file_path, new_name):
         self.sync_lock.acquire()
         drive_path = file_path.split(self.mirror_directory+'/')[1]
+        new_drive_path = os.path.join(os.path.dirname(drive_path), new_name)
         self.SendlToLog(3,"RenameObservedFile: Rename %s to new name %s\n"
                           % (file_path, new_name))
         try:
             ftd = self.LocateFileOnDrive(drive_path)
-            nftd = self.RenameFile(ftd, new_name)
-            if not nftd:
-                self.SendlToLog(1,"File rename failed\n")
+
+            def renamed(nftd):
+                if ftd['mimeType'] == 'application/vnd.google-apps.folder':
+                    self.driveTree.RenameFolder(ftd['id'], new_name)
+                    GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
+
+            def failed(error):
+                self.SendlToLog(1,"File rename failed: %s\n" % error)
+                self.metadata_cache.InvalidatePath(new_drive_path)
+
+            self.RenameFile(ftd, new_name, renamed, failed)
+            # Events for the new path may come before the rename is sent
+            self.metadata_cache.MovePath(drive_path, new_drive_path)
+            ftd['name'] = new_name
+            self.metadata_cache.Store(new_drive_path, ftd)
         except:
             self.logger.exception("Could not locate file on drive.\n")
 
         self.sync_lock.release()
 
-    def TrashFile(self, file_object):
-        try:
-            file_metadata = {'trashed':True}
-            self.drive.files().update(body=file_metadata,fileId=file_object['id']).execute()
+    def TrashFile(self, file_object, on_trashed=None):
+        """
+        Queue moving the file to trash with the batcher. on_trashed is
+        called on the batcher thread once the drive trashed it.
+        """
+        def trashed(response):
             self.SendlToLog(3,{"TRASH_FILE: File %s deleted successfully.\n" % file_object['name']})
-        except errors.HttpError as error:
-            self.SendlToLog(1,"TRASH_FILE: HTTP Error\n")
-            raise RegularFileTrashFailed()
+            if on_trashed:
+                on_trashed()
+
+        def failed(error):
+            self.SendlToLog(1,{"TRASH_FILE: Failed to move file %s to trash: %s\n"
+                               % (file_object['name'], error)})
+
+        file_metadata = {'trashed':True}
+        request = self.drive.files().update(body=file_metadata, fileId=file_object['id'],
+                                            fields='id')
+        self.batcher.Submit(request, trashed, failed, "Trash %s" % file_object['name'],
+                            file_object['id'])
 
     def TrashFileCallback(self, Folder):
+        # Trashing a folder trashes its content on the server as well,
+        # so only the local bookkeeping is done for the subfolders.
         self.SendlToLog(3, "TrashFileCallback: Folder: %s being deleted" % Folder.GetPath())
         if Folder and Folder.GetPath() in self.sync_selection:
             self.sync_selection.remove(Folder.GetPath())
             self.SendlToLog(3, "TrashFileCallback: Folder %s deleted from sync list" % Folder.GetPath())
 
     def TrashObservedFile(self, file_path):
+        #Nothing to upload anymore if it was still waiting
+        if self.upload_queue:
+            self.upload_queue.Remove(file_path)
+
         if self.IsSyncRunning():
             self.SendlToLog(3, "TrashObservedFile: File %s Deleted but sync is running" % file_path)
             return
@@ -699,18 +1276,20 @@ class GoSyncModel(object):
             if not ftd:
                 self.SendlToLog(1,{"TRASH_FILE: invalid file handle for %s\n" % drive_path})
 
-            try:
-                if ftd['mimeType'] == 'application/vnd.google-apps.folder':
-                    self.SendlToLog(3, "Deleting folder %s (%s) from local drive tree"
-                                    % (self.GetRelativeFolder(file_path), ftd['id']))
-                    self.driveTree.DeleteFolder(ftd['id'], self.TrashFileCallback)
-                    GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
-                self.TrashFile(ftd)
-            except RegularFileTrashFailed:
-                self.SendlToLog(1,{"TRASH_FILE: Failed to move file %s to trash\n" % drive_path})
-                raise
-            except:
-                raise
+            folder_ids = None
+            if ftd['mimeType'] == 'application/vnd.google-apps.folder':
+                # The subtree is gone from the drive tree by the time the trash succeeds
+                folder_ids = self.driveTree.GetSubtreeIds(ftd['id'])
+                self.SendlToLog(3, "Deleting folder %s (%s) from local drive tree"
+                                % (self.GetRelativeFolder(file_path), ftd['id']))
+                self.driveTree.DeleteFolder(ftd['id'], self.TrashFileCallback)
+
+            def trashed(file_id=ftd['id'], folder_ids=folder_ids):
+                self.UnaccountFile(file_id, folder_ids)
+                GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
+
+            self.TrashFile(ftd, trashed)
+            self.metadata_cache.InvalidatePath(drive_path)
         except (FileNotFound, FileListQueryFailed, FolderNotFound):
             self.SendlToLog(1,{"TRASH_FILE: Failed to locate %s file on drive\n" % drive_path})
             pass
@@ -719,25 +1298,31 @@ class GoSyncModel(object):
 
         self.sync_lock.release()
 
-    def MoveFile(self, src_file, dst_folder='root', src_folder='root'):
-        try:
-            if dst_folder != 'root':
-                did = dst_folder['id']
-            else:
-                did = 'root'
+    def MoveFile(self, src_file, dst_folder='root', src_folder='root', on_failure=None):
+        """Queue a move with the batcher."""
+        if dst_folder != 'root':
+            did = dst_folder['id']
+        else:
+            did = 'root'
+
+        if src_folder != 'root':
+            sid = src_folder['id']
+        else:
+            sid = 'root'
 
-            if src_folder != 'root':
-                sid = src_folder['id']
+        def moved(response):
+            if src_file['mimeType'] == 'application/vnd.google-apps.folder':
+                self.driveTree.MoveFolder(src_file['id'], did)
+                GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
             else:
-                sid = 'root'
+                self.tree_store.MoveFileUsage(src_file['id'], did)
 
-            updated_file = self.drive.files().update(fileId=src_file['id'],
-                                    addParents=did,
-                                    removeParents=sid,
-                                    fields='id, parents').execute()
-
-        except:
-            self.logger.exception("move failed\n")
+        request = self.drive.files().update(fileId=src_file['id'],
+                                            addParents=did,
+                                            removeParents=sid,
+                                            fields='id, parents')
+        self.batcher.Submit(request, moved, on_failure, "Move %s" % src_file['name'],
+                            src_file['id'])
 
     def MoveObservedFile(self, src_path, dest_path):
         from_drive_path = src_path.split(self.mirror_directory+'/')[1]
@@ -760,9 +1345,17 @@ class GoSyncModel(object):
                     df = self.LocateFolderOnDrive(to_drive_path)
                 self.SendlToLog(3,"MoveObservedFile: Found destination folder on drive\n")
                 try:
+                    new_drive_path = os.path.join(to_drive_path, self.PathLeaf(from_drive_path))
+
+                    def failed(error):
+                        self.SendlToLog(1,"MoveObservedFile: Moving %s failed: %s\n" % (from_drive_path, error))
+                        self.metadata_cache.InvalidatePath(new_drive_path)
+
                     self.SendlToLog(3,"MovingFile() ")
-                    self.MoveFile(ftm, df, sf)
-                    self.SendlToLog(3,"done\n")
+                    self.MoveFile(ftm, df, sf, failed)
+                    # Events for the new path may come before the move is sent
+                    self.metadata_cache.MovePath(from_drive_path, new_drive_path)
+                    self.SendlToLog(3,"queued\n")
                 except (Unkownerror, FileMoveFailed):
                     self.SendlToLog(1,"MovedObservedFile: Failed\n")
                     return
@@ -789,6 +1382,11 @@ class GoSyncModel(object):
             return
 
     def HandleMovedFile(self, src_path, dest_path):
+        if self.IsSyncRunning():
+            self.SendlToLog(3, "HandleMovedFile: File %s moved to %s but sync is running. Possibly moved by sync. Skipping."
+                            % (src_path, dest_path))
+            return
+
         drive_path1 = os.path.dirname(src_path.split(self.mirror_directory+'/')[1])
         drive_path2 = os.path.dirname(dest_path.split(self.mirror_directory+'/')[1])
 
@@ -805,10 +1403,12 @@ class GoSyncModel(object):
 
 
 #### LocateFileInFolder
-    def LocateFileInFolder(self, filename, parent='root'):
+    def LocateFileInFolder(self, filename, parent='root', parent_path=None):
         try:
             self.SendlToLog(3, "LocateFileInFolder - Querying remote\n")
             file_list = self.MakeFileListQuery("'%s' in parents and trashed=false" % parent)
+            if parent_path is not None:
+                self.metadata_cache.StoreListing(parent, parent_path, file_list)
             for f in file_list:
                 if f['name'] == filename:
                     self.SendlToLog(3, "LocateFileInFolder - Found\n")
@@ -827,13 +1427,18 @@ class GoSyncModel(object):
         dirpath = os.path.dirname(abs_filepath)
         filename = self.PathLeaf(abs_filepath)
 
+        f = self.metadata_cache.GetByPath(abs_filepath)
+        if f:
+            self.SendlToLog(3, "LocateFileOnDrive - %s found in metadata cache\n" % abs_filepath)
+            return f
+
         if dirpath != '':
             try:
                 self.SendlToLog(3, "LocateFileOnDrive - locating %s directory on remote\n" % dirpath)
                 f = self.LocateFolderOnDrive(dirpath)
                 try:
                     self.SendlToLog(3, "LocateFileOnDrive - locating %s file\n" % f['id'])
-                    fil = self.LocateFileInFolder(filename, f['id'])
+                    fil = self.LocateFileInFolder(filename, f['id'], dirpath)
                     self.SendlToLog(3, "LocateFileOnDrive - File found\n")
                     return fil
                 except InternetNotReachable:
@@ -857,7 +1462,7 @@ class GoSyncModel(object):
         else:
             try:
                 #self.SendlToLog(3, "LocateFileOnDrive - locating %s file\n" % f['id'])
-                fil = self.LocateFileInFolder(filename)
+                fil = self.LocateFileInFolder(filename, 'root', '')
                 self.SendlToLog(3, "LocateFileOnDrive - File found\n")
                 return fil
             except InternetNotReachable:
@@ -882,9 +1487,17 @@ class GoSyncModel(object):
         """
         dir_list = folder_path.split(os.sep)
         croot = 'root'
+        cpath = ''
         for dir1 in dir_list:
+            ppath = cpath
+            cpath = os.path.join(cpath, dir1)
+            folder = self.metadata_cache.GetByPath(cpath)
+            if folder and folder['mimeType'] == 'application/vnd.google-apps.folder':
+                croot = folder['id']
+                continue
+
             try:
-                folder = self.GetFolderOnDrive(dir1, croot)
+                folder = self.GetFolderOnDrive(dir1, croot, ppath)
                 if not folder:
                     raise FolderNotFound(folder_path)
             except:
@@ -895,14 +1508,17 @@ class GoSyncModel(object):
         return folder
 
 #### GetFolderOnDrive
-    def GetFolderOnDrive(self, folder_name, parent='root'):
+    def GetFolderOnDrive(self, folder_name, parent='root', parent_path=None):
         """
         Return the folder with name in "folder_name" in the parent folder
-        mentioned in parent.
+        mentioned in parent. If the path of the parent is known, the
+        listing is recorded in the metadata cache.
         """
         self.SendlToLog(3,"GetFolderOnDrive: Checking Folder (%s) on (%s)" % (folder_name, parent))
         try:
             file_list = self.MakeFileListQuery("'%s' in parents and trashed=false"  % parent)
+            if parent_path is not None:
+                self.metadata_cache.StoreListing(parent, parent_path, file_list)
             for f in file_list:
                 if f['name'] == folder_name and f['mimeType']=='application/vnd.google-apps.folder':
                     self.SendlToLog(3,"GetFolderOnDrive: Found Folder (%s) on (%s)" % (folder_name, parent))
@@ -919,102 +1535,86 @@ class GoSyncModel(object):
             return
 
         self.SendlToLog(3,"### SyncLocalDirectory: - Sync Started")
-        for root, dirs, files in os.walk(self.mirror_directory):
-            if not self.IsDirectoryMonitored(root):
-                self.SendlToLog(2, "SyncLocalDirectory - Directory %s is not monitored. Deleting Locally" % root)
-                shutil.rmtree(root, ignore_errors=False, onerror=None)
-                continue
 
-            for names in files:
-                while True:
-                    if not self.syncRunning.is_set() or self.shutting_down:
-                        self.SendlToLog(3,"SyncLocalDirectory: Sync has been paused. Aborting.\n")
-                        return
+        def prune(dirpath):
+            if self.IsDirectoryMonitored(dirpath):
+                return False
+            self.SendlToLog(2, "SyncLocalDirectory - Directory %s is not monitored. Deleting Locally" % dirpath)
+            shutil.rmtree(dirpath, ignore_errors=True)
+            return True
 
-                    GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {"Checking Local: %s" % names})
-                    try:
-                        dirpath = os.path.join(root, names)
-                        drivepath = dirpath.split(self.mirror_directory+'/')[1]
-                        self.SendlToLog(3,"SyncLocalDirectory: Checking Local File (%s)" % drivepath)
-                        f = self.LocateFileOnDrive(drivepath)
-                        self.SendlToLog(3,"SyncLocalDirectory: Skipping Local File (%s) same as Remote\n" % dirpath)
-                        break
-                    except FileListQueryFailed:
-                        # if the file list query failed, we can't delete the local file even if
-                        # its gone in remote drive. Let the next sync come and take care of this
-                        # Log the event though
-                        self.SendlToLog(2,"SyncLocalDirectory: Remote File (%s) Check Failed. Aborting.\n" % dirpath)
-                        return
-                    except InternetNotReachable:
-                        self.SendlToLog(2, "SyncLocalDirectory: Network is down!\n")
-                        GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 1)
-                        while True:
-                            if self.IsInternetReachable():
-                                GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 0)
-                                self.SendlToLog(2, "SyncLocalDirectory: Network is up!\n")
-                                break
-                            else:
-                                time.sleep(5)
-                                continue
-                    except:
-                        if os.path.exists(dirpath) and os.path.isfile(dirpath):
-                            self.SendlToLog(2,"SyncLocalDirectory: Uploading Local File (%s) - Not in Remote\n" % dirpath)
-                            GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE,
-                                                              {"Uploading: %s" % self.GetRelativeFolder(dirpath, False)})
-                            self.UploadFile(dirpath)
-
-            for names in dirs:
-                nf = None
+        # Only what changed since the last local sync needs a look. The
+        # first time around everything is new.
+        diff = self.local_snapshot.Diff(self.mirror_directory, prune,
+                                        lambda: not self.syncRunning.is_set() or self.shutting_down)
+        if diff is None:
+            self.SendlToLog(3,"SyncLocalDirectory: Sync has been paused. Aborting.\n")
+            return
+
+        self.SendlToLog(2, "SyncLocalDirectory: %d scanned, %d added, %d changed, %d removed%s"
+                        % (diff.scanned, len(diff.added), len(diff.changed), len(diff.removed),
+                           " (no snapshot)" if diff.initial else ""))
+        failed = self.upload_queue.failed
+
+        for dirpath, is_dir, key in diff.added:
+            while True:
                 if not self.syncRunning.is_set() or self.shutting_down:
                     self.SendlToLog(3,"SyncLocalDirectory: Sync has been paused. Aborting.\n")
                     return
 
-                if not self.IsDirectoryMonitored(names):
-                    self.SendlToLog(2, "SyncLocalDirectory - Directory %s is not monitored. Deleting Locally" % root)
-                    shutil.rmtree(root, ignore_errors=False, onerror=None)
-                    continue
-
-                self.SendlToLog(3, "Checking Local Folder: %s" % names)
-
-                GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {"Checking Local: %s" % names})
+                name = os.path.basename(dirpath)
+                GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {"Checking Local: %s" % name})
+                abs_path = os.path.join(self.mirror_directory, dirpath)
                 try:
-                    dirpath = os.path.join(root, names)
-                    drivepath = dirpath.split(self.mirror_directory+'/')[1]
-                    f = self.LocateFileOnDrive(drivepath)
+                    self.SendlToLog(3,"SyncLocalDirectory: Checking Local %s (%s)"
+                                    % ("Folder" if is_dir else "File", dirpath))
+                    f = self.LocateFileOnDrive(dirpath)
+                    self.SendlToLog(3,"SyncLocalDirectory: Skipping Local %s (%s) same as Remote\n"
+                                    % ("Folder" if is_dir else "File", abs_path))
+                    break
                 except FileListQueryFailed:
                     # if the file list query failed, we can't delete the local file even if
                     # its gone in remote drive. Let the next sync come and take care of this
                     # Log the event though
-                    self.SendlToLog(2,"SyncLocalDirectory: Remote Folder (%s) Check Failed. Aborting.\n" % dirpath)
+                    self.SendlToLog(2,"SyncLocalDirectory: Remote File (%s) Check Failed. Aborting.\n" % abs_path)
                     return
                 except InternetNotReachable:
-                    self.SendlToLog(1, "SyncLocalDirectory: Internet seems to be down!\n")
-                    raise
+                    self.SendlToLog(2, "SyncLocalDirectory: Network is down!\n")
+                    self.WaitForInternet()
                 except:
-                    if os.path.exists(dirpath) and os.path.isdir(dirpath):
-                        self.SendlToLog(3,"SyncLocalDirectory: Uploading Local Folder (%s) - Not in Remote\n" % dirpath)
-                        try:
-                            GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {"Creating Folder: %s" % f['name']})
-                            self.UploadFolder(dirpath)
-                        except:
-                            self.SendlToLog(1, "SyncLocalDirectory: Failed to upload local folder (%s)\n" % dirpath)
-                            raise
+                    if os.path.exists(abs_path):
+                        self.SendlToLog(2,"SyncLocalDirectory: Queueing Local %s (%s) - Not in Remote\n"
+                                        % ("Folder" if is_dir else "File", abs_path))
+                        self.upload_queue.Submit(abs_path)
+                    break
+
+        # Files edited while GoSync wasn't watching. UploadFile compares
+        # them with the remote copy and only sends what differs.
+        for dirpath, is_dir, key in diff.changed:
+            if not self.syncRunning.is_set() or self.shutting_down:
+                self.SendlToLog(3,"SyncLocalDirectory: Sync has been paused. Aborting.\n")
+                return
+            self.SendlToLog(2,"SyncLocalDirectory: Queueing Local File (%s) - Changed since last sync\n" % dirpath)
+            self.upload_queue.Submit(os.path.join(self.mirror_directory, dirpath))
+
+        # Folders and files queued above are uploaded by the upload
+        # queue workers. Wait for them before calling the sync done.
+        if not self.upload_queue.Join(lambda: not self.syncRunning.is_set() or self.shutting_down):
+            return
 
+        # Anything which failed to upload is looked at again next time.
+        if self.upload_queue.failed == failed:
+            self.local_snapshot.Commit(diff)
         self.SendlToLog(3,"### SyncLocalDirectory: - Sync Completed")
 
 
     #################################################
     ####### DOWNLOAD SECTION (Syncing remote) #######
     #################################################
-    def IsInternetReachable(self, host='http://www.google.com'):
-        try:
-            if sys.version_info > (3,):
-                urllib.request.urlopen(host)
-            else:
-                urllib2.urlopen(host)
-            return True
-        except:
-            return False
+    def IsInternetReachable(self):
+        # Mostly answered from what the last requests saw, the network
+        # is only probed when that is stale or a request just failed.
+        return self.connectivity.IsOnline()
 
     def MakeFileListQuery(self, query):
         retry = 0
@@ -1024,34 +1624,29 @@ class GoSyncModel(object):
                 filelist = []
                 #self.SendlToLog(3, "Query: %s\n" % query)
                 while True:
-                    response = self.drive.files().list(q=query,
+                    response = self.executor.Execute(self.drive.files().list(q=query,
                                                        spaces='drive',
-                                                       fields='nextPageToken, files(id, name, mimeType, size, md5Checksum)',
-                                                       pageToken=page_token).execute()
+                                                       fields='nextPageToken, files(id, name, mimeType, size, md5Checksum, parents, modifiedTime)',
+                                                       pageToken=page_token))
                     filelist.extend(response.get('files',[]))
                     page_token = response.get('nextPageToken', None)
                     if page_token is None:
                         break
 
                 if not filelist:
-                    if not self.IsInternetReachable():
-                        self.SendlToLog(1, "Internet is down\n")
-                        raise InternetNotReachable()
-                    else:
-                        self.SendlToLog(3, "Empty Folder\n")
-                        return None
+                    # The drive answered, so this is an empty folder
+                    # and not the network.
+                    self.SendlToLog(3, "Empty Folder\n")
+                    return None
                 else:
                     return filelist
             except HttpError as error:
-                self.SendlToLog(1, "MakeFileListQuery - %s\n", error.resp.reason)
-                if error.resp.status in [403, 500, 503, 429]:
-                    self.SendlToLog(1, "MakeFileListQuery - Status: %d. (Retrying)\n", error.resp.status)
-                    time.sleep(5)
-                    continue
-
+                # Rate limits and server errors were already retried by the executor
+                self.SendlToLog(1, "MakeFileListQuery - %s (Status: %d)\n" % (error.resp.reason, error.resp.status))
                 if not self.IsInternetReachable():
                     self.SendlToLog(1, "MakeFileListQuery - Internet is down\n")
                     raise InternetNotReachable()
+                raise FileListQueryFailed()
             except:
                 if not self.IsInternetReachable():
                     self.SendlToLog(1, "MakeFileListQuery (unknown except) - Internet is down\n")
@@ -1083,10 +1678,7 @@ class GoSyncModel(object):
             raise
 
     def IsGoogleDocument(self, f):
-        if any(f['mimeType'] in s for s in google_docs_mimelist):
-            return True
-        else:
-            return False
+        return self.mime_classifier.IsGoogleDocument(f['mimeType'])
 
     def TotalFilesInDrive(self):
         return self.TotalFilesInFolder()
@@ -1144,16 +1736,80 @@ class GoSyncModel(object):
             return False
 
 
+#### GetTempDownloadPath
+    def GetTempDownloadPath(self, abs_filepath, file_obj):
+        """
+        Where file_obj is downloaded to before it is renamed into place.
+        The name carries a bit of the MD5, so a partial file is only
+        resumed for the same revision. Partial files of other revisions
+        are removed.
+        """
+        revision = (file_obj.get('md5Checksum') or file_obj['id'])[:8]
+        temp_path = "%s.%s%s" % (abs_filepath, revision, TEMP_FILE_SUFFIX)
+        for stale in glob.glob(glob.escape(abs_filepath) + '.*' + TEMP_FILE_SUFFIX):
+            if not stale.startswith(temp_path[:-len(TEMP_FILE_SUFFIX)]):
+                os.remove(stale)
+        return temp_path
+
+#### StreamDownload
+    def StreamDownload(self, file_obj, temp_path, total_size, description, abort_check):
+        """
+        Streams the content of file_obj into temp_path, one chunk of
+        download_chunk_size at a time, after whatever temp_path already
+        holds. Returns False if abort_check() stopped it on the way.
+        The complete file is checked against the MD5 of the drive.
+        """
+        state_path = SegmentStatePath(temp_path)
+        if os.path.exists(state_path):
+            # Left by a segmented download, the temp file has holes
+            self.SendlToLog(2, "StreamDownload: Dropping the segmented download of %s" % description)
+            os.remove(state_path)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        offset = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+        if offset > total_size:
+            os.remove(temp_path)
+            offset = 0
+        if offset == total_size:
+            open(temp_path, 'ab').close()
+            return self.VerifyDownload(file_obj, temp_path, description)
+        if offset:
+            self.SendlToLog(2, "StreamDownload: Resuming %s after %d bytes" % (description, offset))
+
+        http = self.GetThreadHttp()
+        with open(temp_path, 'ab') as fh:
+            while offset < total_size:
+                if abort_check():
+                    return False
+                # Ask for the bytes after those already there
+                last = min(offset + self.download_chunk_size, total_size) - 1
+                request = self.drive.files().get_media(fileId=file_obj['id'])
+                request.headers['Range'] = "bytes=%d-%d" % (offset, last)
+                data = self.executor.Execute(request, "Download %s [%d-%d]" % (description, offset, last),
+                                             http)
+                self.metrics.CountBytes('drive.files.get_media', received=len(data))
+                if len(data) != last - offset + 1:
+                    raise IOError("Got %d bytes instead of %d" % (len(data), last - offset + 1))
+                fh.write(data)
+                offset += len(data)
+                if total_size > self.download_chunk_size:
+                    GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE,
+                                                      {'Downloading (%s) %d%%'
+                                                       % (description, offset * 100 // total_size)})
+        return self.VerifyDownload(file_obj, temp_path, description)
+
+    def VerifyDownload(self, file_obj, temp_path, description):
+        """Drops temp_path, so the next attempt starts over, if it isn't what the drive has."""
+        md5 = Md5OfFile(temp_path)
+        if file_obj.get('md5Checksum') and md5 != file_obj['md5Checksum']:
+            os.remove(temp_path)
+            raise DownloadCorrupted("MD5 of %s is %s instead of %s"
+                                    % (description, md5, file_obj['md5Checksum']))
+        return True
+
 #### DownloadFileByObject
-    #### DownloadFileByObject
-    #def DownloadFileByObject(self, file_obj, download_path):
     def DownloadFileByObject(self, file_obj, download_path):
-        PreviousFile = ''
-        NewFile = ''
-        #LargeFileSize = 2500000
-        #LargeBlockSize = 1000000
-        LargeFileSize = 250000000
-        LargeBlockSize = 1000000000
         # Handle Retries 
         def RetryAndContinue(retryCounter, exceptionMsg):
             retryCounter -= 1
@@ -1163,25 +1819,11 @@ class GoSyncModel(object):
             else:
                 self.SendlToLog(1, "DownloadFileByObject: Download error (%s). Aborting..." % exceptionMsg)
             return retryCounter
-        #def partial(self, total_byte_len, part_size_limit):
-        def partial(total_byte_len, part_size_limit):
-            s = []
-            for p in range(0, total_byte_len, part_size_limit):
-                last = min(total_byte_len - 1, p + part_size_limit - 1)
-                s.append([p, last])
-            return s
-        def PrepareDownload(download_path) : 
-            pass
 
         def AbortingDownload():
             return not self.syncRunning.is_set() or self.shutting_down
 
-        def CleanUpDownload(download_path):
-            if os.path.exists(download_path):
-                os.remove(download_path)
-
         abs_filepath = os.path.join(download_path, file_obj['name'])
-        PrepareDownload(abs_filepath)
 
         if os.path.exists(abs_filepath):
             if self.HashOfFile(abs_filepath) == file_obj['md5Checksum']:
@@ -1193,55 +1835,47 @@ class GoSyncModel(object):
             self.SendlToLog(3,'DownloadFileByObject: Download Started - File (%s), size (%s)' % (abs_filepath, file_obj['size']))
             total_size = int(file_obj['size'])
             fd = abs_filepath.split(self.mirror_directory+'/')[1]
+            # The file only shows up under its name once it is complete.
+            # What was downloaded before an error or abort stays in the
+            # temp file and the next attempt carries on from there.
+            temp_path = self.GetTempDownloadPath(abs_filepath, file_obj)
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {'Downloading %s' % fd})
+            # Large files come over several connections at once
+            segmented = self.download_connections > 1 and total_size >= self.LargeFileSize
             retries = 5
             while True:
                 try:
-                    if ( total_size == 0) :
-                        GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {'Downloading %s' % fd})
-                        open(abs_filepath, 'a').close()
-                        break 
-                    elif ( total_size < LargeFileSize) :
-                        GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {'Downloading %s' % fd})
-                        request = self.drive.files().get_media(fileId=file_obj['id'])
-                        fh = io.FileIO(abs_filepath, 'wb')
-                        downloader = MediaIoBaseDownload(fh, request)
-                        done = False
-                        while done is False:
-                            if AbortingDownload() :
-                                break
-                            else :
-                                status, done = downloader.next_chunk()
-                        fh.close()
-                        break 
-                    else :
-                        # Downloading large files : 100M chunk size
-                        GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {'Downloading %s' % fd})
-                        s = partial(total_size, LargeBlockSize) 
-                        with open(abs_filepath, 'wb') as file:
-                            for bytes in s:
-                                if AbortingDownload() :
-                                    break
-                                else :
-                                    request = self.drive.files().get_media(fileId=file_obj['id'])
-                                    GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {'Downloading (%s) %s%%\n' % (fd, str(int(bytes[1]/total_size*100)))})
-                                    request.headers["Range"] = "bytes={}-{}".format(bytes[0], bytes[1]) 
-                                    fh = io.BytesIO(request.execute())
-                                    file.write(fh.getvalue())
-                                    file.flush()
-                        break 
+                    if segmented:
+                        download = SegmentedDownload(self, file_obj, temp_path, total_size, fd,
+                                                     AbortingDownload, self.download_connections,
+                                                     self.download_chunk_size)
+                        complete = download.Run()
+                    else:
+                        complete = self.StreamDownload(file_obj, temp_path, total_size, fd,
+                                                       AbortingDownload)
+                    break
                 except Exception as err:
                     retries = RetryAndContinue(retries, str(err))
                     if retries > 0 : 
                         continue
                     else :
-                        CleanUpDownload(abs_filepath)
                         raise
-            if AbortingDownload() :
-                CleanUpDownload(abs_filepath)
+
+            if not complete:
                 self.updates_done = 1
                 self.SendlToLog(2,'DownloadFileByObject: Download Aborted - File (%s)\n' % abs_filepath)
                 GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {''})
             else :
+                try:
+                    mtime = ParseDriveTime(file_obj['modifiedTime'])
+                    os.utime(temp_path, (time.time(), mtime))
+                except (KeyError, ValueError):
+                    pass
+                os.rename(temp_path, abs_filepath)
+                if segmented:
+                    # Hashed already to verify it. Lets IsLocalFileChanged
+                    # tell it is the same without hashing again.
+                    self.hash_cache.Store(abs_filepath, os.stat(abs_filepath), download.md5)
                 self.updates_done = 1
                 self.SendlToLog(2,'DownloadFileByObject: Download Completed - File (%s)\n' % abs_filepath)
                 GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {''})
@@ -1263,6 +1897,7 @@ class GoSyncModel(object):
                 return
 
             file_list = self.MakeFileListQuery("'%s' in parents and trashed=false" % parent)
+            self.metadata_cache.StoreListing(parent, pwd, file_list)
 
             #This direcotry is empty nothing to sync.
             if not file_list:
@@ -1295,16 +1930,9 @@ class GoSyncModel(object):
                             self.SyncRemoteDirectory(f['id'], os.path.join(pwd, f['name']))
                             break
                         except InternetNotReachable:
-                            GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 1)
                             self.SendlToLog(1, "SyncRemoteDirectory - Network has gone down")
-                            while True:
-                                if self.IsInternetReachable():
-                                    GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 0)
-                                    self.SendlToLog(2, "SyncRemoteDirectory - Network is up!")
-                                    break
-                                else:
-                                    time.sleep(5)
-                                    continue
+                            if not self.WaitForInternet():
+                                return
                     if not self.syncRunning.is_set() or self.shutting_down:
                         self.SendlToLog(3,"SyncRemoteDirectory: Sync has been paused. Aborting.\n")
                         return
@@ -1314,8 +1942,9 @@ class GoSyncModel(object):
                         return
 
                     self.SendlToLog(3,"SyncRemoteDirectory: Checking file (%s)" % f['name'])
+                    self.AccountFile(f, parent)
                     if not self.IsGoogleDocument(f):
-                        self.DownloadFileByObject(f, os.path.join(self.mirror_directory, pwd))
+                        self.QueueDownload(f, os.path.join(self.mirror_directory, pwd))
                     else:
                         self.SendlToLog(3,"SyncRemoteDirectory: Skipping file (%s) is a google document.\n" % f['name'])
         except InternetNotReachable:
@@ -1326,6 +1955,295 @@ class GoSyncModel(object):
             raise
         self.SendlToLog(3,"### SyncRemoteDirectory: - Sync Completed - Remote Directory (%s) ... Recursive = %s\n" % (pwd, recursive))
 
+#### Changes feed
+    def LoadChangesToken(self):
+        try:
+            with open(self.changes_token_file, 'r') as f:
+                token = f.read().strip()
+                if token:
+                    return token
+        except (IOError, OSError):
+            pass
+        return None
+
+    def SaveChangesToken(self, token):
+        self.changes_token = token
+        tmp_file = self.changes_token_file + '.tmp'
+        try:
+            with open(tmp_file, 'w') as f:
+                f.write(token)
+            os.rename(tmp_file, self.changes_token_file)
+        except (IOError, OSError):
+            self.SendlToLog(1, "SaveChangesToken: Failed to save changes token")
+
+    def ForgetChangesToken(self):
+        self.changes_token = None
+        if os.path.exists(self.changes_token_file):
+            os.remove(self.changes_token_file)
+
+    def GetStartPageToken(self):
+        response = self.executor.Execute(self.drive.changes().getStartPageToken())
+        return response['startPageToken']
+
+    def GetRootFolderId(self):
+        # Parents in the changes feed carry the real id of the root
+        # folder, not the 'root' alias used everywhere else.
+        if not self.root_folder_id:
+            root = self.executor.Execute(self.drive.files().get(fileId='root', fields='id'))
+            self.root_folder_id = root['id']
+        return self.root_folder_id
+
+    def IsRemotePathSelected(self, path):
+        if self.IsMonitoringAll():
+            return True
+
+        #Files in root are always synced
+        if os.path.dirname(path) == '':
+            return True
+
+        for d in self.sync_selection:
+            if path == d[0] or path.startswith(d[0] + '/'):
+                return True
+
+        return False
+
+    def GetRemoteParentPath(self, parent_id):
+        if parent_id == 'root' or parent_id == self.GetRootFolderId():
+            return ''
+
+        node = self.driveTree.FindFolder(parent_id)
+        if node:
+            return node.GetPath()
+
+        return self.metadata_cache.GetPathById(parent_id)
+
+    def GetKnownPathById(self, file_id):
+        node = self.driveTree.FindFolder(file_id)
+        if node:
+            return node.GetPath()
+
+        return self.metadata_cache.GetPathById(file_id)
+
+    def RemoveLocalObject(self, drive_path, file_id):
+        abs_path = os.path.join(self.mirror_directory, drive_path)
+        self.SendlToLog(2, "RemoveLocalObject: %s removed on remote. Deleting locally" % drive_path)
+        if os.path.isdir(abs_path):
+            shutil.rmtree(abs_path, ignore_errors=True)
+        elif os.path.exists(abs_path):
+            os.remove(abs_path)
+
+        if self.driveTree.FindFolder(file_id):
+            self.driveTree.DeleteFolder(file_id, self.TrashFileCallback)
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
+        self.metadata_cache.InvalidatePath(drive_path)
+        # A listing from before a move may still have it under another path
+        self.metadata_cache.InvalidateId(file_id)
+        self.updates_done = 1
+
+    def ApplyRemoteChange(self, change):
+        """
+        Apply one entry of the changes feed to the mirror. Returns False
+        if the change couldn't be placed because its parent folder isn't
+        known (yet).
+        """
+        if change.get('changeType', 'file') != 'file':
+            return True
+
+        file_id = change['fileId']
+        f = change.get('file')
+        old_path = self.GetKnownPathById(file_id)
+
+        if change.get('removed') or not f or f.get('trashed'):
+            self.UnaccountFile(file_id)
+            if old_path is not None:
+                self.RemoveLocalObject(old_path, file_id)
+            return True
+
+        parents = f.get('parents')
+        new_path = None
+        if parents:
+            # Usage covers the whole drive, not just what is mirrored
+            self.AccountFile(f)
+            parent_path = self.GetRemoteParentPath(parents[0])
+            if parent_path is not None:
+                new_path = os.path.join(parent_path, f['name'])
+
+        if new_path is None and old_path is None:
+            return False
+
+        if new_path is None or not self.IsRemotePathSelected(new_path):
+            # Moved out of what we mirror (or was never part of it)
+            if old_path is not None:
+                self.RemoveLocalObject(old_path, file_id)
+            return True
+
+        parent_id = parents[0]
+        if parent_id == self.GetRootFolderId():
+            parent_id = 'root'
+
+        old_abs = None
+        if old_path is not None:
+            old_abs = os.path.join(self.mirror_directory, old_path)
+        new_abs = os.path.join(self.mirror_directory, new_path)
+
+        GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {"Checking: %s" % f['name']})
+
+        if old_path is not None and old_path != new_path:
+            if os.path.exists(old_abs) and not os.path.exists(new_abs):
+                self.SendlToLog(2, "ApplyRemoteChange: Moving %s to %s" % (old_path, new_path))
+                os.renames(old_abs, new_abs)
+                self.updates_done = 1
+            self.metadata_cache.MovePath(old_path, new_path)
+
+        if f['mimeType'] == 'application/vnd.google-apps.folder':
+            if self.driveTree.FindFolder(file_id):
+                self.driveTree.MoveFolder(file_id, parent_id, f['name'])
+            else:
+                self.driveTree.AddFolder(parent_id, file_id, f['name'], f)
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
+            if not os.path.exists(new_abs):
+                os.makedirs(new_abs)
+            self.metadata_cache.Store(new_path, f, parent_id)
+            return True
+
+        cached = self.metadata_cache.GetById(file_id)
+        self.metadata_cache.Store(new_path, f, parent_id)
+
+        if f['mimeType'].startswith('application/vnd.google-apps.'):
+            self.SendlToLog(3, "ApplyRemoteChange: Skipping file (%s) is a google document.\n" % f['name'])
+            return True
+
+        if os.path.exists(new_abs) and 'md5Checksum' in f:
+            local_hash = self.HashOfFile(new_abs)
+            if local_hash == f['md5Checksum']:
+                return True
+            if cached and cached.get('md5Checksum') == local_hash:
+                # Local copy is the previous remote revision, nobody touched it.
+                self.SendlToLog(2, "ApplyRemoteChange: %s changed on remote. Updating local copy" % new_path)
+                os.remove(new_abs)
+            else:
+                self.SendlToLog(2, "ApplyRemoteChange: %s changed both locally and on remote. Skipping" % new_path)
+                return True
+
+        self.QueueDownload(f, os.path.dirname(new_abs))
+        return True
+
+    def SyncRemoteChanges(self):
+        """
+        Apply everything that changed on the drive since the saved
+        start page token. When nothing changed, this is a single call.
+        """
+        self.SendlToLog(3, "### SyncRemoteChanges: - Sync Started (token %s)" % self.changes_token)
+        page_token = self.changes_token
+        while page_token is not None:
+            if not self.syncRunning.is_set() or self.shutting_down:
+                self.SendlToLog(2, "SyncRemoteChanges: Sync has been paused. Aborting.\n")
+                return
+
+            try:
+                response = self.executor.Execute(self.drive.changes().list(pageToken=page_token,
+                                                     spaces='drive',
+                                                     pageSize=1000,
+                                                     includeRemoved=True,
+                                                     fields='nextPageToken, newStartPageToken, '
+                                                     'changes(changeType, removed, fileId, '
+                                                     'file(id, name, mimeType, parents, trashed, '
+                                                     'md5Checksum, size, modifiedTime))'))
+            except HttpError as error:
+                if error.resp.status in [400, 404, 410]:
+                    raise ChangesTokenLost()
+                raise
+
+            # A change whose parent folder comes later in the page is
+            # retried until no more progress is made. What is left
+            # after that lives outside of My Drive.
+            pending = response.get('changes', [])
+            failed = False
+            while pending:
+                deferred = []
+                for change in pending:
+                    if not self.syncRunning.is_set() or self.shutting_down:
+                        self.SendlToLog(2, "SyncRemoteChanges: Sync has been paused. Aborting.\n")
+                        return
+                    try:
+                        if not self.ApplyRemoteChange(change):
+                            deferred.append(change)
+                    except InternetNotReachable:
+                        raise
+                    except:
+                        failed = True
+                        self.logger.exception("SyncRemoteChanges: Failed to apply change for %s" % change.get('fileId'))
+
+                if len(deferred) == len(pending):
+                    break
+                pending = deferred
+
+            if failed:
+                # The feed would move past what failed, only a full walk retries it
+                self.SendlToLog(1, "SyncRemoteChanges: Some changes failed. Next sync will be a full sync")
+                self.ForgetChangesToken()
+                return
+
+            if 'newStartPageToken' in response:
+                self.SaveChangesToken(response['newStartPageToken'])
+                break
+
+            page_token = response.get('nextPageToken')
+            self.SaveChangesToken(page_token)
+
+        self.SendlToLog(3, "### SyncRemoteChanges: - Sync Completed")
+
+#### QueueDownload
+    def QueueDownload(self, file_obj, download_path):
+        if self.download_pool:
+            self.download_pool.Submit(file_obj, download_path)
+        else:
+            self.DownloadFileByObject(file_obj, download_path)
+
+#### SyncRemote
+    def SyncRemote(self):
+        self.download_pool = DownloadPool(self, self.download_workers)
+        try:
+            self.SyncRemoteSelection()
+        except:
+            self.download_pool.Close(discard=True)
+            self.download_pool = None
+            raise
+
+        failed = self.download_pool.Close()
+        self.download_pool = None
+        if failed and self.change_feed_sync:
+            self.SendlToLog(1, "SyncRemote: %d downloads failed. Next sync will be a full sync" % failed)
+            self.ForgetChangesToken()
+
+    def SyncRemoteSelection(self):
+        if self.change_feed_sync and self.changes_token:
+            try:
+                self.SyncRemoteChanges()
+                return
+            except ChangesTokenLost:
+                self.SendlToLog(1, "SyncRemote: Changes token is not valid anymore. Doing a full sync")
+                self.ForgetChangesToken()
+
+        # Take the token before walking, changes done during the walk
+        # are then seen again by the next incremental sync.
+        token = None
+        if self.change_feed_sync:
+            token = self.GetStartPageToken()
+
+        for d in self.sync_selection:
+            if d[0] != 'root':
+                #Root folder files are always synced (not recursive)
+                self.SyncRemoteDirectory('root', '', False)
+                #Then sync current folder (recursively)
+                self.SyncRemoteDirectory(d[1], d[0])
+            else:
+                #Sync Root folder (recursively)
+                self.SyncRemoteDirectory('root', '')
+
+        if token and self.syncRunning.is_set() and not self.shutting_down:
+            self.SaveChangesToken(token)
+
 #### validate_sync_settings
     def validate_sync_settings(self):
         for d in self.sync_selection:
@@ -1350,19 +2268,14 @@ class GoSyncModel(object):
             self.syncRunning.wait()
 
             if self.shutting_down:
-                self.SendToLog(2, "SyncThread - run - GoSync is shutting down!")
+                self.SendlToLog(2, "SyncThread - run - GoSync is shutting down!")
                 break
 
             if not self.IsInternetReachable():
-                self.SendlToLog(2, "SyncThread - run - Internet is down. Clearing running.")
-                GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 1)
-                while True:
-                    if not self.IsInternetReachable():
-                        time.sleep(5)
-                    else:
-                        self.SendlToLog(2, "SyncThread - run - Internet is up!")
-                        GoSyncEventController().PostEvent(GOSYNC_EVENT_INTERNET_UNREACHABLE, 0)
-                        break
+                self.SendlToLog(2, "SyncThread - run - Internet is down. Waiting for it.")
+                if not self.WaitForInternet():
+                    self.SendlToLog(2, "SyncThread - run - GoSync is shutting down!")
+                    break
 
             self.SendlToLog(3, "SyncThread - run - Trying to acquire lock.")
             self.sync_lock.acquire()
@@ -1390,15 +2303,10 @@ class GoSyncModel(object):
                 self.SendlToLog(3,"###############################################")
                 self.SendlToLog(3,"Start - Syncing remote directory")
                 self.SendlToLog(3,"###############################################")
-                for d in self.sync_selection:
-                    if d[0] != 'root':
-                        #Root folder files are always synced (not recursive)
-                        self.SyncRemoteDirectory('root', '', False)
-                        #Then sync current folder (recursively)
-                        self.SyncRemoteDirectory(d[1], d[0])
-                    else:
-                        #Sync Root folder (recursively)
-                        self.SyncRemoteDirectory('root', '')
+                # Local renames, moves and deletes must reach the drive
+                # before the remote is compared with the local copy.
+                self.batcher.Flush()
+                self.SyncRemote()
                 self.SendlToLog(3,"###############################################")
                 self.SendlToLog(3,"End - Syncing remote directory")
                 self.SendlToLog(3,"###############################################\n")
@@ -1412,10 +2320,9 @@ class GoSyncModel(object):
                 self.SendlToLog(3,"End - Syncing local directory")
                 self.SendlToLog(3,"###############################################\n")
                 self.initial_run = False
+                self.LogRequestStats()
 
-                if self.updates_done:
-                    self.SendlToLog(2,"Sync - Some changes were done. Triggering drive usage calculation.\n")
-                    self.usageCalculateEvent.set()
+                self.SaveDriveUsage()
                 GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_DONE, 0)
             except InternetNotReachable:
                 self.SendlToLog(2, "SyncThread - run - Internet not reachable")
@@ -1463,46 +2370,110 @@ class GoSyncModel(object):
             self.SendlToLog(1,"Failed to get size of file %s (mime: %s)\n" % (f['name'], f['mimeType']))
             return 0
 
-#### calculateUsageOfFolder
-    def calculateUsageOfFolder(self, folder_id):
-        try:
-            if self.shutting_down:
-                self.SendlToLog(3, "calculateUsageOfFolder: GoSync is shutting down!")
-                return
+#### GetUsageCategory
+    def GetUsageCategory(self, f):
+        return self.mime_classifier.Classify(f)
+
+#### ScanDriveUsage
+    def ScanDriveUsage(self):
+        def progress(count, f):
+            self.fcount = count
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_SCAN_UPDATE, {'Scanning Folder: %s' % f['name']})
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_UPDATE, count)
+
+        scanner = DriveUsageScanner(self.drive, self.executor.Execute, self.GetUsageCategory)
+        should_stop = lambda: self.shutting_down
+        if self.bulk_usage_scan:
+            result = scanner.ScanBulk(self.GetRootFolderId(), progress, should_stop)
+        else:
+            result = scanner.ScanRecursive(progress, should_stop)
+        self.SendlToLog(2, "ScanDriveUsage: %d files scanned with %d requests"
+                        % (result.file_count, result.requests))
+
+        self.driveTree.AddFolders(result.folders)
+        self.metadata_cache.StoreListings(result.listings)
+        self.tree_store.ReplaceUsage(result.files)
+        self.SetUsageTotals(result.usage)
+        for category in self.mime_classifier.GetCategories():
+            self.SendlToLog(3, "ScanDriveUsage: %s: %d files, %d bytes"
+                            % (category, result.counts.get(category, 0), result.usage.get(category, 0)))
+
+#### Usage accounting
+    def ApplyUsageDelta(self, delta):
+        if not delta:
+            return
 
-            file_list = self.MakeFileListQuery("'%s' in parents and trashed=false" % folder_id)
+        with self.usage_lock:
+            for category, size in delta.items():
+                attr = usage_category_attrs.get(category, 'driveOthersUsage')
+                setattr(self, attr, getattr(self, attr) + size)
+            self.usage_changed = True
+        GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
+
+    def SetUsageTotals(self, totals):
+        with self.usage_lock:
+            for attr in usage_category_attrs.values():
+                setattr(self, attr, 0)
+            for category, size in totals.items():
+                attr = usage_category_attrs.get(category, 'driveOthersUsage')
+                setattr(self, attr, getattr(self, attr) + size)
+
+    def GetUsageSummary(self):
+        """{category: (files, bytes)} for every usage category, custom ones included."""
+        totals = self.tree_store.GetUsageTotals()
+        counts = self.tree_store.GetUsageCounts()
+        return dict((category, (counts.get(category, 0), totals.get(category, 0)))
+                    for category in self.mime_classifier.GetCategories())
+
+    def LogUsageSummary(self):
+        summary = self.GetUsageSummary()
+        self.SendlToLog(2, "Drive usage: %s"
+                        % "; ".join("%s: %d files, %d bytes" % (category, files, size)
+                                    for category, (files, size) in sorted(summary.items())))
+
+    def AccountFile(self, f, parent_id=None):
+        """Count a file seen on, or uploaded to, the drive in the usage."""
+        if f['mimeType'] == 'application/vnd.google-apps.folder':
+            return
 
-            #Folder is empty
-            if not file_list:
-                return
+        if parent_id is None:
+            parents = f.get('parents')
+            parent_id = parents[0] if parents else 'root'
+        if parent_id == self.root_folder_id:
+            parent_id = 'root'
 
-            for f in file_list:
-                if self.shutting_down:
-                    self.SendlToLog(3, "calculateUsageOfFolder: GoSync is shutting down!")
-                    return
+        category = self.GetUsageCategory(f)
+        if category is None:
+            self.ApplyUsageDelta(self.tree_store.RemoveFileUsage(f['id']))
+        else:
+            self.ApplyUsageDelta(self.tree_store.SetFileUsage(f['id'], parent_id, category,
+                                                              int(f.get('size', 0))))
 
-                self.fcount += 1
-                self.SendlToLog(3, "Scanning: %s (%s -> %s)\n" % (f['name'], f['id'], folder_id))
-                GoSyncEventController().PostEvent(GOSYNC_EVENT_SCAN_UPDATE, {'Scanning Folder: %s' % f['name']})
-                if f['mimeType'] == 'application/vnd.google-apps.folder':
-                    self.driveTree.AddFolder(folder_id, f['id'], f['name'], f)
-                    self.calculateUsageOfFolder(f['id'])
-                else:
-                    if not self.IsGoogleDocument(f):
-                        if any(f['mimeType'] in s for s in audio_file_mimelist):
-                            self.driveAudioUsage += self.GetFileSize(f)
-                        elif  any(f['mimeType'] in s for s in image_file_mimelist):
-                            self.drivePhotoUsage += self.GetFileSize(f)
-                        elif any(f['mimeType'] in s for s in movie_file_mimelist):
-                            self.driveMoviesUsage += self.GetFileSize(f)
-                        elif any(f['mimeType'] in s for s in document_file_mimelist):
-                            self.driveDocumentUsage += self.GetFileSize(f)
-                        else:
-                            self.driveOthersUsage += self.GetFileSize(f)
-                            #self.SendlToLog(3,"calculateUsageOfFolder: Unknown Mime %s\n" % f['mimeType'])
-                        GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_UPDATE, self.fcount)
-        except:
-            raise
+    def UnaccountFile(self, file_id, folder_ids=None):
+        """
+        The file, or the folder and all it contains, is gone from the drive.
+        folder_ids is the subtree of a folder already deleted from the drive tree.
+        """
+        if folder_ids is None and self.driveTree.FindFolder(file_id):
+            folder_ids = self.driveTree.GetSubtreeIds(file_id)
+        if folder_ids is not None:
+            delta = self.tree_store.RemoveFolderUsage(folder_ids)
+        else:
+            delta = self.tree_store.RemoveFileUsage(file_id)
+        self.ApplyUsageDelta(delta)
+
+    def SaveDriveUsage(self):
+        with self.usage_lock:
+            if not self.usage_changed:
+                return
+            self.usage_changed = False
+            self.drive_usage_dict['Audio Size'] = self.driveAudioUsage
+            self.drive_usage_dict['Movies Size'] = self.driveMoviesUsage
+            self.drive_usage_dict['Document Size'] = self.driveDocumentUsage
+            self.drive_usage_dict['Photo Size'] = self.drivePhotoUsage
+            self.drive_usage_dict['Others Size'] = self.driveOthersUsage
+        self.config_dict['Drive Usage'] = self.drive_usage_dict
+        self.SaveConfig()
 
 #### calculateUsage
     def calculateUsage(self):
@@ -1519,11 +2490,17 @@ class GoSyncModel(object):
 
             if self.force_usage_calculation == True:
                 # Usage calculation is forced by user, wipe the slate clean
+                self.force_usage_calculation = False
                 self.drive_usage_dict = {}
-                self.driveTree = GoogleDriveTree()
+                self.driveTree.Clear()
+                self.metadata_cache.Clear()
 
-            if self.drive_usage_dict and not self.updates_done:
+            # Usage is kept up to date by AccountFile and UnaccountFile.
+            # The drive is only scanned if that never happened before.
+            if self.drive_usage_dict and self.tree_store.IsComplete() and self.tree_store.HasUsage():
                 self.SendlToLog(3,"CalculateUsage: No calculation to be done")
+                self.SetUsageTotals(self.tree_store.GetUsageTotals())
+                self.LogUsageSummary()
                 GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
                 self.sync_lock.release()
                 continue
@@ -1541,7 +2518,8 @@ class GoSyncModel(object):
                 GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_STARTED, 0)
                 self.SendlToLog(3,"CalculateUsage: Scanning files...\n")
                 try:
-                    self.calculateUsageOfFolder('root')
+                    self.tree_store.SetComplete(False)
+                    self.ScanDriveUsage()
                     GoSyncEventController().PostEvent(GOSYNC_EVENT_CALCULATE_USAGE_DONE, 0)
                     #self.drive_usage_dict['Total Files'] = self.totalFilesToCheck
                     self.drive_usage_dict['Total Size'] = long(self.about_drive['storageQuota']['limit'])
@@ -1550,9 +2528,10 @@ class GoSyncModel(object):
                     self.drive_usage_dict['Document Size'] = self.driveDocumentUsage
                     self.drive_usage_dict['Photo Size'] = self.drivePhotoUsage
                     self.drive_usage_dict['Others Size'] = self.driveOthersUsage
-                    pickle.dump(self.driveTree, open(self.tree_pickle_file, "wb"))
+                    self.tree_store.SetComplete(True)
                     self.config_dict['Drive Usage'] = self.drive_usage_dict
                     self.SaveConfig()
+                    self.LogUsageSummary()
                 except:
                     self.driveAudioUsage = 0
                     self.driveMoviesUsage = 0
@@ -1568,14 +2547,14 @@ class GoSyncModel(object):
             self.sync_lock.release()
 
     def GetDriveDirectoryTree(self):
-        self.sync_lock.acquire()
-        ref_tree = copy.deepcopy(self.driveTree)
-        self.sync_lock.release()
-        return ref_tree
+        return self.driveTree.Copy()
 
     def IsCalculatingDriveUsage(self):
         return self.calculatingDriveUsage
 
+    def HasSavedDriveUsage(self):
+        return bool(self.drive_usage_dict)
+
     def GetAudioUsage(self):
         return self.driveAudioUsage
 
@@ -1625,6 +2604,7 @@ class GoSyncModel(object):
                 self.sync_selection = [['root', '']]
 
             self.config_dict['Sync Selection'] = self.sync_selection
+            self.ForgetChangesToken()
             self.SaveConfig()
 
     def ClearSyncSelection(self):
@@ -1642,6 +2622,8 @@ class GoSyncModel(object):
                     return
             self.sync_selection.append([folder.GetPath(), folder.GetId()])
         self.config_dict['Sync Selection'] = self.sync_selection
+        #Newly selected folders are not in the changes feed, walk them once
+        self.ForgetChangesToken()
         self.SaveConfig()
 
     def GetSyncList(self):
@@ -1672,6 +2654,49 @@ class GoSyncModel(object):
     def GetSyncInterval(self):
         return self.sync_interval
 
+    def SetDownloadWorkers(self, workers):
+        self.download_workers = workers
+        self.SaveConfig()
+
+    def GetDownloadWorkers(self):
+        return self.download_workers
+
+    def SetUploadWorkers(self, workers):
+        self.upload_workers = workers
+        if self.upload_queue:
+            self.upload_queue.SetWorkers(workers)
+        self.SaveConfig()
+
+    def GetUploadWorkers(self):
+        return self.upload_workers
+
+    def SetRequestsPerSecond(self, rate):
+        self.requests_per_second = rate
+        self.executor.SetRate(rate)
+        self.SaveConfig()
+
+    def SetObserverQuietWindow(self, seconds):
+        self.observer_quiet_window = seconds
+        if self.event_aggregator:
+            self.event_aggregator.SetQuietWindow(seconds)
+        self.SaveConfig()
+
+    def GetObserverQuietWindow(self):
+        return self.observer_quiet_window
+
+    def GetRequestsPerSecond(self):
+        return self.requests_per_second
+
+    def GetRequestStats(self):
+        return self.executor.GetStats()
+
+    def LogRequestStats(self):
+        stats = self.executor.GetStats()
+        self.SendlToLog(2, "Drive requests: %d, retried: %d, throttled: %d, failed: %d, "
+                        "retry budget exhausted: %d, waited for rate limit: %.1f seconds"
+                        % (stats['requests'], stats['retried'], stats['throttled'],
+                           stats['failed'], stats['budget_exhausted'], stats['wait_time']))
+
     def GetUseSystemNotifSetting(self):
         return self.use_system_notif
 
@@ -1687,20 +2712,49 @@ class GoSyncModel(object):
         self.SaveConfig()
 
 class FileModificationNotifyHandler(PatternMatchingEventHandler):
+    """
+    Hands the events to the model's LocalEventAggregator, which acts on
+    them once the path has been quiet for a while. Events while the
+    sync is running are most likely caused by the sync itself.
+    """
     patterns = ["*"]
+    ignore_patterns = ["*" + TEMP_FILE_SUFFIX]
 
     def __init__(self, sync_handler):
         super(FileModificationNotifyHandler, self).__init__()
         self.sync_handler = sync_handler
 
+    def __Ignore(self, evt):
+        if self.sync_handler.IsSyncRunning() or not self.sync_handler.event_aggregator:
+            self.sync_handler.logger.debug("Observer: Ignoring %s of %s while sync is running\n"
+                                           % (evt.event_type, evt.src_path))
+            return True
+        return False
+
     def on_created(self, evt):
         self.sync_handler.logger.debug("Observer: %s created\n" % evt.src_path)
-        self.sync_handler.UploadObservedFile(evt.src_path)
+        if not self.__Ignore(evt):
+            self.sync_handler.event_aggregator.Created(evt.src_path, evt.is_directory)
+
+    def on_modified(self, evt):
+        if evt.is_directory:
+            return
+        self.sync_handler.InvalidateLocalHash(evt.src_path)
+        if not self.__Ignore(evt):
+            self.sync_handler.event_aggregator.Modified(evt.src_path)
 
     def on_moved(self, evt):
-        self.sync_handler.logger.info("Observer: file %s moved to %s: Not supported yet!\n" % (evt.src_path, evt.dest_path))
-        self.sync_handler.HandleMovedFile(evt.src_path, evt.dest_path)
+        self.sync_handler.InvalidateLocalHash(evt.src_path)
+        self.sync_handler.logger.info("Observer: file %s moved to %s\n" % (evt.src_path, evt.dest_path))
+        if self.__Ignore(evt):
+            return
+        if IsTempFile(evt.dest_path):
+            self.sync_handler.event_aggregator.Deleted(evt.src_path, evt.is_directory)
+        else:
+            self.sync_handler.event_aggregator.Moved(evt.src_path, evt.dest_path, evt.is_directory)
 
     def on_deleted(self, evt):
+        self.sync_handler.InvalidateLocalHash(evt.src_path)
         self.sync_handler.logger.info("Observer: file %s deleted on drive.\n" % evt.src_path)
-        self.sync_handler.TrashObservedFile(evt.src_path)
+        if not self.__Ignore(evt):
+            self.sync_handler.event_aggregator.Deleted(evt.src_path, evt.is_directory)
@@ -0,0 +1,144 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os, json, threading
+import google_auth_httplib2
+from googleapiclient.http import build_http
+
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/drive/v3/rest'
+DISCOVERY_CACHE_FILE = 'drive-v3-discovery.json'
+
+class DiscoveryDocumentNotFound(RuntimeError):
+    """The drive discovery document could neither be loaded nor fetched"""
+
+
+class DriveService(object):
+    """
+    The drive v3 service with its collections built once.
+    googleapiclient builds a new resource, parsing its part of the
+    discovery document, each time files(), changes() or about() is
+    called, which costs milliseconds per request.
+
+    The resources are shared by all threads. Requests built from them
+    are executed on the connection of the calling thread, see
+    DriveServiceFactory.GetThreadHttp.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.lock = threading.Lock()
+        self.collections = {}
+
+    def __Collection(self, name):
+        collection = self.collections.get(name)
+        if collection is None:
+            with self.lock:
+                collection = self.collections.get(name)
+                if collection is None:
+                    collection = self.collections[name] = getattr(self.service, name)()
+        return collection
+
+    def files(self):
+        return self.__Collection('files')
+
+    def changes(self):
+        return self.__Collection('changes')
+
+    def about(self):
+        return self.__Collection('about')
+
+    def new_batch_http_request(self, *args, **kwargs):
+        return self.service.new_batch_http_request(*args, **kwargs)
+
+
+class DriveServiceFactory(object):
+    """
+    Builds the drive service without going to the network: the
+    discovery document comes from cache_dir, or from the copy bundled
+    with googleapiclient. It is only fetched, and then cached, when
+    neither has one.
+
+    httplib2 connections aren't thread safe, each thread gets its own
+    authorized one from GetThreadHttp(). They stay open between
+    requests.
+    """
+    def __init__(self, cache_dir, log=None):
+        self.cache_file = os.path.join(cache_dir, DISCOVERY_CACHE_FILE)
+        self.log = log or (lambda level, msg: None)
+        self.document = None
+        self.creds = None
+        self.thread_data = threading.local()
+
+    def __LoadCached(self):
+        try:
+            with open(self.cache_file, 'r') as f:
+                document = f.read()
+            json.loads(document)
+            return document
+        except (IOError, OSError):
+            return None
+        except ValueError:
+            self.log(1, "DriveServiceFactory: Dropping corrupted %s" % self.cache_file)
+            os.remove(self.cache_file)
+            return None
+
+    def __LoadBundled(self):
+        try:
+            from googleapiclient.discovery_cache import get_static_doc
+        except ImportError:
+            # Older googleapiclient, nothing bundled
+            return None
+        return get_static_doc('drive', 'v3')
+
+    def __Fetch(self):
+        self.log(2, "DriveServiceFactory: Fetching %s" % DISCOVERY_URL)
+        resp, content = build_http().request(DISCOVERY_URL)
+        if resp.status != 200:
+            raise DiscoveryDocumentNotFound("Fetching the discovery document failed: %d" % resp.status)
+        document = content.decode('utf-8')
+        json.loads(document)
+
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(document)
+        os.rename(tmp_file, self.cache_file)
+        return document
+
+    def GetDiscoveryDocument(self):
+        if self.document is None:
+            self.document = self.__LoadCached() or self.__LoadBundled() or self.__Fetch()
+        return self.document
+
+    def Build(self, creds):
+        """The drive service for creds. Requests need a connection from GetThreadHttp()."""
+        from googleapiclient.discovery import build_from_document
+
+        self.creds = creds
+        # Drop the connections authorized with earlier credentials
+        self.thread_data = threading.local()
+        return DriveService(build_from_document(self.GetDiscoveryDocument(), credentials=creds))
+
+    def GetThreadHttp(self):
+        """
+        The calling thread's connection. build_http() makes one which
+        doesn't take the 308 of a resumable upload for a redirect.
+        """
+        http = getattr(self.thread_data, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.creds, http=build_http())
+            self.thread_data.http = http
+        return http
@@ -4,8 +4,14 @@ import wx, subprocess, sys
 #from pydrive.auth import GoogleAuth
 try :
     from .GoSyncEvents import *
+    from .GoSyncWorkers import MIN_DOWNLOAD_WORKERS, MAX_DOWNLOAD_WORKERS, MIN_UPLOAD_WORKERS, MAX_UPLOAD_WORKERS
+    from .GoSyncWorkers import MIN_QUIET_WINDOW, MAX_QUIET_WINDOW
+    from .GoSyncExecutor import MIN_REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND
 except (ImportError, ValueError):
     from GoSyncEvents import *
+    from GoSyncWorkers import MIN_DOWNLOAD_WORKERS, MAX_DOWNLOAD_WORKERS, MIN_UPLOAD_WORKERS, MAX_UPLOAD_WORKERS
+    from GoSyncWorkers import MIN_QUIET_WINDOW, MAX_QUIET_WINDOW
+    from GoSyncExecutor import MIN_REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND
 
 use_system_notifs = True
 
@@ -41,7 +47,28 @@ class SettingsPage(wx.Panel):
 
         self.si_spin_btn = wx.SpinCtrl(self, -1, min=30, max=86400)
         self.si_spin_btn.SetValue(self.sync_model.GetSyncInterval())
-        self.Bind(wx.EVT_SPINCTRL, self.OnSyncIntervalSelect)
+        self.si_spin_btn.Bind(wx.EVT_SPINCTRL, self.OnSyncIntervalSelect)
+
+        self.dw_spin_text = wx.StaticText(self, -1, "Parallel downloads: ")
+        self.dw_spin_btn = wx.SpinCtrl(self, -1, min=MIN_DOWNLOAD_WORKERS, max=MAX_DOWNLOAD_WORKERS)
+        self.dw_spin_btn.SetValue(self.sync_model.GetDownloadWorkers())
+        self.dw_spin_btn.Bind(wx.EVT_SPINCTRL, self.OnDownloadWorkersSelect)
+
+        self.uw_spin_text = wx.StaticText(self, -1, "Parallel uploads: ")
+        self.uw_spin_btn = wx.SpinCtrl(self, -1, min=MIN_UPLOAD_WORKERS, max=MAX_UPLOAD_WORKERS)
+        self.uw_spin_btn.SetValue(self.sync_model.GetUploadWorkers())
+        self.uw_spin_btn.Bind(wx.EVT_SPINCTRL, self.OnUploadWorkersSelect)
+
+        self.rps_spin_text = wx.StaticText(self, -1, "Drive requests per second: ")
+        self.rps_spin_btn = wx.SpinCtrl(self, -1, min=MIN_REQUESTS_PER_SECOND, max=MAX_REQUESTS_PER_SECOND)
+        self.rps_spin_btn.SetValue(self.sync_model.GetRequestsPerSecond())
+        self.rps_spin_btn.Bind(wx.EVT_SPINCTRL, self.OnRequestsPerSecondSelect)
+
+        self.qw_spin_text = wx.StaticText(self, -1, "Wait for local changes to settle (in seconds): ")
+        self.qw_spin_btn = wx.SpinCtrlDouble(self, -1, min=MIN_QUIET_WINDOW, max=MAX_QUIET_WINDOW, inc=0.1)
+        self.qw_spin_btn.SetDigits(1)
+        self.qw_spin_btn.SetValue(self.sync_model.GetObserverQuietWindow())
+        self.qw_spin_btn.Bind(wx.EVT_SPINCTRLDOUBLE, self.OnObserverQuietWindowSelect)
         if sys.version_info > (3,):
             ssizer = wx.StaticBoxSizer(wx.VERTICAL, self, "Local Mirror Directory")
             osizer = wx.StaticBoxSizer(wx.VERTICAL, self, "Other Settings")
@@ -54,10 +81,26 @@ class SettingsPage(wx.Panel):
         debug_sizer = wx.BoxSizer(wx.HORIZONTAL)
         button_sizer = wx.BoxSizer(wx.HORIZONTAL)
         si_spin_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        dw_spin_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        uw_spin_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        rps_spin_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        qw_spin_sizer = wx.BoxSizer(wx.HORIZONTAL)
 
         si_spin_sizer.Add(self.si_spin_text, 0, wx.ALL | wx.ALIGN_CENTER)
         si_spin_sizer.Add(self.si_spin_btn, 1, wx.ALL|wx.ALIGN_CENTER)
 
+        dw_spin_sizer.Add(self.dw_spin_text, 0, wx.ALL | wx.ALIGN_CENTER)
+        dw_spin_sizer.Add(self.dw_spin_btn, 1, wx.ALL|wx.ALIGN_CENTER)
+
+        uw_spin_sizer.Add(self.uw_spin_text, 0, wx.ALL | wx.ALIGN_CENTER)
+        uw_spin_sizer.Add(self.uw_spin_btn, 1, wx.ALL|wx.ALIGN_CENTER)
+
+        rps_spin_sizer.Add(self.rps_spin_text, 0, wx.ALL | wx.ALIGN_CENTER)
+        rps_spin_sizer.Add(self.rps_spin_btn, 1, wx.ALL|wx.ALIGN_CENTER)
+
+        qw_spin_sizer.Add(self.qw_spin_text, 0, wx.ALL | wx.ALIGN_CENTER)
+        qw_spin_sizer.Add(self.qw_spin_btn, 1, wx.ALL|wx.ALIGN_CENTER)
+
         debug_sizer.Add(self.lct, 0, wx.ALL|wx.ALIGN_CENTER)
         debug_sizer.AddSpacer(80)
         debug_sizer.Add(self.log_choice, 1, wx.ALL|wx.ALIGN_CENTER)
@@ -72,7 +115,11 @@ class SettingsPage(wx.Panel):
         osizer.Add(self.cb, 0, wx.ALL, 0)
         osizer.Add(self.notif_cb, 1, wx.ALL, 0)
         osizer.Add(si_spin_sizer, 2, wx.ALL, 0)
-        osizer.Add(debug_sizer, 3, wx.ALL, 5)
+        osizer.Add(dw_spin_sizer, 3, wx.ALL, 0)
+        osizer.Add(uw_spin_sizer, 4, wx.ALL, 0)
+        osizer.Add(rps_spin_sizer, 5, wx.ALL, 0)
+        osizer.Add(qw_spin_sizer, 6, wx.ALL, 0)
+        osizer.Add(debug_sizer, 7, wx.ALL, 5)
         osizer.AddSpacer(30)
 
         sizer = wx.BoxSizer(wx.VERTICAL)
@@ -105,6 +152,22 @@ class SettingsPage(wx.Panel):
          interval = event.GetInt()
          self.sync_model.SetSyncInterval(interval)
 
+    def OnDownloadWorkersSelect(self, event):
+         workers = event.GetInt()
+         self.sync_model.SetDownloadWorkers(workers)
+
+    def OnUploadWorkersSelect(self, event):
+         workers = event.GetInt()
+         self.sync_model.SetUploadWorkers(workers)
+
+    def OnRequestsPerSecondSelect(self, event):
+         rate = event.GetInt()
+         self.sync_model.SetRequestsPerSecond(rate)
+
+    def OnObserverQuietWindowSelect(self, event):
+         seconds = self.qw_spin_btn.GetValue()
+         self.sync_model.SetObserverQuietWindow(seconds)
+
     def OnOpenMirror(self, event):
         subprocess.check_call(['xdg-open', self.sync_model.GetLocalMirrorDirectory()])
 
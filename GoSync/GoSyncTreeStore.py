@@ -0,0 +1,173 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import json, threading, sqlite3
+
+class DriveTreeStore(object):
+    """
+    On-disk copy of the GoogleDriveTree. Every change to the tree is
+    written as a single row update, so a crash loses at most the last
+    change instead of the whole tree. The store also remembers whether
+    the last full scan of the drive finished.
+
+    Next to the folders, the store keeps the size and usage category of
+    every file that counts towards the drive usage, so that usage can
+    be kept up to date by deltas instead of rescanning the drive.
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS folders ("
+                            "id TEXT PRIMARY KEY, parent TEXT, name TEXT, data TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS usage ("
+                            "id TEXT PRIMARY KEY, parent TEXT, category TEXT, size INTEGER)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS usage_parent ON usage(parent)")
+            self.db.commit()
+
+    def __Encode(self, data):
+        if data is None:
+            return None
+        return json.dumps(data)
+
+    def AddFolder(self, parent_id, folder_id, name, data):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)",
+                            (folder_id, parent_id, name, self.__Encode(data)))
+            self.db.commit()
+
+    def AddFolders(self, folders):
+        """Add (parent_id, folder_id, name, data) tuples in one transaction."""
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO folders VALUES (?, ?, ?, ?)",
+                                ((i, p, n, self.__Encode(d)) for p, i, n, d in folders))
+            self.db.commit()
+
+    def UpdateFolder(self, folder_id, parent_id, name):
+        with self.lock:
+            self.db.execute("UPDATE folders SET parent=?, name=? WHERE id=?",
+                            (parent_id, name, folder_id))
+            self.db.commit()
+
+    def DeleteFolders(self, folder_ids):
+        with self.lock:
+            self.db.executemany("DELETE FROM folders WHERE id=?", ((i,) for i in folder_ids))
+            self.db.commit()
+
+    def GetFolders(self):
+        """Returns all (parent_id, folder_id, name, data) rows in insertion order."""
+        with self.lock:
+            rows = self.db.execute("SELECT parent, id, name, data FROM folders ORDER BY rowid").fetchall()
+        return [(p, i, n, json.loads(d) if d is not None else None) for p, i, n, d in rows]
+
+    def SetComplete(self, complete):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO state VALUES ('complete', ?)",
+                            ('1' if complete else '0',))
+            self.db.commit()
+
+    def IsComplete(self):
+        with self.lock:
+            row = self.db.execute("SELECT value FROM state WHERE key='complete'").fetchone()
+        return row is not None and row[0] == '1'
+
+    def __AddDelta(self, delta, category, size):
+        delta[category] = delta.get(category, 0) + size
+
+    def SetFileUsage(self, file_id, parent_id, category, size):
+        """
+        Record the usage of one file. Returns the change of the usage
+        per category, which is empty if nothing changed.
+        """
+        delta = {}
+        with self.lock:
+            row = self.db.execute("SELECT parent, category, size FROM usage WHERE id=?",
+                                  (file_id,)).fetchone()
+            if row == (parent_id, category, size):
+                return delta
+            if row:
+                self.__AddDelta(delta, row[1], -row[2])
+            self.__AddDelta(delta, category, size)
+            self.db.execute("INSERT OR REPLACE INTO usage VALUES (?, ?, ?, ?)",
+                            (file_id, parent_id, category, size))
+            self.db.commit()
+        return dict((c, d) for c, d in delta.items() if d)
+
+    def RemoveFileUsage(self, file_id):
+        delta = {}
+        with self.lock:
+            row = self.db.execute("SELECT category, size FROM usage WHERE id=?", (file_id,)).fetchone()
+            if row:
+                self.__AddDelta(delta, row[0], -row[1])
+                self.db.execute("DELETE FROM usage WHERE id=?", (file_id,))
+                self.db.commit()
+        return delta
+
+    def RemoveFolderUsage(self, folder_ids):
+        """Forget the files directly in any of the folders. Returns the change."""
+        delta = {}
+        with self.lock:
+            for folder_id in folder_ids:
+                for category, size in self.db.execute("SELECT category, SUM(size) FROM usage "
+                                                      "WHERE parent=? GROUP BY category", (folder_id,)):
+                    self.__AddDelta(delta, category, -size)
+                self.db.execute("DELETE FROM usage WHERE parent=?", (folder_id,))
+            self.db.commit()
+        return delta
+
+    def MoveFileUsage(self, file_id, parent_id):
+        with self.lock:
+            self.db.execute("UPDATE usage SET parent=? WHERE id=?", (parent_id, file_id))
+            self.db.commit()
+
+    def ReplaceUsage(self, files):
+        """Replace all usage with (file_id, parent_id, category, size) tuples."""
+        with self.lock:
+            self.db.execute("DELETE FROM usage")
+            self.db.executemany("INSERT OR REPLACE INTO usage VALUES (?, ?, ?, ?)", files)
+            self.db.execute("INSERT OR REPLACE INTO state VALUES ('usage', '1')")
+            self.db.commit()
+
+    def HasUsage(self):
+        """False until ReplaceUsage was called, e.g. for trees migrated from a pickle."""
+        with self.lock:
+            return self.db.execute("SELECT value FROM state WHERE key='usage'").fetchone() is not None
+
+    def GetUsageTotals(self):
+        with self.lock:
+            return dict(self.db.execute("SELECT category, SUM(size) FROM usage GROUP BY category"))
+
+    def GetUsageCounts(self):
+        """Number of files per category."""
+        with self.lock:
+            return dict(self.db.execute("SELECT category, COUNT(*) FROM usage GROUP BY category"))
+
+    def Clear(self):
+        with self.lock:
+            self.db.execute("DELETE FROM folders")
+            self.db.execute("DELETE FROM state")
+            self.db.execute("DELETE FROM usage")
+            self.db.commit()
+
+    def Close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,92 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import time, threading, sqlite3
+
+# The drive wants chunks in multiples of 256 KB
+UPLOAD_CHUNK_ALIGN = 256 * 1024
+MIN_UPLOAD_CHUNK_SIZE = UPLOAD_CHUNK_ALIGN
+MAX_UPLOAD_CHUNK_SIZE = 1024 * 1024 * 1024
+DEFAULT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# An upload which fails this many times in a row without getting a
+# chunk through is given up. The session stays for the next attempt.
+MAX_UPLOAD_STALLS = 10
+
+# The drive forgets upload sessions after a week
+UPLOAD_SESSION_LIFETIME = 7 * 24 * 60 * 60
+
+class UploadSessionStore(object):
+    """
+    Resumable upload sessions of the files being uploaded, kept across
+    restarts so that an interrupted upload carries on where it stopped.
+    A session is only good for the content it was started with, so the
+    size and mtime of the file are kept along with it. target tells
+    what the upload was for, e.g. 'parent:<id>' when creating a file
+    and 'file:<id>' when updating one.
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_file, check_same_thread=False)
+        with self.lock:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                            "path TEXT PRIMARY KEY, target TEXT, uri TEXT, "
+                            "offset INTEGER, size INTEGER, mtime REAL, created REAL)")
+            self.db.commit()
+
+    def Save(self, path, target, uri, size, mtime):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, 0, ?, ?, ?)",
+                            (path, target, uri, size, mtime, time.time()))
+            self.db.commit()
+
+    def SetOffset(self, path, offset):
+        with self.lock:
+            self.db.execute("UPDATE sessions SET offset=? WHERE path=?", (offset, path))
+            self.db.commit()
+
+    def Get(self, path):
+        with self.lock:
+            row = self.db.execute("SELECT target, uri, offset, size, mtime, created "
+                                  "FROM sessions WHERE path=?", (path,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('target', 'uri', 'offset', 'size', 'mtime', 'created'), row))
+
+    def Remove(self, path):
+        with self.lock:
+            self.db.execute("DELETE FROM sessions WHERE path=?", (path,))
+            self.db.commit()
+
+    def GetPaths(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT path FROM sessions ORDER BY created")]
+
+    def Expire(self, lifetime=UPLOAD_SESSION_LIFETIME):
+        """Drop sessions the drive doesn't know about anymore."""
+        with self.lock:
+            cur = self.db.execute("DELETE FROM sessions WHERE created < ?", (time.time() - lifetime,))
+            self.db.commit()
+            return cur.rowcount
+
+    def Close(self):
+        with self.lock:
+            self.db.close()
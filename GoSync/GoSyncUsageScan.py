@@ -0,0 +1,149 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+SCAN_FIELDS = 'id, name, mimeType, size, md5Checksum, parents, modifiedTime'
+BULK_PAGE_SIZE = 1000
+
+class ScanAborted(Exception):
+    """The scan was stopped by should_stop()"""
+
+class UsageScanResult(object):
+    def __init__(self):
+        # (parent_id, folder_id, name, metadata), parents before children
+        self.folders = []
+        # (folder_id, folder_path, file_list) for every folder scanned
+        self.listings = []
+        # (file_id, parent_id, category, size) for every file counted
+        self.files = []
+        # Bytes and number of files per category
+        self.usage = {}
+        self.counts = {}
+        self.file_count = 0
+        self.requests = 0
+
+    def AddUsage(self, category, size):
+        self.usage[category] = self.usage.get(category, 0) + size
+        self.counts[category] = self.counts.get(category, 0) + 1
+
+
+class DriveUsageScanner(object):
+    """
+    Walks the whole drive, collecting the folder hierarchy and the
+    space used per category. This doesn't depend on wx, the caller
+    hooks progress reporting in through callbacks.
+
+    execute(request) runs a googleapiclient request (the model passes
+    its RequestExecutor). classify(f) returns the usage category of a
+    file or None if it doesn't count (google documents).
+    """
+    def __init__(self, drive, execute, classify, page_size=BULK_PAGE_SIZE):
+        self.drive = drive
+        self.execute = execute
+        self.classify = classify
+        self.page_size = page_size
+
+    def __List(self, result, query, page_size=None, on_page=None):
+        files = []
+        page_token = None
+        while True:
+            kwargs = {'q': query, 'spaces': 'drive',
+                      'fields': 'nextPageToken, files(%s)' % SCAN_FIELDS,
+                      'pageToken': page_token}
+            if page_size:
+                kwargs['pageSize'] = page_size
+            response = self.execute(self.drive.files().list(**kwargs))
+            result.requests += 1
+            page = response.get('files', [])
+            if on_page:
+                on_page(page)
+            else:
+                files.extend(page)
+            page_token = response.get('nextPageToken')
+            if page_token is None:
+                return files
+
+    def __Count(self, result, f, parent_id, on_progress):
+        result.file_count += 1
+        if f['mimeType'] != FOLDER_MIME_TYPE:
+            category = self.classify(f)
+            if category is not None:
+                size = int(f.get('size', 0))
+                result.AddUsage(category, size)
+                result.files.append((f['id'], parent_id, category, size))
+        if on_progress:
+            on_progress(result.file_count, f)
+
+    def ScanRecursive(self, on_progress=None, should_stop=None):
+        """One list query per folder, like GoSync always did."""
+        result = UsageScanResult()
+        stack = [('root', '')]
+        while stack:
+            if should_stop and should_stop():
+                raise ScanAborted()
+
+            folder_id, folder_path = stack.pop()
+            file_list = self.__List(result, "'%s' in parents and trashed=false" % folder_id)
+            result.listings.append((folder_id, folder_path, file_list))
+            for f in file_list:
+                self.__Count(result, f, folder_id, on_progress)
+                if f['mimeType'] == FOLDER_MIME_TYPE:
+                    result.folders.append((folder_id, f['id'], f['name'], f))
+                    stack.append((f['id'], os.path.join(folder_path, f['name'])))
+        return result
+
+    def ScanBulk(self, root_id, on_progress=None, should_stop=None):
+        """
+        Pages through every file of the drive once and puts the
+        hierarchy together from the parents of each file. root_id is
+        the real id of the root folder, as the API reports it in
+        parents. Files which can't be reached from the root (shared
+        with me, orphans) are not counted, same as the recursive scan.
+        """
+        result = UsageScanResult()
+        children = {}
+
+        def on_page(page):
+            if should_stop and should_stop():
+                raise ScanAborted()
+            for f in page:
+                for parent in f.get('parents') or []:
+                    children.setdefault(parent, []).append(f)
+
+        self.__List(result, "trashed=false", self.page_size, on_page)
+
+        # Walk down from the root so that only reachable files count
+        # and folders come out parent first.
+        seen = set()
+        stack = [(root_id, 'root', '')]
+        while stack:
+            folder_id, tree_id, folder_path = stack.pop()
+            file_list = children.pop(folder_id, [])
+            result.listings.append((tree_id, folder_path, file_list))
+            for f in file_list:
+                # Old drives allow a file in several folders. Count it once.
+                if f['id'] in seen:
+                    continue
+                seen.add(f['id'])
+                self.__Count(result, f, tree_id, on_progress)
+                if f['mimeType'] == FOLDER_MIME_TYPE:
+                    result.folders.append((tree_id, f['id'], f['name'], f))
+                    stack.append((f['id'], f['id'], os.path.join(folder_path, f['name'])))
+        return result
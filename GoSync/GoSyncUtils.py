@@ -16,7 +16,13 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
 #
 
-import threading
+import threading, hashlib, calendar, time
+
+# Files are hashed in blocks of this size through one reused buffer, so
+# the memory needed does not depend on the size of the file. hashlib
+# releases the GIL for blocks this big, so threads hashing different
+# files (e.g. the download and upload workers) really run in parallel.
+HASH_BLOCK_SIZE = 1024 * 1024
 
 class AtomicVariable(object):
     def __init__(self, initial):
@@ -32,3 +38,33 @@ class AtomicVariable(object):
             self._value = new
 
     value = property(get_value, set_value)
+
+
+def Md5OfFile(abs_filepath, block_size=HASH_BLOCK_SIZE):
+    md5 = hashlib.md5()
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    with open(abs_filepath, 'rb', buffering=0) as f:
+        while True:
+            nread = f.readinto(buf)
+            if not nread:
+                break
+            md5.update(view[:nread])
+    return md5.hexdigest()
+
+
+def ParseDriveTime(value):
+    """Seconds since the epoch of an RFC 3339 time like modifiedTime."""
+    value = value.rstrip('Z')
+    value, _, fraction = value.partition('.')
+    seconds = calendar.timegm(time.strptime(value, '%Y-%m-%dT%H:%M:%S'))
+    return seconds + float('0.' + fraction) if fraction else seconds
+
+
+def SplitRange(total_byte_len, part_size_limit):
+    """[first, last] byte ranges of at most part_size_limit bytes covering total_byte_len bytes."""
+    s = []
+    for p in range(0, total_byte_len, part_size_limit):
+        last = min(total_byte_len - 1, p + part_size_limit - 1)
+        s.append([p, last])
+    return s
@@ -0,0 +1,956 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os, sys, time, threading
+from collections import deque
+if sys.version_info > (3,):
+    import queue
+else:
+    import Queue as queue
+
+try :
+    from .GoSyncEvents import *
+    from .GoSyncUtils import *
+except (ImportError, ValueError):
+    from GoSyncEvents import *
+    from GoSyncUtils import *
+
+MIN_DOWNLOAD_WORKERS = 1
+MAX_DOWNLOAD_WORKERS = 16
+DEFAULT_DOWNLOAD_WORKERS = 4
+MIN_DOWNLOAD_CHUNK_SIZE = 256 * 1024
+MAX_DOWNLOAD_CHUNK_SIZE = 1024 * 1024 * 1024
+DEFAULT_DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+MIN_DOWNLOAD_CONNECTIONS = 1
+MAX_DOWNLOAD_CONNECTIONS = 16
+DEFAULT_DOWNLOAD_CONNECTIONS = 4
+SEGMENT_MAX_ATTEMPTS = 5
+MIN_UPLOAD_WORKERS = 1
+MAX_UPLOAD_WORKERS = 16
+DEFAULT_UPLOAD_WORKERS = 4
+# Drive refuses batches of more than 100 calls
+MAX_BATCH_SIZE = 100
+BATCH_DELAY = 0.5
+BATCH_MAX_ATTEMPTS = 5
+MIN_QUIET_WINDOW = 0.1
+MAX_QUIET_WINDOW = 60
+DEFAULT_QUIET_WINDOW = 1.0
+# A file which keeps changing is uploaded anyway after this many quiet windows
+MAX_QUIET_WINDOWS = 30
+
+# Files being downloaded are written under this suffix and renamed
+# when complete. The observer ignores them.
+TEMP_FILE_SUFFIX = '.gosync-part'
+
+def IsTempFile(path):
+    return path.endswith(TEMP_FILE_SUFFIX)
+
+def SegmentStatePath(temp_path):
+    """Where SegmentedDownload keeps which segments of temp_path it has."""
+    return temp_path[:-len(TEMP_FILE_SUFFIX)] + '-segments' + TEMP_FILE_SUFFIX
+
+class DownloadCorrupted(RuntimeError):
+    """The downloaded file doesn't match the MD5 of the drive"""
+
+class DownloadPool(object):
+    """
+    A bounded pool of threads downloading files for the sync thread.
+    The remote walk feeds it with Submit() and blocks when the workers
+    are behind. Every worker talks to the drive over its own HTTP
+    connection (see GoSyncModel.GetThreadHttp).
+    """
+    def __init__(self, sync_model, workers=DEFAULT_DOWNLOAD_WORKERS):
+        self.sync_model = sync_model
+        self.queue = queue.Queue(maxsize=workers * 4)
+        self.lock = threading.Lock()
+        self.submitted_paths = set()
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.active = 0
+        self.discard = False
+        self.workers = []
+
+        for i in range(workers):
+            t = threading.Thread(target=self.__Worker, name="GoSyncDownload-%d" % i)
+            t.daemon = True
+            t.start()
+            self.workers.append(t)
+
+    def IsAborting(self):
+        return self.discard or not self.sync_model.syncRunning.is_set() or \
+            self.sync_model.shutting_down
+
+    def GetPendingCount(self):
+        return self.queue.qsize()
+
+    def GetActiveCount(self):
+        with self.lock:
+            return self.active
+
+    def Submit(self, file_obj, download_path):
+        abs_filepath = os.path.join(download_path, file_obj['name'])
+        with self.lock:
+            # Two remote files with the same name in one folder would
+            # race for the same local file.
+            if abs_filepath in self.submitted_paths:
+                self.sync_model.SendlToLog(2, "DownloadPool: %s already being downloaded. Skipping duplicate."
+                                           % abs_filepath)
+                return
+            self.submitted_paths.add(abs_filepath)
+            self.queued += 1
+
+        while True:
+            try:
+                self.queue.put((file_obj, download_path), timeout=1)
+                return
+            except queue.Full:
+                if self.IsAborting():
+                    with self.lock:
+                        self.queued -= 1
+                    return
+
+    def __PostProgress(self):
+        with self.lock:
+            msg = "Downloaded %d of %d files" % (self.completed, self.queued)
+            if self.failed:
+                msg += " (%d failed)" % self.failed
+        GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE, {msg})
+
+    def __Worker(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                break
+
+            file_obj, download_path = task
+            failed = False
+            with self.lock:
+                self.active += 1
+            try:
+                if not self.IsAborting():
+                    self.sync_model.DownloadFileByObject(file_obj, download_path)
+            except:
+                failed = True
+                self.sync_model.logger.exception("DownloadPool: Failed to download %s"
+                                                 % os.path.join(download_path, file_obj['name']))
+
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+                if failed:
+                    self.failed += 1
+            self.__PostProgress()
+            self.queue.task_done()
+
+    def Close(self, discard=False):
+        """
+        Wait for the queued downloads and stop the workers. With discard,
+        downloads that haven't started yet are dropped. Returns the number
+        of failed downloads.
+        """
+        if discard:
+            self.discard = True
+
+        for t in self.workers:
+            self.queue.put(None)
+        for t in self.workers:
+            t.join()
+
+        return self.failed
+
+
+class UploadQueue(object):
+    """
+    Local paths waiting to be uploaded, worked on by a set of threads
+    so that neither the observer nor the sync thread waits on the
+    network. A path queued again before its upload started is only
+    uploaded once. A path is not handed to a worker while one of its
+    parent directories is still queued or being uploaded, so folders
+    always exist on the drive before their content.
+    """
+    def __init__(self, sync_model, workers=DEFAULT_UPLOAD_WORKERS):
+        self.sync_model = sync_model
+        self.cond = threading.Condition()
+        # Every path queued and not started yet
+        self.pending = set()
+        # Paths which may be ready to go, in the order they came. Paths
+        # dropped from pending are skipped when their turn comes.
+        self.ready = deque()
+        # Blocking path -> paths waiting for its upload to finish
+        self.waiting = {}
+        self.in_flight = set()
+        self.stopping = False
+        self.uploaded = 0
+        self.failed = 0
+        self.workers = []
+        self.started = 0
+        self.SetWorkers(workers)
+
+    def SetWorkers(self, workers):
+        """Change the number of workers. Surplus ones stop once they are idle."""
+        with self.cond:
+            self.target = workers
+            while len(self.workers) < workers and not self.stopping:
+                t = threading.Thread(target=self.__Worker, name="GoSyncUpload-%d" % self.started)
+                t.daemon = True
+                t.start()
+                self.workers.append(t)
+                self.started += 1
+            self.cond.notify_all()
+
+    def Submit(self, file_path):
+        with self.cond:
+            if file_path in self.pending:
+                self.sync_model.SendlToLog(3, "UploadQueue: %s is already queued" % file_path)
+                return
+            self.pending.add(file_path)
+            self.__Schedule(file_path)
+            self.cond.notify()
+
+    def Remove(self, file_path):
+        """Drop a queued path (and anything below it) which is gone locally."""
+        with self.cond:
+            prefix = file_path + '/'
+            for path in [p for p in self.pending if p == file_path or p.startswith(prefix)]:
+                self.pending.discard(path)
+                self.__Release(path)
+            self.cond.notify_all()
+
+    def GetPendingCount(self):
+        with self.cond:
+            return len(self.pending) + len(self.in_flight)
+
+    def GetActiveCount(self):
+        with self.cond:
+            return len(self.in_flight)
+
+    def WaitFor(self, file_path, timeout=None):
+        """
+        Wait until neither file_path nor any of its parents is queued or
+        being uploaded. Returns False on timeout.
+        """
+        deadline = time.time() + timeout if timeout else None
+        with self.cond:
+            while file_path in self.pending or self.__Blocker(file_path):
+                remaining = deadline - time.time() if deadline else 1
+                if remaining <= 0 or self.stopping:
+                    return False
+                self.cond.wait(min(remaining, 1))
+        return True
+
+    def __Blocker(self, file_path):
+        """The path file_path has to wait for, None if it can go."""
+        if file_path in self.in_flight:
+            return file_path
+
+        parent = os.path.dirname(file_path)
+        while parent and parent != '/':
+            if parent in self.pending or parent in self.in_flight:
+                return parent
+            parent = os.path.dirname(parent)
+        return None
+
+    def __Schedule(self, file_path):
+        blocker = self.__Blocker(file_path)
+        if blocker:
+            self.waiting.setdefault(blocker, []).append(file_path)
+        else:
+            self.ready.append(file_path)
+
+    def __Release(self, blocker):
+        """blocker is done or dropped, what waited for it may be ready."""
+        waiters = self.waiting.pop(blocker, None)
+        if waiters:
+            self.ready.extend(waiters)
+
+    def __NextTask(self):
+        while self.ready:
+            path = self.ready.popleft()
+            if path not in self.pending:
+                continue
+            # A parent may have been queued after path was
+            blocker = self.__Blocker(path)
+            if blocker:
+                self.waiting.setdefault(blocker, []).append(path)
+                continue
+            self.pending.discard(path)
+            self.in_flight.add(path)
+            return path
+        return None
+
+    def __Worker(self):
+        while True:
+            with self.cond:
+                file_path = None
+                while not self.stopping and len(self.workers) <= self.target:
+                    file_path = self.__NextTask()
+                    if file_path:
+                        break
+                    self.cond.wait()
+                if not file_path:
+                    self.workers.remove(threading.current_thread())
+                    return
+                queued = len(self.pending)
+
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE,
+                                              {"Uploading: %s (%d queued)" %
+                                               (os.path.basename(file_path), queued)})
+            failed = False
+            try:
+                self.sync_model.UploadQueuedFile(file_path)
+            except:
+                failed = True
+                self.sync_model.logger.exception("UploadQueue: Failed to upload %s" % file_path)
+
+            with self.cond:
+                self.in_flight.discard(file_path)
+                self.__Release(file_path)
+                if failed:
+                    self.failed += 1
+                else:
+                    self.uploaded += 1
+                self.cond.notify_all()
+
+    def Join(self, abort_check=None):
+        """
+        Wait until everything queued is uploaded. Returns False if
+        abort_check() said to stop waiting.
+        """
+        with self.cond:
+            while self.pending or self.in_flight:
+                if abort_check and abort_check():
+                    return False
+                self.cond.wait(1)
+        return True
+
+    def Close(self):
+        """Stop the workers. Queued uploads which haven't started are dropped."""
+        with self.cond:
+            self.stopping = True
+            self.pending.clear()
+            self.ready.clear()
+            self.waiting.clear()
+            self.cond.notify_all()
+            workers = list(self.workers)
+        for t in workers:
+            t.join()
+
+
+class BatchItem(object):
+    def __init__(self, request, on_success, on_failure, description, key):
+        self.request = request
+        self.key = key
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.description = description
+        self.attempts = 0
+        self.not_before = 0
+
+
+class DriveBatcher(object):
+    """
+    Collects metadata calls (rename, move, trash) and sends them to the
+    drive as batch requests of up to MAX_BATCH_SIZE calls. A call waits
+    at most BATCH_DELAY seconds for others to join it. Every call has
+    its own success and failure callback; calls failing with a rate
+    limit or server error are retried in a later batch. Callbacks run
+    on the batcher thread.
+
+    Calls in one batch may be run by the server in any order. Calls
+    submitted with the same key (the file id) are therefore never put
+    in the same batch and are sent in the order they were submitted.
+    """
+    def __init__(self, sync_model, delay=BATCH_DELAY, max_batch=MAX_BATCH_SIZE):
+        self.sync_model = sync_model
+        self.delay = delay
+        self.max_batch = max_batch
+        self.cond = threading.Condition()
+        self.pending = []
+        self.in_flight = 0
+        self.flush_now = False
+        self.first_queued = 0
+        self.stopping = False
+        self.sent = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self.__Worker, name="GoSyncBatcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def Submit(self, request, on_success=None, on_failure=None, description='', key=None):
+        with self.cond:
+            self.pending.append(BatchItem(request, on_success, on_failure, description, key))
+            if len(self.pending) >= self.max_batch:
+                self.cond.notify_all()
+            elif len(self.pending) == 1:
+                self.first_queued = time.time()
+                self.cond.notify_all()
+
+    def GetPendingCount(self):
+        with self.cond:
+            return len(self.pending) + self.in_flight
+
+    def Flush(self, timeout=None):
+        """Send everything queued now and wait until it is done."""
+        deadline = time.time() + timeout if timeout else None
+        with self.cond:
+            self.flush_now = True
+            self.cond.notify_all()
+            try:
+                while self.pending or self.in_flight:
+                    remaining = deadline - time.time() if deadline else 1
+                    if remaining <= 0 or self.stopping:
+                        return False
+                    self.cond.wait(min(remaining, 1))
+            finally:
+                self.flush_now = False
+        return True
+
+    def __NextBatch(self):
+        """Called with the lock held. Returns the items to send or None to keep waiting."""
+        now = time.time()
+        ready = []
+        held_keys = set()
+        for item in self.pending:
+            if item.key is not None:
+                if item.key in held_keys:
+                    continue
+                held_keys.add(item.key)
+            if item.not_before <= now:
+                ready.append(item)
+        if not ready:
+            return None
+
+        if len(ready) < self.max_batch and not self.flush_now and not self.stopping and \
+                now - self.first_queued < self.delay:
+            return None
+
+        batch = ready[:self.max_batch]
+        for item in batch:
+            self.pending.remove(item)
+        self.in_flight += len(batch)
+        return batch
+
+    def __WaitTime(self):
+        now = time.time()
+        if not self.pending:
+            return None
+        wake = min(item.not_before for item in self.pending)
+        wake = max(wake, self.first_queued + self.delay)
+        return max(0.01, min(wake - now, 1))
+
+    def __Callback(self, func, arg, description):
+        try:
+            func(arg)
+        except:
+            self.sync_model.logger.exception("DriveBatcher: Callback for %s failed" % description)
+
+    def __Complete(self, item, response, exception):
+        if exception is None:
+            self.sent += 1
+            if item.on_success:
+                self.__Callback(item.on_success, response, item.description)
+            return
+
+        executor = self.sync_model.executor
+        retriable, throttled = executor.ClassifyError(exception)
+        if retriable and item.attempts < BATCH_MAX_ATTEMPTS and executor.TakeRetry():
+            self.sync_model.SendlToLog(2, "DriveBatcher: Retrying %s (%s)" % (item.description, exception))
+            item.not_before = time.time() + executor.Backoff(item.attempts, exception)
+            with self.cond:
+                # Ahead of anything submitted for the same file since
+                self.pending.insert(0, item)
+            return
+
+        self.failed += 1
+        self.sync_model.SendlToLog(1, "DriveBatcher: %s failed: %s" % (item.description, exception))
+        if item.on_failure:
+            self.__Callback(item.on_failure, exception, item.description)
+
+    def __Send(self, batch):
+        def callback(item):
+            return lambda request_id, response, exception: \
+                self.__Complete(item, response, exception)
+
+        http_batch = self.sync_model.drive.new_batch_http_request()
+        for item in batch:
+            item.attempts += 1
+            http_batch.add(item.request, callback=callback(item))
+
+        self.sync_model.SendlToLog(3, "DriveBatcher: Sending %d calls" % len(batch))
+        http = self.sync_model.GetThreadHttp()
+        try:
+            # Each call in the batch counts against the quota
+            self.sync_model.executor.Call(lambda: http_batch.execute(http=http),
+                                          "Batch of %d calls" % len(batch), len(batch), 'drive.batch')
+        except Exception as e:
+            # The batch as a whole didn't make it, nothing was called back
+            for item in batch:
+                self.__Complete(item, None, e)
+
+    def __Worker(self):
+        while True:
+            with self.cond:
+                batch = None
+                while True:
+                    batch = self.__NextBatch()
+                    if batch or (self.stopping and not self.pending):
+                        break
+                    self.cond.wait(self.__WaitTime())
+                if not batch:
+                    return
+                if self.pending:
+                    self.first_queued = time.time()
+
+            try:
+                self.__Send(batch)
+            except:
+                self.sync_model.logger.exception("DriveBatcher: Failed to send batch")
+
+            with self.cond:
+                self.in_flight -= len(batch)
+                self.cond.notify_all()
+
+    def Close(self, timeout=10):
+        """Send what is still queued (giving up after timeout) and stop."""
+        self.Flush(timeout)
+        with self.cond:
+            self.stopping = True
+            self.pending = []
+            self.cond.notify_all()
+        self.thread.join()
+
+
+class PendingChange(object):
+    """The net change of a local path since its events were last dispatched."""
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    MOVE = 'move'
+
+    def __init__(self, op, is_dir, origin=None, dirty=False):
+        self.op = op
+        self.is_dir = is_dir
+        # MOVE: the local path the drive file was at
+        self.origin = origin
+        # MOVE: the content changed as well
+        self.dirty = dirty
+        self.seq = 0
+        self.first_seen = 0
+        self.deadline = 0
+        self.stat = None
+
+
+class LocalEventAggregator(object):
+    """
+    Sits between the observer and the model. Events are collected per
+    path and acted upon once the path was quiet for quiet_window
+    seconds, so that bursts collapse into their net change:
+
+        create, modify, modify  -> one upload
+        create, delete          -> nothing
+        delete, create          -> update of the drive file
+        write temp, rename over -> update of the target
+        move a to b, move b to c -> one move from a to c
+
+    Files whose size or mtime still changed when the window is over are
+    being written and wait for another window. Ready changes are
+    dispatched together on the aggregator thread: new folders, then
+    moves, then deletes, then file uploads.
+    """
+    def __init__(self, sync_model, quiet_window=DEFAULT_QUIET_WINDOW):
+        self.sync_model = sync_model
+        self.quiet_window = quiet_window
+        self.cond = threading.Condition()
+        self.pending = {}
+        self.seq = 0
+        self.stopping = False
+        self.dispatched = 0
+        self.thread = threading.Thread(target=self.__Worker, name="GoSyncEvents")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def SetQuietWindow(self, seconds):
+        with self.cond:
+            self.quiet_window = seconds
+
+    def GetPendingCount(self):
+        with self.cond:
+            return len(self.pending)
+
+    def __Stat(self, path):
+        try:
+            st = os.stat(path)
+            return (st.st_size, st.st_mtime)
+        except OSError:
+            return None
+
+    def __Touch(self, path, change):
+        """Called with the lock held: (re)start the quiet window of path."""
+        now = time.time()
+        if not change.seq:
+            self.seq += 1
+            change.seq = self.seq
+            change.first_seen = now
+        change.deadline = now + self.quiet_window
+        if not change.is_dir:
+            change.stat = self.__Stat(path)
+        self.pending[path] = change
+        self.cond.notify()
+
+    def __Below(self, path):
+        prefix = path + os.sep
+        return [p for p in self.pending if p.startswith(prefix)]
+
+    def __RemoteGone(self, path, is_dir, seen=None):
+        """
+        The drive file of path is to go, though something else may be
+        at path locally by now.
+        """
+        seen = seen or set()
+        if path in seen:
+            return
+        seen.add(path)
+
+        change = self.pending.get(path)
+        if change is None:
+            change = PendingChange(PendingChange.DELETE, is_dir)
+        elif change.op == PendingChange.CREATE:
+            # The new file takes the place of the drive file
+            change.op = PendingChange.UPDATE
+        elif change.op == PendingChange.MOVE:
+            # Put the content of the moved file into the drive file
+            # instead, and drop the drive file it was moved from.
+            origin = change.origin
+            change = PendingChange(PendingChange.UPDATE, change.is_dir)
+            self.__RemoteGone(origin, change.is_dir, seen)
+        self.__Touch(path, change)
+
+    def __Deleted(self, path, is_dir):
+        if is_dir:
+            # The drive folder takes its content with it. Only drive
+            # files moved in from elsewhere need to be dealt with.
+            for child in self.__Below(path):
+                change = self.pending.pop(child)
+                if change.op == PendingChange.MOVE and \
+                        not change.origin.startswith(path + os.sep):
+                    self.__RemoteGone(change.origin, change.is_dir)
+
+        change = self.pending.pop(path, None)
+        if change is None or change.op in (PendingChange.UPDATE, PendingChange.DELETE):
+            self.__Touch(path, PendingChange(PendingChange.DELETE, is_dir))
+        elif change.op == PendingChange.MOVE:
+            self.__RemoteGone(change.origin, change.is_dir)
+        # CREATE: it never made it to the drive
+
+    def Created(self, path, is_dir):
+        with self.cond:
+            change = self.pending.get(path)
+            if change is None:
+                change = PendingChange(PendingChange.CREATE, is_dir)
+            elif change.op == PendingChange.DELETE:
+                change = PendingChange(PendingChange.UPDATE, is_dir)
+            self.__Touch(path, change)
+
+    def Modified(self, path):
+        with self.cond:
+            change = self.pending.get(path)
+            if change is None or change.op == PendingChange.DELETE:
+                change = PendingChange(PendingChange.UPDATE, False)
+            elif change.op == PendingChange.MOVE:
+                change.dirty = True
+            self.__Touch(path, change)
+
+    def Deleted(self, path, is_dir):
+        with self.cond:
+            self.__Deleted(path, is_dir)
+
+    def Moved(self, src_path, dest_path, is_dir):
+        with self.cond:
+            change = self.pending.pop(src_path, None)
+            if IsTempFile(src_path) or \
+                    (change and change.op in (PendingChange.CREATE, PendingChange.DELETE)):
+                # Nothing on the drive to move, only content to upload
+                origin, dirty = None, True
+            elif change and change.op == PendingChange.MOVE:
+                origin, dirty = change.origin, change.dirty
+            else:
+                origin, dirty = src_path, change is not None
+
+            # Whatever was at the destination is overwritten
+            replaced = self.pending.pop(dest_path, None)
+            if replaced and replaced.op == PendingChange.MOVE:
+                self.__RemoteGone(replaced.origin, replaced.is_dir)
+
+            if origin is None:
+                new = PendingChange(PendingChange.UPDATE, is_dir)
+            elif replaced and replaced.op in (PendingChange.UPDATE, PendingChange.DELETE):
+                # A drive file is already at the destination: it gets
+                # the content and the moved one goes.
+                self.__RemoteGone(origin, is_dir)
+                new = PendingChange(PendingChange.UPDATE, is_dir)
+            elif origin == dest_path:
+                new = PendingChange(PendingChange.UPDATE, is_dir) if dirty else None
+            else:
+                new = PendingChange(PendingChange.MOVE, is_dir, origin, dirty)
+
+            if new:
+                self.__Touch(dest_path, new)
+
+            if is_dir:
+                # Changes below the folder move along. They are
+                # dispatched after the folder was moved on the drive.
+                for child in self.__Below(src_path):
+                    c = self.pending.pop(child)
+                    if c.origin and c.origin.startswith(src_path + os.sep):
+                        c.origin = dest_path + c.origin[len(src_path):]
+                    c.seq = 0
+                    self.__Touch(dest_path + child[len(src_path):], c)
+
+    def __TakeReady(self):
+        """Called with the lock held. Returns the ready changes and how long to wait for more."""
+        now = time.time()
+        ready = []
+        wait = None
+        for path, change in list(self.pending.items()):
+            if change.deadline <= now and not change.is_dir and \
+                    change.op != PendingChange.DELETE and \
+                    now - change.first_seen < self.quiet_window * MAX_QUIET_WINDOWS:
+                stat = self.__Stat(path)
+                if stat != change.stat:
+                    # Still being written
+                    change.stat = stat
+                    change.deadline = now + self.quiet_window
+
+            if change.deadline <= now:
+                del self.pending[path]
+                ready.append((path, change))
+            elif wait is None or change.deadline - now < wait:
+                wait = change.deadline - now
+        return ready, wait
+
+    def __Rank(self, item):
+        path, change = item
+        if change.op in (PendingChange.CREATE, PendingChange.UPDATE):
+            rank = 0 if change.is_dir else 3
+        elif change.op == PendingChange.MOVE:
+            rank = 1
+        else:
+            rank = 2
+        return (rank, change.seq)
+
+    def __Dispatch(self, path, change):
+        model = self.sync_model
+        if change.op == PendingChange.MOVE:
+            # A new parent folder has to be on the drive first
+            if model.upload_queue:
+                model.upload_queue.WaitFor(os.path.dirname(path))
+            model.HandleMovedFile(change.origin, path)
+            if change.dirty:
+                model.UploadObservedFile(path)
+        elif change.op == PendingChange.DELETE:
+            model.TrashObservedFile(path)
+        else:
+            model.UploadObservedFile(path)
+
+    def __Worker(self):
+        while True:
+            with self.cond:
+                while not self.stopping:
+                    ready, wait = self.__TakeReady()
+                    if ready:
+                        break
+                    self.cond.wait(wait)
+                if self.stopping:
+                    return
+
+            self.sync_model.SendlToLog(3, "LocalEventAggregator: Dispatching %d changes" % len(ready))
+            for path, change in sorted(ready, key=self.__Rank):
+                try:
+                    self.__Dispatch(path, change)
+                except:
+                    self.sync_model.logger.exception("LocalEventAggregator: Failed to %s %s"
+                                                     % (change.op, path))
+            self.dispatched += len(ready)
+
+    def Close(self):
+        """Stop. Changes still waiting are dropped, the next sync finds them."""
+        with self.cond:
+            self.stopping = True
+            self.pending.clear()
+            self.cond.notify_all()
+        self.thread.join()
+
+
+class SegmentedDownload(object):
+    """
+    Downloads one large file over several connections at once. The
+    file is split into segments of segment_size bytes which the
+    threads fetch with ranged requests and write into a preallocated,
+    sparse temp file with positional writes. Finished segments are
+    recorded next to the temp file, so an interrupted download only
+    fetches what is missing. A failed segment is retried on its own,
+    the download fails when one fails SEGMENT_MAX_ATTEMPTS times.
+    """
+    def __init__(self, sync_model, file_obj, temp_path, total_size, description,
+                 abort_check, connections=DEFAULT_DOWNLOAD_CONNECTIONS,
+                 segment_size=DEFAULT_DOWNLOAD_CHUNK_SIZE):
+        self.sync_model = sync_model
+        self.file_obj = file_obj
+        self.temp_path = temp_path
+        self.total_size = total_size
+        self.description = description
+        self.abort_check = abort_check
+        self.connections = connections
+        self.segment_size = segment_size
+        self.segments = SplitRange(total_size, segment_size)
+        self.state_path = SegmentStatePath(temp_path)
+        self.done = bytearray(b'0' * len(self.segments))
+        self.lock = threading.Lock()
+        self.queue = deque()
+        self.fd = None
+        self.error = None
+        self.aborted = False
+        self.md5 = None
+
+    def __StateHeader(self):
+        return "%d %d\n" % (self.total_size, self.segment_size)
+
+    def __LoadState(self):
+        try:
+            with open(self.state_path) as f:
+                if f.readline() == self.__StateHeader():
+                    state = f.readline().strip()
+                    if len(state) == len(self.segments):
+                        self.done = bytearray(state.encode('ascii'))
+                        return
+        except (IOError, OSError):
+            pass
+
+        # No state. A partial file from a streamed download holds
+        # everything below its size.
+        size = os.path.getsize(self.temp_path) if os.path.exists(self.temp_path) else 0
+        if size < self.total_size:
+            for i, (first, last) in enumerate(self.segments):
+                if last < size:
+                    self.done[i] = ord('1')
+
+    def __SaveState(self):
+        """Called with the lock held."""
+        with open(self.state_path, 'w') as f:
+            f.write(self.__StateHeader())
+            f.write(self.done.decode('ascii') + '\n')
+
+    def __Fetch(self, http, first, last):
+        request = self.sync_model.drive.files().get_media(fileId=self.file_obj['id'])
+        request.headers['Range'] = "bytes=%d-%d" % (first, last)
+        data = self.sync_model.executor.Execute(request, "Download %s [%d-%d]"
+                                                % (self.description, first, last), http)
+        self.sync_model.metrics.CountBytes('drive.files.get_media', received=len(data))
+        if len(data) != last - first + 1:
+            raise IOError("Got %d bytes instead of %d" % (len(data), last - first + 1))
+
+        view = memoryview(data)
+        offset = first
+        while view:
+            written = os.pwrite(self.fd, view, offset)
+            view = view[written:]
+            offset += written
+
+    def __Worker(self):
+        http = self.sync_model.GetThreadHttp()
+        while True:
+            with self.lock:
+                if self.error or self.aborted or not self.queue:
+                    return
+                index, attempts = self.queue.popleft()
+
+            if self.abort_check():
+                with self.lock:
+                    self.aborted = True
+                return
+
+            first, last = self.segments[index]
+            try:
+                self.__Fetch(http, first, last)
+            except Exception as e:
+                attempts += 1
+                self.sync_model.SendlToLog(1, "SegmentedDownload: Bytes %d-%d of %s failed (%s), attempt %d"
+                                           % (first, last, self.description, e, attempts))
+                with self.lock:
+                    if attempts >= SEGMENT_MAX_ATTEMPTS:
+                        self.error = e
+                    else:
+                        self.queue.append((index, attempts))
+                continue
+
+            with self.lock:
+                self.done[index] = ord('1')
+                self.__SaveState()
+                percent = self.done.count(ord('1')) * 100 // len(self.segments)
+            GoSyncEventController().PostEvent(GOSYNC_EVENT_SYNC_UPDATE,
+                                              {'Downloading (%s) %d%%' % (self.description, percent)})
+
+    def Run(self):
+        """
+        Returns True once the whole file is in temp_path and matches
+        the MD5 of the drive, False if abort_check() stopped it.
+        """
+        self.__LoadState()
+        for i in range(len(self.segments)):
+            if self.done[i] != ord('1'):
+                self.queue.append((i, 0))
+        if self.queue:
+            self.sync_model.SendlToLog(2, "SegmentedDownload: %s: %d of %d segments to fetch over %d connections"
+                                       % (self.description, len(self.queue), len(self.segments),
+                                          self.connections))
+
+        # The state has to be there before the temp file gets its full
+        # size, a streamed download would take it for complete otherwise
+        with self.lock:
+            self.__SaveState()
+        self.fd = os.open(self.temp_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Sparse, the blocks are only allocated as they are written
+            os.ftruncate(self.fd, self.total_size)
+            workers = []
+            for i in range(min(self.connections, len(self.queue))):
+                t = threading.Thread(target=self.__Worker, name="GoSyncSegment-%d" % i)
+                t.daemon = True
+                t.start()
+                workers.append(t)
+            for t in workers:
+                t.join()
+        finally:
+            os.close(self.fd)
+
+        if self.error:
+            raise self.error
+        if self.aborted:
+            return False
+
+        self.md5 = Md5OfFile(self.temp_path)
+        # Not there if every segment was fetched before the last run stopped
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        if self.file_obj.get('md5Checksum') and self.md5 != self.file_obj['md5Checksum']:
+            os.remove(self.temp_path)
+            raise DownloadCorrupted("MD5 of %s is %s instead of %s"
+                                    % (self.description, self.md5, self.file_obj['md5Checksum']))
+        return True
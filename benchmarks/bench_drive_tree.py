@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Micro-benchmark for GoogleDriveTree.
+#
+# Builds a synthetic folder tree and times inserts, id lookups, path
+# lookups and deletes. The "before" numbers come from LegacyDriveTree
+# which reproduces the old recursive FindFolderInParent search. That
+# one is quadratic, so it is run on a smaller tree by default.
+#
+# Usage: python benchmarks/bench_drive_tree.py [--folders N] [--legacy-folders N]
+
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.setrecursionlimit(100000)
+
+from GoSync.GoSyncDriveTree import GoogleDriveTree, DriveFolder
+
+
+class LegacyDriveFolder(DriveFolder):
+    def GetPath(self):
+        cpath = ''
+        if self.parent is not None:
+            cpath = self.parent.GetPath()
+
+        if self.parent is None:
+            return os.path.join(cpath, '')
+        return os.path.join(cpath, self.GetName())
+
+
+class LegacyDriveTree(object):
+    def __init__(self):
+        self.root_node = LegacyDriveFolder(None, 'root', 'Google Drive Root', None)
+
+    def FindFolderInParent(self, parent, id):
+        for f in parent.GetChildren():
+            if f.GetId() == id:
+                return f
+
+            ret = self.FindFolderInParent(f, id)
+            if ret:
+                return ret
+
+        return None
+
+    def FindFolder(self, id):
+        if id == 'root':
+            return self.root_node
+        return self.FindFolderInParent(self.root_node, id)
+
+    def FindFolderByPath(self, path):
+        stack = [self.root_node]
+        while stack:
+            node = stack.pop()
+            if node.GetPath() == path:
+                return node
+            stack.extend(node.GetChildren())
+        return None
+
+    def AddFolder(self, parent, folder_id, folder_name, data):
+        pnode = self.FindFolder(parent)
+
+        if self.FindFolder(folder_id):
+            return
+
+        cnode = LegacyDriveFolder(pnode, folder_id, folder_name, data)
+        pnode.AddChild(cnode)
+
+    def DeleteFolder(self, folder_id):
+        pnode = self.FindFolder(folder_id)
+        pnode.GetParent().DeleteChild(pnode)
+
+
+def MakeLayout(count, fanout, seed):
+    """Returns a list of (parent_id, folder_id, name) in insertion order."""
+    rnd = random.Random(seed)
+    layout = []
+    ids = ['root']
+    for i in range(count):
+        # Mostly wide, with the occasional deep chain like real drives
+        if rnd.random() < 0.1:
+            parent = ids[-1]
+        else:
+            parent = ids[rnd.randrange(max(1, len(ids) // fanout), len(ids))] \
+                if len(ids) > fanout else rnd.choice(ids)
+        fid = 'f%08d' % i
+        layout.append((parent, fid, 'folder-%d' % i))
+        ids.append(fid)
+    return layout
+
+
+def Timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def RunBenchmark(name, tree, layout, samples, seed):
+    rnd = random.Random(seed)
+
+    def insert():
+        for parent, fid, fname in layout:
+            tree.AddFolder(parent, fid, fname, None)
+
+    t_insert = Timed(insert)
+
+    lookup_ids = [layout[rnd.randrange(len(layout))][1] for i in range(samples)]
+    t_lookup = Timed(lambda: [tree.FindFolder(i) for i in lookup_ids])
+
+    lookup_paths = [tree.FindFolder(i).GetPath() for i in lookup_ids]
+    t_path = Timed(lambda: [tree.FindFolderByPath(p) for p in lookup_paths])
+
+    t_getpath = Timed(lambda: [tree.FindFolder(i).GetPath() for i in lookup_ids])
+
+    # Delete leaves and inner folders alike, each id only once
+    delete_ids = list(dict.fromkeys(lookup_ids))
+    def delete():
+        for i in delete_ids:
+            if tree.FindFolder(i):
+                tree.DeleteFolder(i)
+
+    t_delete = Timed(delete)
+
+    n = len(layout)
+    print("%-8s folders=%-8d insert %8.3fs (%7.2fus/op)  lookup %7.2fus/op  "
+          "path lookup %7.2fus/op  GetPath %7.2fus/op  delete %8.2fus/op"
+          % (name, n, t_insert, t_insert / n * 1e6, t_lookup / samples * 1e6,
+             t_path / samples * 1e6, t_getpath / samples * 1e6,
+             t_delete / len(delete_ids) * 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GoogleDriveTree micro-benchmark")
+    parser.add_argument('--folders', type=int, default=100000)
+    parser.add_argument('--legacy-folders', type=int, default=5000,
+                        help="tree size for the old recursive implementation (0 to skip)")
+    parser.add_argument('--fanout', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.legacy_folders:
+        layout = MakeLayout(args.legacy_folders, args.fanout, args.seed)
+        RunBenchmark('before', LegacyDriveTree(), layout, min(args.samples, 200), args.seed)
+        layout = MakeLayout(args.legacy_folders, args.fanout, args.seed)
+        RunBenchmark('after', GoogleDriveTree(), layout, min(args.samples, 200), args.seed)
+
+    layout = MakeLayout(args.folders, args.fanout, args.seed)
+    RunBenchmark('after', GoogleDriveTree(), layout, args.samples, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Throughput and peak RSS of file hashing.
+#
+# "read-all" is the old HashOfFile (whole file read into memory),
+# "stream" is GoSyncUtils.Md5OfFile. Every measurement runs in its own
+# process so the peak RSS reported belongs to that run only.
+# "stream-xN" hashes N copies of the file on N threads at once.
+#
+# Usage: python benchmarks/bench_hash.py [--sizes 1,64,512] [--threads 4] [--dir /tmp]
+
+import os, sys, time, hashlib, argparse, resource, subprocess, tempfile, threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from GoSync.GoSyncUtils import Md5OfFile
+
+MB = 1024 * 1024
+
+
+def ReadAll(path):
+    data = open(path, "rb").read()
+    return hashlib.md5(data).hexdigest()
+
+
+def RunChild(method, paths):
+    start = time.perf_counter()
+    if method == 'read-all':
+        ReadAll(paths[0])
+    elif method == 'stream':
+        Md5OfFile(paths[0])
+    else:
+        threads = [threading.Thread(target=Md5OfFile, args=(p,)) for p in paths]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KB on Linux
+    print("%f %d" % (elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def MakeFile(directory, size_mb):
+    fd, path = tempfile.mkstemp(prefix='gosync-hash-', dir=directory)
+    block = os.urandom(MB)
+    with os.fdopen(fd, 'wb') as f:
+        for i in range(size_mb):
+            f.write(block)
+    return path
+
+
+def Measure(method, paths):
+    out = subprocess.check_output([sys.executable, __file__, '--child', method] + paths)
+    elapsed, rss = out.split()
+    return float(elapsed), int(rss)
+
+
+def main():
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        RunChild(sys.argv[2], sys.argv[3:])
+        return
+
+    parser = argparse.ArgumentParser(description="Hashing throughput and memory benchmark")
+    parser.add_argument('--sizes', default='1,64,512', help="file sizes in MB, comma separated")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--dir', default=None, help="where to create the test files")
+    args = parser.parse_args()
+
+    print("%-10s %8s %10s %10s %12s" % ("method", "size", "seconds", "MB/s", "peak RSS"))
+    for size_mb in [int(x) for x in args.sizes.split(',')]:
+        paths = [MakeFile(args.dir, size_mb) for i in range(max(1, args.threads))]
+        try:
+            runs = [('read-all', paths[:1]), ('stream', paths[:1])]
+            if args.threads > 1:
+                runs.append(('stream-x%d' % args.threads, paths))
+            for method, files in runs:
+                elapsed, rss = Measure(method if not method.startswith('stream-x') else 'threads', files)
+                total_mb = size_mb * len(files)
+                print("%-10s %6dMB %10.3f %10.1f %10dMB" % (method, size_mb, elapsed,
+                                                            total_mb / elapsed, rss // 1024))
+        finally:
+            for p in paths:
+                os.remove(p)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Local pass over a synthetic mirror: the os.walk GoSync used to do,
+# which asks the drive about every file it finds ("remote checks"),
+# against LocalSnapshot, which only hands out what changed since the
+# last sync.
+#
+# Creating a million files takes a while, pass --dir to keep the tree
+# around and reuse it on the next run.
+#
+# Usage: python benchmarks/bench_local_scan.py [--files 1000000] [--changes 100] [--dir DIR]
+
+import os, sys, time, random, shutil, argparse, tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from GoSync.GoSyncLocalSnapshot import LocalSnapshot
+
+
+def MakeTree(root, files, per_folder, fanout):
+    """files files, per_folder in each folder, folders fanout wide."""
+    marker = os.path.join(root, '.complete-%d-%d-%d' % (files, per_folder, fanout))
+    if os.path.exists(marker):
+        return
+    folders = ['']
+    n = 0
+    while n < files:
+        path = folders[-1]
+        for j in range(min(per_folder, files - n)):
+            with open(os.path.join(root, path, 'file%d.txt' % n), 'w') as f:
+                f.write('x' * (n % 64))
+            n += 1
+        # Folder i goes below folder (i - 1) // fanout
+        i = len(folders)
+        path = os.path.join(folders[(i - 1) // fanout], 'folder%d' % i)
+        os.mkdir(os.path.join(root, path))
+        folders.append(path)
+    open(marker, 'w').close()
+
+
+def Legacy(root):
+    checks = 0
+    for dirpath, dirs, files in os.walk(root):
+        for name in files + dirs:
+            os.path.join(dirpath, name).split(root + '/')[1]
+            checks += 1
+    return checks
+
+
+def Timed(name, func):
+    start = time.perf_counter()
+    result = func()
+    print("%-24s %8.3fs" % (name, time.perf_counter() - start))
+    return result
+
+
+def Touch(root, count, seed):
+    rnd = random.Random(seed)
+    touched = []
+    for dirpath, dirs, files in os.walk(root):
+        touched.extend(os.path.join(dirpath, f) for f in files if f.startswith('file'))
+    for path in rnd.sample(touched, min(count, len(touched))):
+        with open(path, 'a') as f:
+            f.write('changed')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local snapshot diff benchmark")
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--per-folder', type=int, default=100)
+    parser.add_argument('--fanout', type=int, default=10)
+    parser.add_argument('--changes', type=int, default=100)
+    parser.add_argument('--dir', help="Where to build the tree, kept afterwards")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    base = args.dir or tempfile.mkdtemp(prefix='gosync-bench-')
+    root = os.path.join(base, 'Google Drive')
+    db_file = os.path.join(base, 'local-bench.db')
+    try:
+        if not os.path.exists(root):
+            os.makedirs(root)
+        Timed('create tree', lambda: MakeTree(root, args.files, args.per_folder, args.fanout))
+        if os.path.exists(db_file):
+            os.remove(db_file)
+
+        checks = Timed('legacy os.walk', lambda: Legacy(root))
+        print("    %d remote checks" % checks)
+
+        snapshot = LocalSnapshot(db_file, lambda name: name.startswith('.complete-'))
+        diff = Timed('snapshot first diff', lambda: snapshot.Diff(root))
+        Timed('snapshot commit', lambda: snapshot.Commit(diff))
+        print("    %d scanned, %d remote checks" % (diff.scanned, len(diff.added)))
+
+        diff = Timed('snapshot no changes', lambda: snapshot.Diff(root))
+        print("    %d scanned, %d remote checks" % (diff.scanned, len(diff.added) + len(diff.changed)))
+
+        Touch(root, args.changes, args.seed)
+        diff = Timed('snapshot %d changes' % args.changes, lambda: snapshot.Diff(root))
+        Timed('snapshot commit', lambda: snapshot.Commit(diff))
+        print("    %d scanned, %d remote checks" % (diff.scanned, len(diff.added) + len(diff.changed)))
+        snapshot.Close()
+    finally:
+        if not args.dir:
+            shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Usage category of files().list() entries: the substring scans over
+# mime type lists GoSync used to do ("legacy") against MimeClassifier.
+#
+# Usage: python benchmarks/bench_mime_classify.py [--entries 1000000]
+
+import os, sys, time, random, argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from GoSync.GoSyncMimeClassifier import MimeClassifier
+
+# The lists as they were in GoSyncModel
+audio_file_mimelist = ['audio/mpeg', 'audio/x-mpeg-3', 'audio/mpeg3', 'audio/aiff', 'audio/x-aiff', 'audio/m4a', 'audio/mp4', 'audio/flac', 'audio/mp3']
+movie_file_mimelist = ['video/mp4', 'video/x-msvideo', 'video/mpeg', 'video/flv', 'video/quicktime']
+image_file_mimelist = ['image/png', 'image/jpeg', 'image/jpg', 'image/tiff']
+document_file_mimelist = ['application/powerpoint', 'applciation/mspowerpoint',
+                          'application/x-mspowerpoint', 'application/pdf',
+                          'application/x-dvi']
+google_docs_mimelist = ['application/vnd.google-apps.spreadsheet',
+                        'application/vnd.google-apps.sites',
+                        'application/vnd.google-apps.script',
+                        'application/vnd.google-apps.presentation',
+                        'application/vnd.google-apps.fusiontable',
+                        'application/vnd.google-apps.form',
+                        'application/vnd.google-apps.drawing',
+                        'application/vnd.google-apps.document',
+                        'application/vnd.google-apps.map']
+
+MIME_TYPES = [('audio/mpeg', 'mp3'), ('audio/ogg', 'ogg'), ('image/jpeg', 'jpg'),
+              ('image/heic', 'heic'), ('video/mp4', 'mp4'), ('video/x-matroska', 'mkv'),
+              ('application/pdf', 'pdf'), ('text/plain', 'txt'), ('application/zip', 'zip'),
+              ('application/octet-stream', 'flac'), ('application/octet-stream', 'bin'),
+              ('application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'docx'),
+              ('application/vnd.google-apps.document', None),
+              ('application/vnd.google-apps.spreadsheet', None)]
+
+
+def LegacyClassify(f):
+    if any(f['mimeType'] in s for s in google_docs_mimelist):
+        return None
+    if any(f['mimeType'] in s for s in audio_file_mimelist):
+        return 'Audio'
+    elif any(f['mimeType'] in s for s in image_file_mimelist):
+        return 'Photo'
+    elif any(f['mimeType'] in s for s in movie_file_mimelist):
+        return 'Movies'
+    elif any(f['mimeType'] in s for s in document_file_mimelist):
+        return 'Document'
+    return 'Others'
+
+
+def MakeEntries(count, seed):
+    rnd = random.Random(seed)
+    entries = []
+    for i in range(count):
+        mime, ext = rnd.choice(MIME_TYPES)
+        entries.append({'id': 'file%08d' % i, 'mimeType': mime,
+                        'name': 'file%d.%s' % (i, ext) if ext else 'doc%d' % i,
+                        'size': str(rnd.randint(1, 1 << 24))})
+    return entries
+
+
+def Run(name, entries, classify):
+    usage = {}
+    counts = {}
+    start = time.perf_counter()
+    for f in entries:
+        category = classify(f)
+        if category is not None:
+            usage[category] = usage.get(category, 0) + int(f['size'])
+            counts[category] = counts.get(category, 0) + 1
+    elapsed = time.perf_counter() - start
+    print("%-10s %8.3fs  %6.0f ns/entry" % (name, elapsed, elapsed * 1e9 / len(entries)))
+    for category in sorted(counts):
+        print("    %-10s %9d files %16d bytes" % (category, counts[category], usage[category]))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mime type classification benchmark")
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    entries = MakeEntries(args.entries, args.seed)
+    Run('legacy', entries, LegacyClassify)
+    Run('classifier', entries, MimeClassifier().Classify)
+
+
+if __name__ == "__main__":
+    main()
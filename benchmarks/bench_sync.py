@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Full sync cycles of GoSyncModel against the fake drive server, no
+# Google account needed. The phases are what the sync thread does:
+#
+#   usage scan        ScanDriveUsage over the whole drive
+#   initial sync      SyncRemote + SyncLocalDirectory into an empty mirror
+#   incremental sync  the same after --remote-changes edits on the drive
+#                     and --local-changes edits in the mirror
+#
+# For each phase the wall time, the API calls per endpoint, the bytes
+# moved and the peak RSS of the process so far are printed. The fake
+# drive lives in the same process, its share of the RSS is printed
+# once it is built.
+#
+# Usage: python benchmarks/bench_sync.py [--files 1000] [--latency 0.01] [--error-rate 0.01]
+
+import os, sys, time, random, shutil, argparse, tempfile, resource, threading
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from googleapiclient.http import build_http
+from fake_drive import MakeSyntheticDrive
+from fake_drive_server import FakeDriveServer
+
+
+def PeakRss():
+    # Kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def MakeModel(server, home):
+    """A GoSyncModel talking to server, with its config and mirror under home."""
+    os.environ['HOME'] = home
+    os.makedirs(os.path.join(home, '.gosync'))
+    # Only has to exist, the fake drive doesn't check credentials
+    open(os.path.join(home, '.gosync', 'credentials.json'), 'w').close()
+
+    from GoSync.GoSyncModel import GoSyncModel
+    from GoSync.GoSyncService import DriveService
+    thread_data = threading.local()
+
+    class BenchSyncModel(GoSyncModel):
+        def DoAuthenticate(self):
+            self.creds = None
+            self.drive = DriveService(server.BuildService())
+            self.is_logged_in = True
+            return self.drive
+
+        def GetThreadHttp(self):
+            http = getattr(thread_data, 'http', None)
+            if http is None:
+                http = build_http()
+                thread_data.http = http
+            return http
+
+    return BenchSyncModel()
+
+
+def MakeLocalChanges(mirror, count, seed):
+    rnd = random.Random(seed)
+    files = []
+    for dirpath, dirs, names in os.walk(mirror):
+        files.extend(os.path.join(dirpath, n) for n in names)
+    dirs = sorted(set(os.path.dirname(f) for f in files)) or [mirror]
+    edited = 0
+    for i in range(count):
+        if files and i % 2:
+            with open(files.pop(rnd.randrange(len(files))), 'ab') as f:
+                f.write(b'local edit %d' % i)
+            edited += 1
+        else:
+            with open(os.path.join(rnd.choice(dirs), 'local%d.bin' % i), 'wb') as f:
+                f.write(os.urandom(rnd.randint(1, 64 * 1024)))
+    return {'edited': edited, 'added': count - edited}
+
+
+def Phase(name, drive, func):
+    drive.ResetRequestCount()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    stats = drive.GetStats()
+    print("%-18s %9.3fs  %7d calls  %10d bytes in  %10d bytes out  %5d errors  peak RSS %6.1f MB"
+          % (name, elapsed, sum(stats['requests'].values()), stats['bytes_in'],
+             stats['bytes_out'], stats['errors'], PeakRss() / 1048576.0))
+    for method_id in sorted(stats['requests']):
+        print("    %-34s %7d" % (method_id, stats['requests'][method_id]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End to end sync benchmark against a fake drive")
+    parser.add_argument('--files', type=int, default=1000, help="files on the drive")
+    parser.add_argument('--files-per-folder', type=int, default=10)
+    parser.add_argument('--fanout', type=int, default=8)
+    parser.add_argument('--deep-ratio', type=float, default=0.2)
+    parser.add_argument('--max-size', type=int, default=16 * 1024, help="largest file, in bytes")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests failing")
+    parser.add_argument('--rate', type=float, default=1000, help="requests per second GoSync may make")
+    parser.add_argument('--remote-changes', type=int, default=50)
+    parser.add_argument('--local-changes', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help="keep the mirror and config afterwards")
+    args = parser.parse_args()
+
+    folders = max(1, args.files // args.files_per_folder - 1)
+    drive = MakeSyntheticDrive(folders, args.files_per_folder, args.fanout, args.deep_ratio,
+                               args.latency, args.seed, args.max_size, content=True,
+                               error_rate=args.error_rate)
+    print("Fake drive: %d folders, %d files, peak RSS %.1f MB"
+          % (folders, len(drive.order) - folders, PeakRss() / 1048576.0))
+
+    server = FakeDriveServer(drive).Start()
+    home = tempfile.mkdtemp(prefix='gosync-bench-')
+    model = None
+    try:
+        model = MakeModel(server, home)
+        model.executor.SetRate(args.rate)
+        from GoSync.GoSyncWorkers import UploadQueue, DriveBatcher
+        model.upload_queue = UploadQueue(model, model.upload_workers)
+        model.batcher = DriveBatcher(model)
+        model.syncRunning.set()
+
+        def UsageScan():
+            model.tree_store.SetComplete(False)
+            model.ScanDriveUsage()
+            model.tree_store.SetComplete(True)
+
+        def Sync():
+            model.validate_sync_settings()
+            model.batcher.Flush()
+            model.SyncRemote()
+            model.SyncLocalDirectory()
+
+        Phase('usage scan', drive, UsageScan)
+        Phase('initial sync', drive, Sync)
+
+        print("Remote changes: %s" % drive.MakeRemoteChanges(args.remote_changes, args.seed))
+        print("Local changes: %s" % MakeLocalChanges(model.mirror_directory, args.local_changes, args.seed))
+        Phase('incremental sync', drive, Sync)
+        Phase('idle sync', drive, Sync)
+    finally:
+        if model is not None:
+            model.shutting_down = True
+            if model.upload_queue:
+                model.upload_queue.Close()
+            if model.batcher:
+                model.batcher.Close()
+        server.Stop()
+        if args.keep:
+            print("Kept %s" % home)
+        else:
+            shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Drive usage scan: one list query per folder ("recursive", what
+# calculateUsage always did) against paging through the whole drive
+# once ("bulk"). Runs against the in-process fake drive, --latency
+# adds a delay to every request to stand in for the network.
+#
+# Usage: python benchmarks/bench_usage_scan.py [--folders 2000] [--files 10] [--latency 0.02]
+
+import os, sys, time, argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from GoSync.GoSyncUsageScan import DriveUsageScanner
+from fake_drive import MakeSyntheticDrive, ROOT_ID
+
+
+def Classify(f):
+    if f['mimeType'].startswith('application/vnd.google-apps.'):
+        return None
+    return f['mimeType'].split('/')[0]
+
+
+def Run(name, drive, scan):
+    drive.ResetRequestCount()
+    start = time.perf_counter()
+    result = scan()
+    elapsed = time.perf_counter() - start
+    print("%-10s requests %7d  files %8d  folders %7d  %8.3fs"
+          % (name, drive.GetRequestCount(), result.file_count, len(result.folders), elapsed))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive usage scan benchmark")
+    parser.add_argument('--folders', type=int, default=2000)
+    parser.add_argument('--files', type=int, default=10, help="files per folder")
+    parser.add_argument('--fanout', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per request")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    drive = MakeSyntheticDrive(args.folders, args.files, args.fanout, latency=args.latency,
+                               seed=args.seed)
+    scanner = DriveUsageScanner(drive, lambda request: request.execute(), Classify)
+
+    before = Run('recursive', drive, scanner.ScanRecursive)
+    after = Run('bulk', drive, lambda: scanner.ScanBulk(ROOT_ID))
+
+    if before.usage != after.usage or before.file_count != after.file_count:
+        print("Usage differs between the two scans!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
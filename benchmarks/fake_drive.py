@@ -0,0 +1,381 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# In-process stand-in for the parts of the Drive v3 service the
+# benchmarks need. Requests are built the same way as with the real
+# googleapiclient service and only do something on execute(), which
+# also counts the request and optionally sleeps to simulate latency.
+# fake_drive_server.py serves the same drive over HTTP, for running
+# GoSync itself against it.
+
+import re, time, json, random, hashlib, threading
+import httplib2
+from googleapiclient.errors import HttpError
+
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+ROOT_ID = '0AFakeRootFolder'
+
+PARENT_QUERY = re.compile(r"^'([^']+)' in parents and trashed=false$")
+
+
+class FakeDriveError(Exception):
+    """An error the drive answers with, status as in the HTTP response."""
+    def __init__(self, status, reason, message=''):
+        Exception.__init__(self, message or reason)
+        self.status = status
+        self.reason = reason
+
+    def ToJson(self):
+        return {'error': {'code': self.status, 'message': str(self),
+                          'errors': [{'reason': self.reason, 'message': str(self)}]}}
+
+
+def SyntheticContent(file_id, size):
+    """Content of a generated file, the same every time for the same id."""
+    block = hashlib.sha256(file_id.encode('utf-8')).digest() * 128
+    return (block * (size // len(block) + 1))[:size]
+
+
+def DriveTime(t=None):
+    t = time.time() if t is None else t
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(t)) + '.%03dZ' % (int(t * 1000) % 1000)
+
+
+class FakeRequest(object):
+    def __init__(self, drive, method_id, func):
+        self.drive = drive
+        self.methodId = method_id
+        self.func = func
+        self.http = None
+        self.headers = {}
+
+    def execute(self, http=None, num_retries=0):
+        self.drive.CountRequest(self.methodId)
+        try:
+            self.drive.InjectError()
+            return self.func()
+        except FakeDriveError as e:
+            raise HttpError(httplib2.Response({'status': e.status}),
+                            json.dumps(e.ToJson()).encode('utf-8'))
+
+
+class FakeFiles(object):
+    def __init__(self, drive):
+        self.drive = drive
+
+    def list(self, q=None, spaces='drive', fields=None, pageToken=None, pageSize=100, **kwargs):
+        return FakeRequest(self.drive, 'drive.files.list',
+                           lambda: self.drive.List(q, pageToken, pageSize))
+
+    def get(self, fileId, fields=None, **kwargs):
+        return FakeRequest(self.drive, 'drive.files.get', lambda: self.drive.Get(fileId))
+
+
+class FakeDrive(object):
+    """
+    A drive with files kept in memory, shaped like files().list()
+    results. Files added with content=True get SyntheticContent and a
+    matching md5, the others a random md5 and no content. Every change
+    is recorded for changes().list(). error_rate is the share of
+    requests failing with a 500, 503 or rate limit error.
+    """
+    def __init__(self, latency=0.0, error_rate=0.0, seed=1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rnd = random.Random(seed)
+        self.lock = threading.Lock()
+        self.objects = {ROOT_ID: {'id': ROOT_ID, 'name': 'My Drive', 'mimeType': FOLDER_MIME_TYPE}}
+        self.children = {}
+        self.order = []
+        self.content = {}
+        self.changes = []
+        self.next_id = 0
+        self.requests = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.errors = 0
+
+    def CountRequest(self, method_id, latency=True):
+        with self.lock:
+            self.requests[method_id] = self.requests.get(method_id, 0) + 1
+        if self.latency and latency:
+            time.sleep(self.latency)
+
+    def CountBytes(self, received=0, sent=0):
+        with self.lock:
+            self.bytes_in += received
+            self.bytes_out += sent
+
+    def InjectError(self):
+        """Raises FakeDriveError for error_rate of the calls."""
+        if not self.error_rate:
+            return
+        with self.lock:
+            if self.rnd.random() >= self.error_rate:
+                return
+            self.errors += 1
+            status, reason = self.rnd.choice([(500, 'backendError'), (503, 'backendError'),
+                                              (403, 'userRateLimitExceeded')])
+        raise FakeDriveError(status, reason, "Injected error")
+
+    def GetRequestCount(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+    def GetStats(self):
+        with self.lock:
+            return {'requests': dict(self.requests), 'bytes_in': self.bytes_in,
+                    'bytes_out': self.bytes_out, 'errors': self.errors}
+
+    def ResetRequestCount(self):
+        with self.lock:
+            self.requests = {}
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.errors = 0
+
+    def __ResolveId(self, file_id):
+        return ROOT_ID if file_id == 'root' else file_id
+
+    def __Lookup(self, file_id):
+        f = self.objects.get(self.__ResolveId(file_id))
+        if f is None:
+            raise FakeDriveError(404, 'notFound', "File not found: %s" % file_id)
+        return f
+
+    def __RecordChange(self, f, removed=False):
+        # Called with self.lock held
+        change = {'kind': 'drive#change', 'changeType': 'file', 'fileId': f['id'],
+                  'removed': removed, 'time': DriveTime()}
+        if not removed:
+            change['file'] = dict(f)
+        self.changes.append(change)
+
+    def __SetContent(self, f, data):
+        self.content[f['id']] = data
+        f['size'] = str(len(data))
+        f['md5Checksum'] = hashlib.md5(data).hexdigest()
+
+    def AddFile(self, parent_id, file_id, name, mime_type, size=None, md5=None, content=False):
+        parent_id = self.__ResolveId(parent_id)
+        f = {'id': file_id, 'name': name, 'mimeType': mime_type, 'parents': [parent_id],
+             'trashed': False, 'modifiedTime': '2020-01-01T00:00:00.000Z'}
+        if size is not None:
+            if content:
+                self.__SetContent(f, SyntheticContent(file_id, size))
+            else:
+                f['size'] = str(size)
+                f['md5Checksum'] = md5 or ('%032x' % random.getrandbits(128))
+        with self.lock:
+            self.objects[file_id] = f
+            self.children.setdefault(parent_id, []).append(f)
+            self.order.append(f)
+        return f
+
+    def List(self, q, page_token, page_size):
+        m = PARENT_QUERY.match(q or '')
+        with self.lock:
+            if m:
+                candidates = self.children.get(self.__ResolveId(m.group(1)), [])
+            elif q == 'trashed=false':
+                candidates = self.order
+            else:
+                raise ValueError("Query not supported by the fake drive: %s" % q)
+
+            start = int(page_token or 0)
+            page_size = min(page_size or 100, 1000)
+            page = [dict(f) for f in candidates[start:start + page_size]]
+            response = {'files': page}
+            if start + page_size < len(candidates):
+                response['nextPageToken'] = str(start + page_size)
+            return response
+
+    def Get(self, file_id):
+        with self.lock:
+            return dict(self.__Lookup(file_id))
+
+    def GetMedia(self, file_id):
+        with self.lock:
+            f = self.__Lookup(file_id)
+            if f['id'] in self.content:
+                return self.content[f['id']]
+            if 'size' not in f:
+                raise FakeDriveError(403, 'fileNotDownloadable', "Only files with binary content can be downloaded")
+            return SyntheticContent(f['id'], int(f['size']))
+
+    def Create(self, body, data=None):
+        with self.lock:
+            self.next_id += 1
+            file_id = 'created%08d' % self.next_id
+            parents = [self.__ResolveId(p) for p in body.get('parents') or ['root']]
+            f = {'id': file_id, 'name': body.get('name', 'Untitled'),
+                 'mimeType': body.get('mimeType', 'application/octet-stream'),
+                 'parents': parents, 'trashed': False, 'modifiedTime': DriveTime()}
+            if data is not None:
+                self.__SetContent(f, data)
+            self.objects[file_id] = f
+            for parent in parents:
+                self.children.setdefault(parent, []).append(f)
+            self.order.append(f)
+            self.__RecordChange(f)
+            return dict(f)
+
+    def Update(self, file_id, body=None, add_parents=None, remove_parents=None, data=None):
+        with self.lock:
+            f = self.__Lookup(file_id)
+            body = body or {}
+            if 'name' in body:
+                f['name'] = body['name']
+            for parent in (remove_parents.split(',') if remove_parents else []):
+                parent = self.__ResolveId(parent)
+                if parent in f['parents']:
+                    f['parents'].remove(parent)
+                    self.children[parent].remove(f)
+            for parent in (add_parents.split(',') if add_parents else []):
+                parent = self.__ResolveId(parent)
+                if parent not in f['parents']:
+                    f['parents'].append(parent)
+                    self.children.setdefault(parent, []).append(f)
+            if 'trashed' in body and body['trashed'] != f['trashed']:
+                f['trashed'] = body['trashed']
+                for parent in f['parents']:
+                    if f['trashed']:
+                        self.children[parent].remove(f)
+                    else:
+                        self.children.setdefault(parent, []).append(f)
+                if f['trashed']:
+                    self.order.remove(f)
+                else:
+                    self.order.append(f)
+            if data is not None:
+                self.__SetContent(f, data)
+            f['modifiedTime'] = body.get('modifiedTime', DriveTime())
+            self.__RecordChange(f)
+            return dict(f)
+
+    def Delete(self, file_id):
+        with self.lock:
+            f = self.__Lookup(file_id)
+            del self.objects[f['id']]
+            self.content.pop(f['id'], None)
+            if not f['trashed']:
+                for parent in f['parents']:
+                    self.children[parent].remove(f)
+                self.order.remove(f)
+            self.__RecordChange(f, removed=True)
+
+    def About(self):
+        with self.lock:
+            usage = sum(int(f.get('size', 0)) for f in self.order)
+        return {'user': {'kind': 'drive#user', 'displayName': 'GoSync Benchmark',
+                         'emailAddress': 'benchmark@example.com'},
+                'storageQuota': {'limit': str(15 * 1024 ** 3), 'usage': str(usage),
+                                 'usageInDrive': str(usage), 'usageInDriveTrash': '0'}}
+
+    def GetStartPageToken(self):
+        with self.lock:
+            return {'kind': 'drive#startPageToken', 'startPageToken': str(len(self.changes) + 1)}
+
+    def ListChanges(self, page_token, page_size=100):
+        with self.lock:
+            try:
+                start = int(page_token) - 1
+            except (TypeError, ValueError):
+                raise FakeDriveError(400, 'invalid', "Invalid page token: %s" % page_token)
+            if start < 0 or start > len(self.changes):
+                raise FakeDriveError(400, 'invalid', "Invalid page token: %s" % page_token)
+            page_size = min(page_size or 100, 1000)
+            page = self.changes[start:start + page_size]
+            response = {'kind': 'drive#changeList', 'changes': [dict(c) for c in page]}
+            if start + page_size < len(self.changes):
+                response['nextPageToken'] = str(start + page_size + 1)
+            else:
+                response['newStartPageToken'] = str(len(self.changes) + 1)
+            return response
+
+    def MakeRemoteChanges(self, count, seed=1):
+        """
+        Edits, adds, renames and trashes count random files, the way
+        another client would. Returns how many of each were done.
+        """
+        rnd = random.Random(seed)
+        with self.lock:
+            files = [f for f in self.order if f['mimeType'] != FOLDER_MIME_TYPE and 'size' in f]
+            folders = [f for f in self.order if f['mimeType'] == FOLDER_MIME_TYPE] or [self.objects[ROOT_ID]]
+        done = {'edited': 0, 'added': 0, 'renamed': 0, 'trashed': 0}
+        for i in range(count):
+            action = rnd.choice(list(done))
+            if action == 'added' or not files:
+                size = rnd.randint(1, 64 * 1024)
+                self.Create({'name': 'remote%d.bin' % i, 'parents': [rnd.choice(folders)['id']]},
+                            SyntheticContent('remote%d-%d' % (seed, i), size))
+                done['added'] += 1
+                continue
+            f = files.pop(rnd.randrange(len(files)))
+            if action == 'edited':
+                self.Update(f['id'], data=SyntheticContent(f['id'] + '-edit', int(f['size']) + 1))
+            elif action == 'renamed':
+                self.Update(f['id'], {'name': 'renamed-' + f['name']})
+            else:
+                self.Update(f['id'], {'trashed': True})
+            done[action] += 1
+        return done
+
+    def files(self):
+        return FakeFiles(self)
+
+
+def MakeSyntheticDrive(folders=2000, files_per_folder=10, fanout=8, deep_ratio=0.2,
+                       latency=0.0, seed=1, max_size=10 * 1024 * 1024, content=False,
+                       error_rate=0.0):
+    """
+    A tree mixing wide folders (up to fanout subfolders) with deep
+    chains: a deep_ratio fraction of folders is put right below the
+    previous folder. With content=True files can be downloaded, keep
+    max_size small then.
+    """
+    rnd = random.Random(seed)
+    drive = FakeDrive(latency, error_rate, seed)
+    mimes = [('audio/mpeg', 'mp3'), ('image/jpeg', 'jpg'), ('video/mp4', 'mp4'),
+             ('application/pdf', 'pdf'), ('text/plain', 'txt'),
+             ('application/vnd.google-apps.document', None)]
+
+    ids = ['root']
+    counts = {'root': 0}
+    for i in range(folders):
+        if rnd.random() < deep_ratio:
+            parent = ids[-1]
+        else:
+            parent = rnd.choice(ids)
+            while counts[parent] >= fanout:
+                parent = rnd.choice(ids)
+        fid = 'folder%07d' % i
+        drive.AddFile(parent, fid, 'Folder %d' % i, FOLDER_MIME_TYPE)
+        counts[parent] += 1
+        counts[fid] = 0
+        ids.append(fid)
+
+    n = 0
+    for fid in ids:
+        for j in range(files_per_folder):
+            mime, ext = rnd.choice(mimes)
+            name = 'file%d.%s' % (n, ext) if ext else 'doc%d' % n
+            drive.AddFile(fid, 'file%08d' % n, name, mime,
+                          size=rnd.randint(1, max_size) if ext else None, content=content)
+            n += 1
+    return drive
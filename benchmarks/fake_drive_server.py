@@ -0,0 +1,299 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+# Serves a FakeDrive on localhost with the Drive v3 REST interface, so
+# that GoSync runs against it through googleapiclient unchanged:
+# files list/get/create/update/delete, media downloads with ranges,
+# resumable and multipart uploads, about, changes and batches.
+#
+# BuildService() returns a service for the server, built from the
+# discovery document shipped with googleapiclient.
+
+import re, json, uuid, threading
+import email.parser
+from googleapiclient import discovery_cache
+from googleapiclient.http import build_http
+from googleapiclient.discovery import build_from_document
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit, parse_qsl
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qsl
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+from fake_drive import FakeDriveError
+
+CONTENT_RANGE = re.compile(r'^bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)$')
+RANGE = re.compile(r'^bytes=(\d+)-(\d*)$')
+
+STATUS_TEXT = {200: 'OK', 204: 'No Content', 206: 'Partial Content', 308: 'Resume Incomplete',
+               400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 500: 'Internal Server Error',
+               503: 'Service Unavailable'}
+
+
+def JsonResponse(status, obj, headers=None):
+    return status, dict(headers or {}, **{'Content-Type': 'application/json; charset=UTF-8'}), \
+        json.dumps(obj).encode('utf-8')
+
+
+class UploadSession(object):
+    def __init__(self, file_id, body, total):
+        self.file_id = file_id
+        self.body = body
+        self.total = total
+        self.data = bytearray()
+
+
+class FakeDriveServer(object):
+    def __init__(self, drive, host='127.0.0.1', port=0):
+        self.drive = drive
+        self.host = host
+        self.port = port
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.httpd = None
+        self.thread = None
+
+    def Start(self):
+        server = self
+
+        class Handler(FakeDriveHandler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def Stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def GetUrl(self):
+        return 'http://%s:%d/' % (self.host, self.port)
+
+    def GetDiscoveryDocument(self):
+        doc = json.loads(discovery_cache.get_static_doc('drive', 'v3'))
+        doc['rootUrl'] = self.GetUrl()
+        doc['mtlsRootUrl'] = self.GetUrl()
+        return doc
+
+    def BuildService(self, http=None):
+        return build_from_document(self.GetDiscoveryDocument(), http=http or build_http())
+
+    ## Requests
+
+    def Dispatch(self, method, path, query, headers, body, nested=False):
+        """Handles one request, returns (status, headers, body)."""
+        try:
+            return self.__Route(method, path, query, headers, body, nested)
+        except FakeDriveError as e:
+            return JsonResponse(e.status, e.ToJson())
+
+    def __Count(self, method_id, nested):
+        self.drive.CountRequest(method_id, latency=not nested)
+        if method_id != 'batch':
+            self.drive.InjectError()
+
+    def __Route(self, method, path, query, headers, body, nested):
+        m = re.match(r'^/drive/v3/files(?:/([^/]+))?$', path)
+        if m:
+            file_id = m.group(1)
+            if file_id is None and method == 'GET':
+                self.__Count('drive.files.list', nested)
+                return JsonResponse(200, self.drive.List(query.get('q'), query.get('pageToken'),
+                                                         int(query.get('pageSize', 100))))
+            if file_id is None and method == 'POST':
+                self.__Count('drive.files.create', nested)
+                return JsonResponse(200, self.drive.Create(json.loads(body or b'{}')))
+            if method == 'GET' and query.get('alt') == 'media':
+                self.__Count('drive.files.get_media', nested)
+                return self.__Media(file_id, headers)
+            if method == 'GET':
+                self.__Count('drive.files.get', nested)
+                return JsonResponse(200, self.drive.Get(file_id))
+            if method == 'PATCH':
+                self.__Count('drive.files.update', nested)
+                return JsonResponse(200, self.drive.Update(file_id, json.loads(body or b'{}'),
+                                                           query.get('addParents'),
+                                                           query.get('removeParents')))
+            if method == 'DELETE':
+                self.__Count('drive.files.delete', nested)
+                self.drive.Delete(file_id)
+                return 204, {}, b''
+
+        m = re.match(r'^/upload/drive/v3/files(?:/([^/]+))?$', path)
+        if m and method in ('POST', 'PATCH'):
+            self.__Count('drive.files.update' if m.group(1) else 'drive.files.create', nested)
+            return self.__StartUpload(m.group(1), query, headers, body)
+
+        m = re.match(r'^/upload/session/([^/]+)$', path)
+        if m and method == 'PUT':
+            self.__Count('upload.chunk', nested)
+            return self.__UploadChunk(m.group(1), headers, body)
+
+        if path == '/drive/v3/about' and method == 'GET':
+            self.__Count('drive.about.get', nested)
+            return JsonResponse(200, self.drive.About())
+        if path == '/drive/v3/changes/startPageToken' and method == 'GET':
+            self.__Count('drive.changes.getStartPageToken', nested)
+            return JsonResponse(200, self.drive.GetStartPageToken())
+        if path == '/drive/v3/changes' and method == 'GET':
+            self.__Count('drive.changes.list', nested)
+            return JsonResponse(200, self.drive.ListChanges(query.get('pageToken'),
+                                                            int(query.get('pageSize', 100))))
+        if path == '/batch/drive/v3' and method == 'POST' and not nested:
+            self.__Count('batch', nested)
+            return self.__Batch(headers, body)
+
+        raise FakeDriveError(404, 'notFound', "%s %s is not supported by the fake drive" % (method, path))
+
+    def __Media(self, file_id, headers):
+        data = self.drive.GetMedia(file_id)
+        m = RANGE.match(headers.get('range', ''))
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)) if m.group(2) else len(data) - 1, len(data) - 1)
+            chunk = data[start:end + 1]
+            self.drive.CountBytes(sent=len(chunk))
+            return 206, {'Content-Type': 'application/octet-stream',
+                         'Content-Range': 'bytes %d-%d/%d' % (start, end, len(data))}, chunk
+        self.drive.CountBytes(sent=len(data))
+        return 200, {'Content-Type': 'application/octet-stream'}, data
+
+    def __StartUpload(self, file_id, query, headers, body):
+        upload_type = query.get('uploadType')
+        if upload_type == 'resumable':
+            metadata = json.loads(body) if body else {}
+            total = headers.get('x-upload-content-length')
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.sessions[session_id] = UploadSession(file_id, metadata,
+                                                          int(total) if total else None)
+            return 200, {'Location': '%supload/session/%s' % (self.GetUrl(), session_id)}, b''
+
+        if upload_type == 'multipart':
+            msg = email.parser.BytesParser().parsebytes(
+                b'Content-Type: ' + headers.get('content-type', '').encode('utf-8') + b'\r\n\r\n' + body)
+            parts = msg.get_payload()
+            metadata = json.loads(parts[0].get_payload(decode=True) or b'{}')
+            data = parts[1].get_payload(decode=True)
+        elif upload_type == 'media':
+            metadata, data = {}, body
+        else:
+            raise FakeDriveError(400, 'invalid', "Unknown upload type %s" % upload_type)
+
+        self.drive.CountBytes(received=len(data))
+        return JsonResponse(200, self.__FinishUpload(file_id, metadata, data, query))
+
+    def __FinishUpload(self, file_id, metadata, data, query=None):
+        query = query or {}
+        if file_id:
+            return self.drive.Update(file_id, metadata, query.get('addParents'),
+                                     query.get('removeParents'), data=bytes(data))
+        return self.drive.Create(metadata, bytes(data))
+
+    def __UploadChunk(self, session_id, headers, body):
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            raise FakeDriveError(404, 'notFound', "Upload session not found")
+
+        m = CONTENT_RANGE.match(headers.get('content-range', ''))
+        if not m:
+            raise FakeDriveError(400, 'invalid', "Bad Content-Range")
+        if m.group(3) != '*':
+            session.total = int(m.group(3))
+
+        if m.group(1) is not None and int(m.group(1)) == len(session.data):
+            session.data.extend(body)
+            self.drive.CountBytes(received=len(body))
+
+        if session.total is not None and len(session.data) >= session.total:
+            with self.lock:
+                self.sessions.pop(session_id, None)
+            return JsonResponse(200, self.__FinishUpload(session.file_id, session.body, session.data))
+
+        range_headers = {}
+        if session.data:
+            range_headers['Range'] = 'bytes=0-%d' % (len(session.data) - 1)
+        return 308, range_headers, b''
+
+    def __Batch(self, headers, body):
+        msg = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + headers.get('content-type', '').encode('utf-8') + b'\r\n\r\n' + body)
+        boundary = uuid.uuid4().hex
+        out = []
+        for part in msg.get_payload():
+            content_id = part.get('Content-ID', '')
+            request = part.get_payload(decode=True) or part.get_payload().encode('utf-8')
+            head, _, sub_body = request.replace(b'\r\n', b'\n').partition(b'\n\n')
+            lines = head.decode('utf-8').split('\n')
+            method, target = lines[0].split(' ')[:2]
+            sub_headers = dict((k.strip().lower(), v.strip()) for k, _, v in
+                               (line.partition(':') for line in lines[1:] if line))
+            url = urlsplit(target)
+            status, resp_headers, resp_body = self.Dispatch(method, url.path, dict(parse_qsl(url.query)),
+                                                            sub_headers, sub_body, nested=True)
+            resp_head = ['HTTP/1.1 %d %s' % (status, STATUS_TEXT.get(status, ''))]
+            resp_head += ['%s: %s' % kv for kv in resp_headers.items()]
+            resp_head.append('Content-Length: %d' % len(resp_body))
+            out.append(('--%s\r\nContent-Type: application/http\r\n'
+                        'Content-ID: <response-%s>\r\n\r\n%s\r\n\r\n'
+                        % (boundary, content_id.strip('<>'), '\r\n'.join(resp_head))).encode('utf-8')
+                       + resp_body + b'\r\n')
+        out.append(('--%s--\r\n' % boundary).encode('utf-8'))
+        return 200, {'Content-Type': 'multipart/mixed; boundary=%s' % boundary}, b''.join(out)
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in one write, otherwise Nagle and
+    # delayed ACKs add 40ms to every request
+    wbufsize = 64 * 1024
+    fake = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def __Handle(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        headers = dict((k.lower(), v) for k, v in self.headers.items())
+        status, resp_headers, resp_body = self.fake.Dispatch(self.command, url.path,
+                                                             dict(parse_qsl(url.query)),
+                                                             headers, body)
+        self.send_response(status, STATUS_TEXT.get(status))
+        for k, v in resp_headers.items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(resp_body)))
+        self.end_headers()
+        self.wfile.write(resp_body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = __Handle
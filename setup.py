@@ -38,6 +38,7 @@ setup(
     entry_points={
         'console_scripts':[
             'GoSync=GoSync.GoSync:main',
+            'gosync-daemon=GoSync.GoSyncDaemon:main',
         ],
     },
 )
@@ -0,0 +1,58 @@
+# gosync is an open source Google Drive(TM) sync application for Linux
+#
+# Copyright (C) 2015 Himanshu Chauhan
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import os, sys, shutil, tempfile, unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from GoSync.GoSyncMetadataCache import DriveMetadataCache
+
+FOLDER = 'application/vnd.google-apps.folder'
+
+
+class MetadataCacheSubtreeTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = DriveMetadataCache(os.path.join(self.dir, 'metadata.db'))
+        # Sibling folders whose names only differ by case
+        self.cache.Store('Foo', {'id': 'A', 'name': 'Foo', 'mimeType': FOLDER})
+        self.cache.Store('Foo/a.txt', {'id': 'Y', 'name': 'a.txt', 'mimeType': 'text/plain'}, 'A')
+        self.cache.Store('foo', {'id': 'B', 'name': 'foo', 'mimeType': FOLDER})
+        self.cache.Store('foo/x.txt', {'id': 'X', 'name': 'x.txt', 'mimeType': 'text/plain'}, 'B')
+
+    def tearDown(self):
+        self.cache.Close()
+        shutil.rmtree(self.dir)
+
+    def testMovePathIsCaseSensitive(self):
+        self.cache.MovePath('Foo', 'Bar')
+        self.assertEqual(self.cache.GetPathById('A'), 'Bar')
+        self.assertEqual(self.cache.GetPathById('Y'), 'Bar/a.txt')
+        self.assertIsNone(self.cache.GetByPath('Bar/x.txt'))
+        self.assertEqual(self.cache.GetByPath('foo/x.txt')['id'], 'X')
+
+    def testInvalidatePathIsCaseSensitive(self):
+        self.cache.InvalidatePath('Foo')
+        self.assertIsNone(self.cache.GetById('A'))
+        self.assertIsNone(self.cache.GetById('Y'))
+        self.assertEqual(self.cache.GetPathById('B'), 'foo')
+        self.assertEqual(self.cache.GetPathById('X'), 'foo/x.txt')
+
+
+if __name__ == '__main__':
+    unittest.main()